@@ -13,7 +13,6 @@ import config_manager
 from nowpayments import NowPayments
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Create Blueprint for API routes
@@ -1,39 +1,36 @@
 import os
+import re
+import hmac
 import logging
 import threading
 from datetime import datetime, timedelta
-from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, abort, session
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, abort, session, send_file
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.middleware.proxy_fix import ProxyFix
-from sqlalchemy.orm import DeclarativeBase
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+import logging_config
 logger = logging.getLogger(__name__)
 
-# Initialize database
-class Base(DeclarativeBase):
-    pass
+import metrics
+import tracing
+import profiler
+import bot_supervisor
+import bot_cluster
 
-db = SQLAlchemy(model_class=Base)
+# Initialize database
+import database
+from database import db
 
-# Create the app
+# Create the app. Importing this module only builds the Flask object and
+# registers routes; start-up work that touches the database or the bot lives
+# in create_app() so that tools importing the models stay cheap.
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key_for_development")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
 
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///telegram_premium.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-
-# Initialize the database with the app
-db.init_app(app)
+# Configure the database (engine options are shared with the bot, see database.py)
+database.init_app(app)
 
 # Initialize login manager
 login_manager = LoginManager()
@@ -45,26 +42,48 @@ from models import User, Order, PaymentTransaction, AdminUser, BroadcastMessage
 
 # Import API clients
 import config_manager
-from nowpayments import NowPayments
+from nowpayments import verify_ipn_signature, has_required_ipn_fields
+from payment_events import process_payment_event
+from dedupe import UpdateIdWindow
 
 @login_manager.user_loader
 def load_user(user_id):
     return db.session.get(AdminUser, int(user_id))
 
-# Create the database tables
-with app.app_context():
-    db.create_all()
-    
-    # Create a default admin user if none exists
-    if not AdminUser.query.filter_by(username="admin").first():
-        admin = AdminUser(
-            username="admin",
-            password_hash=generate_password_hash("admin"),  # Change this in production
-            is_super_admin=True
-        )
-        db.session.add(admin)
-        db.session.commit()
-        logger.info("Default admin user created")
+_initialized = False
+_init_lock = threading.Lock()
+
+def create_app():
+    """
+    Finish start-up of the web app and return it; later calls return the same app.
+    
+    Sets up logging, checks that the database was migrated (see migrate.py)
+    and imports the bot module in the background when a bot token is
+    configured, so the first webhook request doesn't pay for it.
+    """
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return app
+        
+        # Every gunicorn worker runs this, so each writes and rotates its own web-<pid>.log
+        logging_config.setup_logging('web', per_process=True)
+        # Profiling requests from the admin panel reach every worker through the config file
+        profiler.watch_config_requests('web', session_name=f'web-{os.getpid()}')
+        with app.app_context():
+            database.instrument_engine(db.engine)
+        database.check_schema()
+        if config_manager.get_config_value("bot_token") or os.environ.get("TELEGRAM_BOT_TOKEN"):
+            threading.Thread(target=_warm_up_bot, name="bot-warmup", daemon=True).start()
+        _initialized = True
+    return app
+
+def _warm_up_bot():
+    try:
+        import run_telegram_bot  # noqa: F401
+    except BaseException as e:
+        # run_telegram_bot exits when no token is usable; the webhook route reports it per request
+        logger.warning("Bot module not preloaded: %r", e)
 
 # Register API Blueprint
 from api import api_bp
@@ -76,13 +95,6 @@ def api_docs():
     """Public API documentation page"""
     return render_template('api_docs.html')
 
-# Import routes after db is defined
-from nowpayments import NowPayments
-import config_manager
-
-# Initialize NowPayments API client
-nowpayments_api = NowPayments(os.environ.get("NOWPAYMENTS_API_KEY", ""))
-
 # Routes
 @app.route('/')
 def index():
@@ -251,41 +263,13 @@ def admin_update_plan():
 
 @app.route('/webhook/payment/callback', methods=['POST'])
 def payment_webhook():
-    logger.debug(f"Received payment webhook: {request.json}")
-    
-    if not request.json:
-        return jsonify({"status": "error", "message": "No data provided"}), 400
-    
-    # Process the payment notification
-    payment_data = request.json
-    
-    # Find the related payment transaction
-    payment_id = payment_data.get('payment_id')
-    if not payment_id:
-        return jsonify({"status": "error", "message": "No payment_id provided"}), 400
-        
-    transaction = PaymentTransaction.query.filter_by(payment_id=payment_id).first()
-    if not transaction:
-        return jsonify({"status": "error", "message": "Payment not found"}), 404
-    
-    # Update transaction status
-    transaction.status = payment_data.get('payment_status', 'UNKNOWN')
-    transaction.ipn_data = payment_data
-    transaction.updated_at = datetime.utcnow()
-    
-    if transaction.status == 'COMPLETED':
-        transaction.completed_at = datetime.utcnow()
-        
-        # Update the related order
-        order = Order.query.get(transaction.order_id)
-        if order:
-            order.status = 'PAYMENT_RECEIVED'
-            order.updated_at = datetime.utcnow()
-    
-    db.session.commit()
-    logger.info(f"Updated payment transaction {payment_id} to status {transaction.status}")
-    
-    return jsonify({"status": "success"})
+    """Legacy payment callback URL; handled by the same pipeline as the IPN endpoint"""
+    # This URL used to accept unsigned posts. Those now get a 401 like on the IPN endpoint,
+    # so log them to let whoever still posts here move to signed IPNs at /webhook/nowpayments/ipn
+    if not request.headers.get('x-nowpayments-sig'):
+        app.logger.warning("Unsigned request to the deprecated /webhook/payment/callback rejected; "
+                           "send signed IPNs to /webhook/nowpayments/ipn instead")
+    return nowpayments_ipn_webhook()
 
 # Admin routes for new admin panel sections
 @app.route('/admin/admins')
@@ -604,33 +588,66 @@ def admin_confirm_supplier_complete(order_id):
 
 
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for this worker; only served when METRICS_TOKEN is set, and only with it"""
+    token = os.environ.get('METRICS_TOKEN')
+    if not token:
+        # This is the public web port; order, IPN and pool counters aren't exposed without a token
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    return metrics.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
+@app.route('/admin/db_pool')
+@login_required
+def admin_db_pool():
+    """Connection pool usage for this worker"""
+    return jsonify(database.pool_stats())
+
 @app.route('/admin/bot_settings')
 @login_required
 def admin_bot_settings():
     # Get current bot token and other settings
     bot_token = config_manager.get_config_value('bot_token', '')
     nowpayments_api_key = config_manager.get_config_value('nowpayments_api_key', '')
+    nowpayments_ipn_secret = config_manager.get_config_value('nowpayments_ipn_secret', '')
     bot_enabled = config_manager.get_config_value('bot_enabled', False)
+    webhook_reply = config_manager.get_config_value('webhook_reply', False)
     has_sufficient_credit = config_manager.get_config_value('has_sufficient_credit', False)
     
     return render_template('admin/bot_settings.html', 
                            bot_token=bot_token, 
                            nowpayments_api_key=nowpayments_api_key,
+                           nowpayments_ipn_secret=nowpayments_ipn_secret,
                            bot_enabled=bot_enabled,
-                           has_sufficient_credit=has_sufficient_credit)
+                           webhook_reply=webhook_reply,
+                           has_sufficient_credit=has_sufficient_credit,
+                           log_levels=logging_config.get_log_levels(),
+                           log_sampling=config_manager.get_config_value('log_sampling', {}),
+                           controlled_loggers=logging_config.CONTROLLED_LOGGERS,
+                           level_choices=logging_config.LOG_LEVELS,
+                           profiler_status=profiler.status(),
+                           profiler_request=profiler.active_request(),
+                           profiles=profiler.list_profiles(),
+                           bot_status=_bot_status())
 
 @app.route('/admin/bot_settings/update', methods=['POST'])
 @login_required
 def admin_update_bot_settings():
     bot_token = request.form.get('bot_token', '')
     nowpayments_api_key = request.form.get('nowpayments_api_key', '')
+    nowpayments_ipn_secret = request.form.get('nowpayments_ipn_secret', '')
     bot_enabled = 'bot_enabled' in request.form
+    webhook_reply = 'webhook_reply' in request.form
     has_sufficient_credit = 'has_sufficient_credit' in request.form
     
     # Save settings to config
     config_manager.set_config_value('bot_token', bot_token)
     config_manager.set_config_value('nowpayments_api_key', nowpayments_api_key)
+    config_manager.set_ipn_secret(nowpayments_ipn_secret)
     config_manager.set_config_value('bot_enabled', bot_enabled)
+    config_manager.set_config_value('webhook_reply', webhook_reply)
     config_manager.set_config_value('has_sufficient_credit', has_sufficient_credit)
     
     # Log the supplier credit status change
@@ -642,42 +659,107 @@ def admin_update_bot_settings():
     flash('Bot settings have been updated', 'success')
     return redirect(url_for('admin_bot_settings'))
 
+@app.route('/admin/bot_settings/logging', methods=['POST'])
+@login_required
+def admin_update_logging_settings():
+    """Save per-logger levels and sampling rates; other processes pick them up on their next config check"""
+    log_levels = {}
+    log_sampling = {}
+    for name in logging_config.CONTROLLED_LOGGERS:
+        level = request.form.get(f'level_{name}', '').upper()
+        if level in logging_config.LOG_LEVELS:
+            log_levels[name] = level
+        
+        rate = request.form.get(f'sampling_{name}', '').strip()
+        if rate:
+            try:
+                log_sampling[name] = min(max(float(rate), 0.0), 1.0)
+            except ValueError:
+                flash(f'Invalid sampling rate for {name}', 'danger')
+                return redirect(url_for('admin_bot_settings'))
+    
+    config_manager.set_config_value('log_levels', log_levels)
+    config_manager.set_config_value('log_sampling', log_sampling)
+    logging_config.apply_config_settings()
+    
+    flash('Logging settings have been updated', 'success')
+    return redirect(url_for('admin_bot_settings'))
+
+@app.route('/admin/profiler/start', methods=['POST'])
+@login_required
+def admin_start_profiler():
+    """Ask every web worker, or the bot process, to profile itself"""
+    target = request.form.get('target', 'web')
+    try:
+        duration = int(request.form.get('duration', 30))
+        interval_ms = int(request.form.get('interval_ms', profiler.DEFAULT_INTERVAL_MS))
+    except ValueError:
+        flash('Invalid profiling duration or interval', 'danger')
+        return redirect(url_for('admin_bot_settings'))
+    
+    target = 'bot' if target == 'bot' else 'web'
+    profiler.request_remote(target, duration, interval_ms)
+    if target == 'web':
+        # This worker starts right away; the others on their next config check
+        profiler.handle_config_request('web', f'web-{os.getpid()}')
+        flash('Profiling requested; each web worker starts within 30 seconds and saves its own profile', 'info')
+    else:
+        flash('Profiling requested; the bot process starts it on its next config check (up to 30 seconds)', 'info')
+    return redirect(url_for('admin_bot_settings'))
+
+@app.route('/admin/profiler/stop', methods=['POST'])
+@login_required
+def admin_stop_profiler():
+    """Ask the processes profiling for the target to stop; partial profiles are still saved"""
+    target = 'bot' if request.form.get('target') == 'bot' else 'web'
+    profiler.request_remote_stop(target)
+    if target == 'web':
+        profiler.handle_config_request('web', f'web-{os.getpid()}')
+    flash('Stop requested; each process saves its partial profile within 30 seconds', 'info')
+    return redirect(url_for('admin_bot_settings'))
+
+@app.route('/admin/profiler/profiles/<name>')
+@login_required
+def admin_download_profile(name):
+    path = profiler.profile_path(name)
+    if not path:
+        abort(404)
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=name)
+
+def _bot_status():
+    # Cluster replicas run in their own containers, out of reach of this process's supervisor files
+    if bot_cluster.enabled():
+        return bot_cluster.status(database.get_engine())
+    return bot_supervisor.status()
+
+def _refuse_in_cluster_mode():
+    """Redirect with a warning when the bot runs as BOT_CLUSTER replicas, which this panel can't control"""
+    if not bot_cluster.enabled():
+        return None
+    # A bot started here would poll alongside the leader and both would get 409 Conflict, as would the
+    # leader once a webhook is set
+    flash('The bot runs as polling cluster replicas (BOT_CLUSTER=1); start, stop and restart them with docker compose.', 'warning')
+    return redirect(url_for('admin_bot_settings'))
+
 @app.route('/admin/bot_settings/start', methods=['POST'])
 @login_required
 def admin_start_bot():
-    # Logic to start the bot
+    # Start the bot under bot_supervisor.py, which restarts it if it crashes or stalls
+    refused = _refuse_in_cluster_mode()
+    if refused:
+        return refused
     try:
-        # Import the required function
-        import subprocess
-        import sys
-        
-        # Set bot as enabled in config
-        config_manager.set_config_value('bot_enabled', True)
-        app.logger.info("Bot enabled in config")
-        
-        # Start the bot in a separate process
-        # In this implementation, we're starting it in the background
         bot_token = config_manager.get_config_value('bot_token')
         if not bot_token:
             flash('Bot token is required to start the bot', 'danger')
             return redirect(url_for('admin_bot_settings'))
         
-        # Check if we're in a subprocess already to avoid nested subprocesses
-        is_subprocess = os.environ.get('BOT_SUBPROCESS') == '1'
-        if not is_subprocess:
-            app.logger.info("Starting bot in a separate process")
-            env = os.environ.copy()
-            env['BOT_SUBPROCESS'] = '1'
-            
-            # Run the bot script as a separate process
-            subprocess.Popen([sys.executable, 'start_bot.py'], 
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE,
-                            env=env)
-            
+        config_manager.set_config_value('bot_enabled', True)
+        pid = bot_supervisor.start()
+        if pid:
+            app.logger.info("Bot supervisor started (pid %s)", pid)
             flash('Bot has been started in background', 'success')
         else:
-            app.logger.warning("Already in a subprocess, not starting another one")
             flash('Bot process already running', 'warning')
     except Exception as e:
         app.logger.error(f"Error starting bot: {str(e)}")
@@ -689,17 +771,17 @@ def admin_start_bot():
 @app.route('/admin/bot_settings/stop', methods=['POST'])
 @login_required
 def admin_stop_bot():
-    # Logic to stop the bot
+    # The supervisor lets in-flight updates finish, then stops the bot
+    refused = _refuse_in_cluster_mode()
+    if refused:
+        return refused
     try:
-        # Set bot as disabled in config
         config_manager.set_config_value('bot_enabled', False)
-        app.logger.info("Bot disabled in config")
-        
-        # In a real production environment, you would need a proper process management
-        # solution (like supervisord) to control the bot process
-        # For now, we'll just rely on the bot checking the enabled flag in config
-        
-        flash('Bot has been disabled. The process will terminate on its next check cycle.', 'success')
+        if bot_supervisor.stop():
+            app.logger.info("Bot supervisor asked to stop")
+            flash('Bot is stopping after finishing the updates in progress.', 'success')
+        else:
+            flash('Bot is not running.', 'warning')
     except Exception as e:
         app.logger.error(f"Error stopping bot: {str(e)}")
         app.logger.exception(e)
@@ -707,10 +789,37 @@ def admin_stop_bot():
     
     return redirect(url_for('admin_bot_settings'))
 
+@app.route('/admin/bot_settings/restart', methods=['POST'])
+@login_required
+def admin_restart_bot():
+    refused = _refuse_in_cluster_mode()
+    if refused:
+        return refused
+    try:
+        if bot_supervisor.restart():
+            app.logger.info("Bot restart requested")
+            flash('Bot is restarting.', 'success')
+        else:
+            flash('Bot is not running.', 'warning')
+    except Exception as e:
+        app.logger.error(f"Error restarting bot: {str(e)}")
+        flash(f'Failed to restart bot: {str(e)}', 'danger')
+    
+    return redirect(url_for('admin_bot_settings'))
+
+@app.route('/admin/bot_settings/status')
+@login_required
+def admin_bot_status():
+    """Supervisor state and the bot's last heartbeat, or the update queue in cluster mode"""
+    return jsonify(_bot_status())
+
 @app.route('/admin/bot_settings/set_webhook', methods=['POST'])
 @login_required
 def admin_set_webhook():
     # Logic to set webhook for the bot
+    refused = _refuse_in_cluster_mode()
+    if refused:
+        return refused
     try:
         bot_token = config_manager.get_config_value('bot_token', '')
         if not bot_token:
@@ -721,8 +830,14 @@ def admin_set_webhook():
         
         # This is a placeholder. In a real app, you'd make an API call to Telegram
         # For example: https://api.telegram.org/bot<token>/setWebhook?url=<webhook_url>
+        # Telegram sends the secret token back in a header with every update,
+        # and only delivers the update types the bot has handlers for
+        import json
         import requests
-        response = requests.get(f'https://api.telegram.org/bot{bot_token}/setWebhook?url={webhook_url}')
+        from run_telegram_bot import bot
+        response = requests.get(f'https://api.telegram.org/bot{bot_token}/setWebhook',
+                                params={'url': webhook_url, 'secret_token': config_manager.ensure_webhook_secret(),
+                                        'allowed_updates': json.dumps(bot.allowed_updates())})
         
         if response.status_code == 200 and response.json().get('ok'):
             flash('Webhook has been set successfully', 'success')
@@ -733,12 +848,40 @@ def admin_set_webhook():
     
     return redirect(url_for('admin_bot_settings'))
 
+# Telegram sends update_id first; reading it from the head of the body lets duplicates skip JSON parsing
+_UPDATE_ID = re.compile(rb'^\s*\{\s*"update_id"\s*:\s*(\d+)')
+
+# Update ids this worker has already accepted, to drop Telegram's redeliveries
+seen_update_ids = UpdateIdWindow(size=4096)
+
 @app.route('/webhook/telestars24bot', methods=['POST'])
 def telegram_webhook():
     """Endpoint for Telegram webhook, to be used with setWebhook"""
+    # Reject anything without the secret token given to setWebhook before reading the body.
+    # The secret may have been generated by another process since we read the config
+    config_manager.reload_if_changed()
+    webhook_secret = config_manager.get_webhook_secret()
+    if not webhook_secret:
+        # Every setWebhook here sends a secret, so without one this request can't be checked
+        metrics.TELEGRAM_WEBHOOK_DROPPED.labels("no_secret").inc()
+        app.logger.error("Rejected Telegram webhook request: no webhook secret is configured; set the webhook again")
+        return jsonify({"status": "error", "message": "Webhook secret not configured"}), 401
+    if not hmac.compare_digest(
+        request.headers.get('X-Telegram-Bot-Api-Secret-Token', '').encode(), webhook_secret.encode()
+    ):
+        metrics.TELEGRAM_WEBHOOK_DROPPED.labels("bad_secret").inc()
+        app.logger.warning("Rejected Telegram webhook request with a missing or wrong secret token")
+        return jsonify({"status": "error", "message": "Invalid secret token"}), 401
+    
+    match = _UPDATE_ID.match(request.get_data()[:64])
+    if match and seen_update_ids.check_and_add(int(match.group(1))):
+        metrics.TELEGRAM_WEBHOOK_DROPPED.labels("duplicate").inc()
+        app.logger.info("Dropped redelivered Telegram update %s", match.group(1).decode())
+        return jsonify({"status": "duplicate"})
+    
     try:
         # Import telegram bot logic
-        from run_telegram_bot import process_webhook_update
+        from run_telegram_bot import handle_webhook_update
         
         # Get the update data from Telegram
         update_json = request.get_json()
@@ -746,11 +889,19 @@ def telegram_webhook():
             app.logger.error("Empty update received in webhook")
             return jsonify({"status": "error", "message": "Empty update"})
         
+        # Bodies that don't start with update_id are checked after parsing
+        if not match and isinstance(update_json.get("update_id"), int) and seen_update_ids.check_and_add(update_json["update_id"]):
+            metrics.TELEGRAM_WEBHOOK_DROPPED.labels("duplicate").inc()
+            app.logger.info("Dropped redelivered Telegram update %s", update_json["update_id"])
+            return jsonify({"status": "duplicate"})
+        
         # Log webhook request for debugging
-        app.logger.debug(f"Received Telegram update: {update_json}")
+        app.logger.debug("Received Telegram update %s", update_json.get("update_id"))
         
-        # Process the update
-        result = process_webhook_update(update_json)
+        # Process the update; in webhook-reply mode the last reply goes back in the response (earlier ones are sent first)
+        result, reply = handle_webhook_update(update_json)
+        if reply is not None:
+            return jsonify(reply)
         if result:
             return jsonify({"status": "success"})
         else:
@@ -763,88 +914,75 @@ def telegram_webhook():
 @app.route('/webhook/nowpayments/ipn', methods=['POST'])
 def nowpayments_ipn_webhook():
     """Endpoint for NowPayments IPN (Instant Payment Notification)"""
+    with metrics.IPN_LATENCY.time(), tracing.start_trace(
+        "nowpayments_ipn", trace_id=tracing.trace_id_from_headers(request.headers)
+    ):
+        response, status_code = _handle_nowpayments_ipn()
+    metrics.IPN_REQUESTS.labels(status_code).inc()
+    return response, status_code
+
+def _handle_nowpayments_ipn():
     try:
+        # Reject unsigned requests before reading the body or touching the database
+        signature = request.headers.get('x-nowpayments-sig')
+        if not signature:
+            app.logger.warning("Rejected payment IPN without signature")
+            return jsonify({"status": "error", "message": "Missing IPN signature"}), 401
+            
         # Verify that the request contains JSON data
         if not request.is_json:
             app.logger.error("Invalid payment webhook: Not JSON data")
             return jsonify({"status": "error", "message": "Invalid content type, expected JSON"}), 400
         
-        # Get webhook data
-        ipn_data = request.get_json()
-        app.logger.info(f"Received payment IPN: {ipn_data}")
-        
-        # Verify IPN authenticity
-        api_key = config_manager.get_config_value('nowpayments_api_key', '')
-        if not api_key:
-            app.logger.error("Cannot process IPN: NowPayments API key not set")
-            return jsonify({"status": "error", "message": "API key not configured"}), 500
+        ipn_secret = config_manager.get_ipn_secret()
+        if not ipn_secret:
+            app.logger.error("Cannot process IPN: NowPayments IPN secret not set")
+            return jsonify({"status": "error", "message": "IPN secret not configured"}), 500
             
-        # Initialize the API client
-        from nowpayments import NowPayments
-        nowpayments_api = NowPayments(api_key=api_key)
-        
-        # Verify the IPN signature
-        is_valid = nowpayments_api.verify_ipn_callback(ipn_data)
-        if not is_valid:
+        # Verify the IPN signature against the raw request bytes
+        raw_body = request.get_data(cache=True)
+        if not verify_ipn_signature(raw_body, signature, ipn_secret):
             app.logger.error("Invalid IPN signature")
-            return jsonify({"status": "error", "message": "Invalid IPN signature"}), 400
+            return jsonify({"status": "error", "message": "Invalid IPN signature"}), 401
             
+        # Get webhook data
+        ipn_data = request.get_json(silent=True)
+        if not isinstance(ipn_data, dict) or not has_required_ipn_fields(ipn_data):
+            app.logger.error("Invalid payment IPN payload")
+            return jsonify({"status": "error", "message": "Invalid IPN payload"}), 400
+        app.logger.debug("Received payment IPN for payment %s", ipn_data.get("payment_id"))
+        
         # Process the payment update
         payment_id = ipn_data.get('payment_id')
         payment_status = ipn_data.get('payment_status')
         
         if not payment_id or not payment_status:
-            app.logger.error(f"Missing payment information in IPN: {ipn_data}")
+            app.logger.error("Missing payment information in IPN: %s", ipn_data)
             return jsonify({"status": "error", "message": "Missing payment information"}), 400
             
-        app.logger.info(f"Processing payment update: Payment ID {payment_id}, Status: {payment_status}")
+        result = process_payment_event(
+            db.session,
+            payment_id,
+            payment_status,
+            ipn_data,
+            gateway_updated_at=ipn_data.get('updated_at', '')
+        )
         
-        # Find the payment transaction
-        with db.session() as session:
-            transaction = session.query(PaymentTransaction).filter_by(payment_id=payment_id).first()
-            
-            if not transaction:
-                app.logger.error(f"Payment transaction not found: {payment_id}")
-                return jsonify({"status": "error", "message": "Payment transaction not found"}), 404
-                
-            # Update transaction status and data
-            transaction.status = payment_status
-            transaction.ipn_data = ipn_data
-            
-            if payment_status in ["FINISHED", "CONFIRMED"]:
-                transaction.completed_at = datetime.utcnow()
-                
-                # Update the corresponding order
-                order = session.query(Order).get(transaction.order_id)
-                if order:
-                    previous_status = order.status
-                    order.status = "PAYMENT_RECEIVED"
-                    order.updated_at = datetime.utcnow()
-                    
-                    # Save changes
-                    session.commit()
-                    
-                    app.logger.info(f"Payment confirmed for order #{order.order_id}: Status changed from {previous_status} to PAYMENT_RECEIVED")
-                    
-                    # Optionally notify admins about the payment
-                    try:
-                        from run_telegram_bot import notify_admins_about_payment
-                        notify_admins_about_payment(order, transaction)
-                    except Exception as notify_error:
-                        app.logger.error(f"Error notifying admins: {str(notify_error)}")
-                else:
-                    app.logger.error(f"Order not found for payment: {payment_id}")
-                    return jsonify({"status": "error", "message": "Order not found"}), 404
-            else:
-                # For other statuses, just update the transaction
-                session.commit()
-                app.logger.info(f"Payment status updated: {payment_id} to {payment_status}")
-            
-            return jsonify({"status": "success", "message": f"Payment updated: {payment_status}"})
+        if result.notify:
+            # Notify admins only when the order actually moved to PAYMENT_RECEIVED
+            try:
+                from run_telegram_bot import notify_admins_about_payment
+                notify_admins_about_payment(result.order, result.transaction)
+            except Exception as notify_error:
+                app.logger.error(f"Error notifying admins: {str(notify_error)}")
+        
+        status = "success" if result.http_status == 200 else "error"
+        return jsonify({"status": status, "message": result.message}), result.http_status
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"Error processing payment webhook: {str(e)}")
         app.logger.exception(e)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    create_app().run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Load test for the REST API and the NowPayments IPN endpoint under gunicorn.
+
+For each worker count the script starts gunicorn on main:app, with
+NowPayments and Telegram pointed at the local simulators through
+NOWPAYMENTS_API_URL and TELEGRAM_API_URL, then drives a closed-loop mix of
+
+    POST /api/premium/order
+    GET  /api/premium/orders
+    GET  /api/premium/order/<id>
+    POST /webhook/nowpayments/ipn   (signed, against seeded payments)
+
+at each concurrency level and prints throughput and latency percentiles, so
+the gunicorn --workers setting can be sized from measurements.
+
+The database is a throwaway SQLite file unless --database-url is given (use a
+disposable Postgres database: the script creates tables and seeds rows).
+The repository's config_data.json is never touched; gunicorn runs in a
+temporary directory with its own copy.
+
+Usage:
+    python benchmarks/api_load.py [--workers 1,2,4] [--concurrency 4,16,32]
+                                  [--duration 15] [--csv results.csv]
+"""
+
+import argparse
+import csv
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from simulators import Faults, NowPaymentsSimulator, TelegramSimulator
+
+API_KEY = "loadtest-api-key"
+IPN_SECRET = "loadtest-ipn-secret"
+IPN_STATUSES = ["waiting", "confirming", "confirmed", "sending", "finished"]
+
+# Relative weight of each endpoint in the request mix
+DEFAULT_MIX = "create_order=2,list_orders=3,get_order=4,ipn=3"
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def sign_ipn(payload):
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    signature = hmac.new(IPN_SECRET.encode("utf-8"), body, hashlib.sha512).hexdigest()
+    return body, signature
+
+def prepare_workdir(database_url, seed_payments):
+    """Create the temp working directory, its config file and the seeded database"""
+    workdir = tempfile.mkdtemp(prefix="api_load_")
+    with open(os.path.join(ROOT, "config_data.json"), encoding="utf-8") as f:
+        config = json.load(f)
+    config.update({
+        "nowpayments_api_key": "loadtest",
+        "nowpayments_ipn_secret": IPN_SECRET,
+        "has_sufficient_credit": True,
+        "bot_token": "123456:LOADTEST",
+        "bot_admins": [],
+        "admin_channel": "",
+        "public_channel": "",
+    })
+    with open(os.path.join(workdir, "config_data.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+
+    if not database_url:
+        database_url = f"sqlite:///{os.path.join(workdir, 'loadtest.db')}"
+
+    # Seed from a child process so this process never imports the app; the run
+    # prefix keeps ids unique when the same --database-url is reused
+    run_prefix = "L%s" % os.urandom(3).hex()
+    seed = subprocess.run(
+        [sys.executable, "-c", SEED_SCRIPT, str(seed_payments), run_prefix],
+        cwd=workdir,
+        env=dict(os.environ, DATABASE_URL=database_url, PYTHONPATH=ROOT, LOG_LEVEL="WARNING"),
+        capture_output=True,
+        text=True,
+    )
+    if seed.returncode != 0:
+        raise RuntimeError(f"Seeding failed:\n{seed.stderr}")
+    data = json.loads(seed.stdout.strip().splitlines()[-1])
+    return workdir, database_url, config["subscription_plans"][0]["id"], data["order_ids"], data["payment_ids"]
+
+SEED_SCRIPT = r"""
+import json, sys, uuid
+from datetime import datetime
+import migrate
+from app import app, db
+from models import AdminUser, User, Order, PaymentTransaction
+
+count, prefix = int(sys.argv[1]), sys.argv[2]
+migrate.upgrade()
+migrate.ensure_default_admin()
+with app.app_context():
+    admin = AdminUser.query.filter_by(username="admin").first()
+    admin.api_key_hash = "%s"
+    user = User(telegram_id=prefix + "_" + uuid.uuid4().hex[:8], username="@loadtest")
+    db.session.add(user)
+    db.session.flush()
+    order_ids, payment_ids = [], []
+    for i in range(count):
+        payment_id = "%%s-%%d" %% (prefix, i)
+        order = Order(order_id="%%s%%06d" %% (prefix, i), user_id=user.id, plan_id="bench", plan_name="Bench",
+                      amount=10, currency="USD", status="AWAITING_PAYMENT", telegram_username="@loadtest",
+                      payment_id=payment_id, created_at=datetime.utcnow())
+        db.session.add(order)
+        db.session.flush()
+        db.session.add(PaymentTransaction(payment_id=payment_id, order_id=order.id, amount=10,
+                                          currency="USD", pay_currency="TRX", status="WAITING"))
+        order_ids.append(order.order_id)
+        payment_ids.append(payment_id)
+    db.session.commit()
+print(json.dumps({"order_ids": order_ids, "payment_ids": payment_ids}))
+""" % API_KEY
+
+
+class Gunicorn:
+    def __init__(self, workdir, database_url, workers, worker_class, threads, telegram, nowpayments):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        env = dict(
+            os.environ,
+            DATABASE_URL=database_url,
+            PYTHONPATH=ROOT,
+            LOG_LEVEL="WARNING",
+            TELEGRAM_BOT_TOKEN="123456:LOADTEST",
+            NOWPAYMENTS_API_URL=nowpayments.api_url(),
+            TELEGRAM_API_URL=telegram.api_url(),
+        )
+        command = [
+            sys.executable, "-m", "gunicorn",
+            "--bind", f"127.0.0.1:{self.port}",
+            "--workers", str(workers),
+            "--worker-class", worker_class,
+            "--threads", str(threads),
+            "--log-level", "warning",
+            "main:app",
+        ]
+        self.log = open(os.path.join(workdir, f"gunicorn-{workers}.log"), "w")
+        self.process = subprocess.Popen(command, cwd=workdir, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with {self.process.returncode}; see {self.log.name}")
+            try:
+                requests.get(self.url + "/api/docs", timeout=1)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise RuntimeError("gunicorn did not become ready")
+
+    def stop(self):
+        self.process.send_signal(signal.SIGTERM)
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+class LoadGenerator:
+    """Closed-loop clients: each thread sends its next request as soon as the previous one returns"""
+
+    def __init__(self, base_url, plan_id, order_ids, payment_ids, mix):
+        self.base_url = base_url
+        self.plan_id = plan_id
+        self.order_ids = list(order_ids)
+        self.payment_ids = payment_ids
+        self.choices = [name for name, weight in mix for _ in range(weight)]
+        self._ipn_sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def _request(self, session, name):
+        headers = {"X-API-Key": API_KEY}
+        if name == "create_order":
+            response = session.post(self.base_url + "/api/premium/order", headers=headers,
+                                    json={"telegram_username": "@loadtest", "plan_id": self.plan_id})
+            if response.status_code == 201:
+                with self._lock:
+                    self.order_ids.append(response.json()["order_id"])
+            return response
+        if name == "list_orders":
+            page = random.randint(1, 5)
+            return session.get(self.base_url + f"/api/premium/orders?page={page}&per_page=20", headers=headers)
+        if name == "get_order":
+            order_id = random.choice(self.order_ids)
+            return session.get(self.base_url + f"/api/premium/order/{order_id}", headers=headers)
+
+        # Walk each seeded payment through its statuses; later deliveries hit the duplicate/unchanged paths
+        sequence = next(self._ipn_sequence)
+        payment_id = self.payment_ids[sequence % len(self.payment_ids)]
+        status = IPN_STATUSES[min(sequence // len(self.payment_ids), len(IPN_STATUSES) - 1)]
+        payload = {
+            "payment_id": payment_id,
+            "payment_status": status,
+            "pay_address": "TLoadTestAddress",
+            "price_amount": 10,
+            "price_currency": "usd",
+            "updated_at": sequence,
+        }
+        body, signature = sign_ipn(payload)
+        return session.post(self.base_url + "/webhook/nowpayments/ipn", data=body,
+                            headers={"Content-Type": "application/json", "x-nowpayments-sig": signature})
+
+    def run(self, concurrency, duration):
+        results = {name: [] for name in set(self.choices)}
+        errors = {name: 0 for name in results}
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def client():
+            session = requests.Session()
+            local = []
+            while time.monotonic() < deadline:
+                name = random.choice(self.choices)
+                started = time.perf_counter()
+                try:
+                    ok = self._request(session, name).status_code < 500
+                except requests.RequestException:
+                    ok = False
+                local.append((name, time.perf_counter() - started, ok))
+            with lock:
+                for name, elapsed, ok in local:
+                    results[name].append(elapsed)
+                    if not ok:
+                        errors[name] += 1
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors, time.perf_counter() - started
+
+
+def summarize(latencies, errors, wall):
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "rps": len(values) / wall if wall else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+    }
+
+def parse_mix(text):
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix.append((name.strip(), int(weight or 1)))
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="comma separated gunicorn worker counts")
+    parser.add_argument("--concurrency", default="4,16,32", help="comma separated client concurrency levels")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per measurement")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds of unmeasured load per worker count")
+    parser.add_argument("--worker-class", default="sync", help="gunicorn worker class (as in the Dockerfile: sync)")
+    parser.add_argument("--threads", type=int, default=1, help="gunicorn threads per worker")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"endpoint weights (default {DEFAULT_MIX})")
+    parser.add_argument("--database-url", help="database to use instead of a temporary SQLite file")
+    parser.add_argument("--seed-payments", type=int, default=2000, help="payments seeded for IPN traffic")
+    parser.add_argument("--nowpayments-latency-ms", type=float, default=150.0, help="delay added by the simulated NowPayments API")
+    parser.add_argument("--nowpayments-error-rate", type=float, default=0.0, help="fraction of NowPayments calls failing with 500")
+    parser.add_argument("--csv", help="also write the results to this CSV file")
+    args = parser.parse_args()
+
+    workers_list = [int(value) for value in args.workers.split(",")]
+    concurrency_list = [int(value) for value in args.concurrency.split(",")]
+    mix = parse_mix(args.mix)
+
+    telegram = TelegramSimulator().start()
+    nowpayments = NowPaymentsSimulator(Faults(args.nowpayments_latency_ms, error_rate=args.nowpayments_error_rate)).start()
+    rows = []
+
+    print(f"{'workers':>7} {'conc':>5} {'endpoint':<14} {'reqs':>7} {'err':>5} {'rps':>8} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8}")
+    for workers in workers_list:
+        # Fresh database per worker count so every run starts from the same state
+        workdir, database_url, plan_id, order_ids, payment_ids = prepare_workdir(args.database_url, args.seed_payments)
+        server = Gunicorn(workdir, database_url, workers, args.worker_class, args.threads, telegram, nowpayments)
+        try:
+            server.wait_ready()
+            generator = LoadGenerator(server.url, plan_id, order_ids, payment_ids, mix)
+            if args.warmup:
+                generator.run(max(concurrency_list), args.warmup)
+
+            for concurrency in concurrency_list:
+                results, errors, wall = generator.run(concurrency, args.duration)
+                everything = [value for values in results.values() for value in values]
+                breakdown = [("ALL", summarize(everything, sum(errors.values()), wall))]
+                breakdown += [(name, summarize(results[name], errors[name], wall)) for name, _ in mix]
+                for endpoint, stats in breakdown:
+                    print(
+                        f"{workers:>7} {concurrency:>5} {endpoint:<14} {stats['requests']:>7} {stats['errors']:>5} "
+                        f"{stats['rps']:>8.1f} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}"
+                    )
+                    rows.append(dict(workers=workers, concurrency=concurrency, endpoint=endpoint, **stats))
+        finally:
+            server.stop()
+            if not args.database_url:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    telegram.stop()
+    nowpayments.stop()
+
+    if args.csv and rows:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"\nResults written to {args.csv}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
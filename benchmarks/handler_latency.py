@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark for the bot's update handlers.
+
+Replays the purchase flow as synthetic Telegram updates through
+bot.process_new_updates, with the Telegram Bot API and NowPayments replaced by
+the local simulators (see simulators/). Every simulated user runs:
+
+    /start -> select_plan -> confirm_plan -> username step -> payment_confirmed
+
+and an admin then opens the order with review_order. Throughput and
+p50/p95/p99 latency are reported per step, so a change to run_telegram_bot.py
+can be compared before and after.
+
+Usage:
+    python benchmarks/handler_latency.py [--users 200] [--concurrency 4]
+                                         [--telegram-latency-ms 0] [--nowpayments-latency-ms 0]
+                                         [--shared-state] [--send-limits]
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from simulators import Faults, NowPaymentsSimulator, TelegramSimulator
+
+STEPS = ["start", "select_plan", "confirm_plan", "username_step", "payment_confirmed", "review_order"]
+ADMIN_ID = 990001
+FIRST_USER_ID = 2000000
+
+_update_ids = itertools.count(1)
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"bench{user_id}"}
+
+def message_update(user_id, text):
+    return {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_update_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id),
+            "text": text,
+        },
+    }
+
+def callback_update(user_id, data, chat_id=None):
+    chat_id = chat_id or user_id
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": next(_update_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": 999000, "is_bot": True, "first_name": "Bench Bot"},
+                "text": "menu",
+            },
+        },
+    }
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+class Recorder:
+    def __init__(self):
+        self.samples = {step: [] for step in STEPS}
+        self.failures = {step: 0 for step in STEPS}
+        self._lock = threading.Lock()
+
+    def add(self, step, seconds, ok=True):
+        with self._lock:
+            self.samples[step].append(seconds)
+            if not ok:
+                self.failures[step] += 1
+
+    def report(self, wall_seconds):
+        print(f"{'step':<18} {'count':>7} {'fail':>5} {'ops/s':>9} {'mean_ms':>9} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9}")
+        total = 0
+        for step in STEPS:
+            values = sorted(self.samples[step])
+            total += len(values)
+            if not values:
+                continue
+            busy = sum(values)
+            print(
+                f"{step:<18} {len(values):>7} {self.failures[step]:>5} {len(values) / busy:>9.1f} "
+                f"{busy / len(values) * 1000:>9.2f} {percentile(values, 50) * 1000:>9.2f} "
+                f"{percentile(values, 95) * 1000:>9.2f} {percentile(values, 99) * 1000:>9.2f}"
+            )
+        print(f"\n{total} updates in {wall_seconds:.2f}s: {total / wall_seconds:.1f} updates/s overall")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="number of simulated purchase flows")
+    parser.add_argument("--concurrency", type=int, default=4, help="flows driven in parallel")
+    parser.add_argument("--warmup", type=int, default=10, help="flows run before measuring")
+    parser.add_argument("--telegram-latency-ms", type=float, default=0.0, help="delay added by the simulated Bot API")
+    parser.add_argument("--nowpayments-latency-ms", type=float, default=0.0, help="delay added by the simulated NowPayments API")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of simulated API calls failing with 500")
+    parser.add_argument("--shared-state", action="store_true",
+                        help="look next-step handlers up in the database on every message, as webhook workers do")
+    parser.add_argument("--send-limits", action="store_true",
+                        help="keep Telegram's send rate limits (send_scheduler.py) instead of lifting them")
+    parser.add_argument("--log-level", default="WARNING", help="log level while the benchmark runs")
+    args = parser.parse_args()
+
+    # Use a throwaway SQLite database unless one is provided explicitly
+    if "DATABASE_URL" not in os.environ:
+        db_file = os.path.join(tempfile.mkdtemp(prefix="handler_latency_"), "bench.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:BENCHMARK")
+    os.environ.setdefault("LOG_LEVEL", args.log_level)
+    if not args.send_limits:
+        # The simulator doesn't enforce them, and waiting on them would hide the handlers' own time
+        for name in ("TELEGRAM_GLOBAL_RATE", "TELEGRAM_CHAT_RATE", "TELEGRAM_GROUP_RATE_PER_MINUTE"):
+            os.environ[name] = "1000000"
+        os.environ["TELEGRAM_SHARED_BUDGET"] = "0"
+
+    telegram = TelegramSimulator(Faults(args.telegram_latency_ms, error_rate=args.error_rate)).start()
+    nowpayments = NowPaymentsSimulator(Faults(args.nowpayments_latency_ms, error_rate=args.error_rate)).start()
+    os.environ["TELEGRAM_API_URL"] = telegram.api_url()
+    os.environ["NOWPAYMENTS_API_URL"] = nowpayments.api_url()
+
+    import telebot
+    import config_manager
+    import run_telegram_bot
+    from app import app, db
+
+    with app.app_context():
+        db.create_all()
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    # Adjust the in-memory config only; nothing is saved
+    run_telegram_bot.NOWPAYMENTS_API_KEY = "benchmark"
+    run_telegram_bot.nowpayments_api.api_key = "benchmark"
+    config_manager._config["bot_admins"] = [str(ADMIN_ID)]
+    config_manager._config["admin_channel"] = ""
+    config_manager._config["public_channel"] = ""
+
+    plans = config_manager.get_subscription_plans()
+    if not plans:
+        print("No subscription plans configured")
+        return 1
+    plan_id = plans[0]["id"]
+
+    bot = run_telegram_bot.bot
+    if not args.shared_state:
+        # Like the polling bot: the only consumer, so pending steps are answered from memory
+        bot.next_step_backend.own_all()
+    # Run handlers in the calling thread so each timing covers the whole handler
+    bot.threaded = False
+    Update = telebot.types.Update
+    recorder = Recorder()
+
+    def dispatch(step, update, record=True):
+        started = time.perf_counter()
+        ok = True
+        try:
+            bot.process_new_updates([Update.de_json(update)])
+        except Exception:
+            ok = False
+        if record:
+            recorder.add(step, time.perf_counter() - started, ok)
+
+    def run_flow(user_id, record=True):
+        dispatch("start", message_update(user_id, "/start"), record)
+        dispatch("select_plan", callback_update(user_id, f"select_plan:{plan_id}"), record)
+        dispatch("confirm_plan", callback_update(user_id, f"confirm_plan:{plan_id}"), record)
+        dispatch("username_step", message_update(user_id, f"@premium{user_id}"), record)
+
+        confirmed = telegram.callback_data(user_id, "payment_confirmed:")
+        if confirmed is None:
+            if record:
+                recorder.add("payment_confirmed", 0.0, ok=False)
+            return
+        dispatch("payment_confirmed", callback_update(user_id, confirmed), record)
+
+        order_id = confirmed.split(":", 1)[1]
+        dispatch("review_order", callback_update(ADMIN_ID, f"review_order:{order_id}"), record)
+
+    user_ids = itertools.count(FIRST_USER_ID)
+    for _ in range(args.warmup):
+        run_flow(next(user_ids), record=False)
+
+    pending = [next(user_ids) for _ in range(args.users)]
+    pending_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with pending_lock:
+                if not pending:
+                    return
+                user_id = pending.pop()
+            run_flow(user_id)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(max(1, args.concurrency))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    # Admin alerts go out from the send scheduler's threads
+    bot.scheduler.flush(60)
+    recorder.report(wall)
+    print(f"simulators: telegram={telegram.stats()} nowpayments={nowpayments.stats()}")
+
+    telegram.stop()
+    nowpayments.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
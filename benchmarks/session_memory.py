@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark for the bot's per-update database unit of work.
+
+Replays simulated updates through the bot dispatcher (PremiumBot._exec_task)
+with a handler that performs the same queries as the real /start and
+"My Orders" handlers, sampling the process RSS as it goes. With the unit of
+work in place RSS should stay flat; run with --no-unit-of-work to compare
+against the old behaviour of a never-removed scoped session.
+
+Usage:
+    python benchmarks/session_memory.py [--updates 1000000] [--users 5000]
+"""
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def current_rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # Not Linux: fall back to the peak RSS, which is at least an upper bound
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def fake_message(user_number):
+    """Build the parts of a telebot Message the handlers read"""
+    user = SimpleNamespace(
+        id=1000000 + user_number,
+        username=f"user{user_number}",
+        first_name="Bench",
+        last_name=str(user_number),
+    )
+    return SimpleNamespace(from_user=user, chat=SimpleNamespace(id=user.id), text="/start")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=1000000, help="number of simulated updates")
+    parser.add_argument("--users", type=int, default=5000, help="number of distinct simulated users")
+    parser.add_argument("--samples", type=int, default=20, help="number of RSS samples to report")
+    parser.add_argument("--no-unit-of-work", action="store_true", help="bypass the per-update unit of work")
+    args = parser.parse_args()
+
+    # Use a throwaway SQLite database unless one is provided explicitly
+    if "DATABASE_URL" not in os.environ:
+        db_file = os.path.join(tempfile.mkdtemp(prefix="session_memory_"), "bench.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+    import run_telegram_bot
+    from app import app, db
+    from models import Order
+
+    with app.app_context():
+        db.create_all()
+
+    bot = run_telegram_bot.bot
+    db_session = run_telegram_bot.db_session
+    bot.threaded = False
+
+    def simulated_handler(message):
+        user = run_telegram_bot.get_or_create_user(message)
+        db_session.query(Order).filter_by(user_id=user.id).order_by(Order.created_at.desc()).all()
+
+    if args.no_unit_of_work:
+        dispatch = lambda message: simulated_handler(message)
+    else:
+        dispatch = lambda message: bot._exec_task(simulated_handler, message)
+
+    # Warm up so the first sample isn't dominated by user creation and import costs
+    for number in range(args.users):
+        dispatch(fake_message(number))
+
+    sample_every = max(1, args.updates // args.samples)
+    baseline = current_rss_mb()
+    started = time.perf_counter()
+    print(f"{'updates':>10} {'rss_mb':>10} {'delta_mb':>10} {'updates/s':>10}")
+
+    for i in range(1, args.updates + 1):
+        dispatch(fake_message(i % args.users))
+        if i % sample_every == 0 or i == args.updates:
+            rss = current_rss_mb()
+            rate = i / (time.perf_counter() - started)
+            print(f"{i:>10} {rss:>10.1f} {rss - baseline:>10.1f} {rate:>10.0f}")
+
+    db_session.remove()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check for the web workers and the bot process.
+
+Each sample runs in a fresh interpreter and times:
+
+    web   import main (builds the app and runs create_app(), what a new
+          gunicorn worker does)
+    bot   import run_telegram_bot (what start_bot.py pays before polling)
+
+Importing the bot module must also stay free of side effects: it may not
+load the web app, start threads or open a database connection. The script
+exits with status 1 when a median exceeds its budget or a side effect shows
+up, so it can guard start-up time in CI.
+
+Usage:
+    python benchmarks/startup_time.py [--samples 5] [--web-budget-ms 2500] [--bot-budget-ms 1500]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, threading, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+import database
+print(json.dumps({{
+    "ms": elapsed * 1000,
+    "app_loaded": "app" in sys.modules,
+    "threads": sorted(t.name for t in threading.enumerate() if t is not threading.main_thread()),
+    "engine_created": database._engine is not None,
+}}))
+"""
+
+def sample(module, env):
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module)],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=120,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=5, help="fresh interpreters per target")
+    parser.add_argument("--web-budget-ms", type=float, default=2500.0, help="median budget for import main")
+    parser.add_argument("--bot-budget-ms", type=float, default=1500.0, help="median budget for import run_telegram_bot")
+    args = parser.parse_args()
+
+    env = os.environ.copy()
+    if "DATABASE_URL" not in env:
+        db_file = os.path.join(tempfile.mkdtemp(prefix="startup_time_"), "bench.db")
+        env["DATABASE_URL"] = f"sqlite:///{db_file}"
+    env.setdefault("TELEGRAM_BOT_TOKEN", "123456:BENCHMARK")
+
+    subprocess.run([sys.executable, "migrate.py"], cwd=ROOT, env=env, check=True, capture_output=True)
+    # One unmeasured run per target so bytecode caches exist
+    sample("main", env)
+    sample("run_telegram_bot", env)
+
+    failures = []
+    print(f"{'target':<8} {'min_ms':>9} {'median_ms':>10} {'max_ms':>9} {'budget_ms':>10}")
+    for name, module, budget in (("web", "main", args.web_budget_ms), ("bot", "run_telegram_bot", args.bot_budget_ms)):
+        results = [sample(module, env) for _ in range(max(1, args.samples))]
+        times = [r["ms"] for r in results]
+        median = statistics.median(times)
+        print(f"{name:<8} {min(times):>9.1f} {median:>10.1f} {max(times):>9.1f} {budget:>10.0f}")
+        if median > budget:
+            failures.append(f"{name}: median {median:.0f} ms exceeds the {budget:.0f} ms budget")
+
+        if module == "run_telegram_bot":
+            probe = results[-1]
+            if probe["app_loaded"]:
+                failures.append("bot: importing run_telegram_bot loaded the web app (app.py)")
+            if probe["threads"]:
+                failures.append(f"bot: importing run_telegram_bot started threads: {', '.join(probe['threads'])}")
+            if probe["engine_created"]:
+                failures.append("bot: importing run_telegram_bot created the database engine")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,383 @@
+"""
+Leader-elected polling for running several bot replicas (BOT_CLUSTER=1).
+
+Telegram allows one getUpdates consumer per bot token: a second replica
+polling gets 409 Conflict and the two steal updates from each other. In
+cluster mode every replica runs
+
+- an election loop: the replica holding the leader lock polls getUpdates and
+  only writes the raw updates to the update_queue table;
+- consumer threads that claim queued updates and run the handlers,
+
+so all replicas share the handler work. When the leader dies its lock goes
+with its database connection (or process) and another replica takes over
+within BOT_LEADER_RETRY seconds. The lock is a PostgreSQL advisory lock; on
+SQLite a file lock stands in, which only covers replicas on the same host.
+
+A chat's updates are handled one at a time and in order: only the oldest
+unhandled update of each chat can be claimed, so a reply is never handled
+before the update that asked for it (and saved its next-step handler).
+
+Updates are handled at least once: a claim that isn't completed within
+BOT_QUEUE_VISIBILITY seconds (its replica died) is handed out again. Handled
+rows are kept for an hour, so a new leader fetching the last batch its
+predecessor hadn't confirmed to Telegram doesn't queue those updates twice.
+"""
+
+import os
+import json
+import time
+import fcntl
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import telebot
+from sqlalchemy import create_engine, delete, func, or_, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.pool import NullPool
+
+import database
+import metrics
+from models import QueuedUpdate
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+# Arbitrary key for pg_advisory_lock, shared by every replica
+LEADER_LOCK_ID = 724_047
+# File lock used instead on SQLite
+LEADER_LOCK_FILE = os.environ.get("BOT_LEADER_LOCK_FILE", os.path.join(ROOT, "logs", "bot_leader.lock"))
+# How often a follower tries to take over
+LEADER_RETRY = _env_float("BOT_LEADER_RETRY", 2)
+# getUpdates long-polling timeout; also bounds how long a stopping leader takes to let go
+LONG_POLL_TIMEOUT = int(_env_float("BOT_LONG_POLL_TIMEOUT", 10))
+CONSUMERS = int(_env_float("BOT_QUEUE_CONSUMERS", 2))
+BATCH_SIZE = 10
+# A claimed update not completed within this many seconds is handed out again
+VISIBILITY_TIMEOUT = _env_float("BOT_QUEUE_VISIBILITY", 120)
+# An update claimed this many times is given up on (it keeps killing its replica)
+MAX_ATTEMPTS = 3
+KEEP_DONE = timedelta(hours=1)
+# A replica that claimed an update this recently is shown as active in the admin panel
+ACTIVE_WINDOW = timedelta(minutes=10)
+# Idle consumers poll the queue with a backoff between these bounds
+IDLE_MIN, IDLE_MAX = 0.05, 1.0
+
+def enabled():
+    return os.environ.get("BOT_CLUSTER", "0").lower() in ("1", "true", "yes")
+
+def log_name(process_name):
+    """Log file name for this replica's process; replicas may share a logs volume, so each gets its own"""
+    return f"{process_name}-{socket.gethostname()}" if enabled() else process_name
+
+
+class LeaderLock:
+    """Non-blocking leader lock: a PostgreSQL advisory lock held on its own connection, or a file lock"""
+
+    def __init__(self, engine, path=LEADER_LOCK_FILE):
+        self.engine = engine
+        self.path = path
+        self._lock_engine = None
+        self._connection = None
+        self._fd = None
+        self._lock = threading.Lock()
+
+    @property
+    def held(self):
+        return self._connection is not None or self._fd is not None
+
+    def acquire(self):
+        with self._lock:
+            if self.held:
+                return True
+            if self.engine.dialect.name == "postgresql":
+                if self._lock_engine is None:
+                    # The lock connection is held for as long as this replica leads, so it comes from an
+                    # unpooled engine rather than taking one of the handlers' pooled connections
+                    self._lock_engine = create_engine(self.engine.url, poolclass=NullPool)
+                connection = self._lock_engine.connect()
+                try:
+                    acquired = connection.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": LEADER_LOCK_ID}).scalar()
+                    connection.commit()
+                except SQLAlchemyError:
+                    connection.invalidate()
+                    connection.close()
+                    raise
+                if acquired:
+                    self._connection = connection
+                else:
+                    connection.close()
+                return bool(acquired)
+
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._fd = fd
+            return True
+
+    def still_held(self):
+        """Check the lock connection is alive; a dropped connection means the lock is gone"""
+        with self._lock:
+            if self._connection is None:
+                return self._fd is not None
+            try:
+                self._connection.execute(text("SELECT 1"))
+                self._connection.commit()
+                return True
+            except SQLAlchemyError:
+                logger.warning("Lost the leader lock connection")
+                self._drop_connection()
+                return False
+
+    def release(self):
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    self._connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": LEADER_LOCK_ID})
+                    self._connection.commit()
+                    self._connection.close()
+                    self._connection = None
+                except SQLAlchemyError:
+                    self._drop_connection()
+            if self._fd is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                os.close(self._fd)
+                self._fd = None
+
+    def _drop_connection(self):
+        # Closing the DBAPI connection is what releases a session-level advisory lock
+        self._connection.invalidate()
+        self._connection.close()
+        self._connection = None
+
+
+# --- update_queue ---------------------------------------------------------
+
+def update_chat_id(json_update):
+    """The chat an update belongs to (the user for updates without a chat), or None"""
+    for key, value in json_update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat") or value.get("from") or value.get("user")
+        if isinstance(chat, dict) and isinstance(chat.get("id"), int):
+            return chat["id"]
+    return None
+
+def enqueue(engine, json_updates):
+    """Queue raw updates; ones already queued (a new leader re-fetching a batch) are skipped"""
+    now = datetime.utcnow()
+    rows = [{"update_id": u["update_id"], "payload": json.dumps(u), "chat_id": update_chat_id(u),
+             "received_at": now, "attempts": 0} for u in json_updates]
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(QueuedUpdate).on_conflict_do_nothing(index_elements=["update_id"])
+    with Session(engine) as session, session.begin():
+        session.execute(statement, rows)
+
+def claim(engine, worker_id, limit=BATCH_SIZE):
+    """
+    Claim the oldest unclaimed updates; SKIP LOCKED keeps replicas from blocking on each other's rows.
+    
+    An update whose chat has an older update not yet handled (queued, or claimed by
+    another consumer) is left for later, so each chat's updates run one after another.
+    """
+    now = datetime.utcnow()
+    earlier = aliased(QueuedUpdate)
+    earlier_pending = (
+        select(earlier.update_id)
+        .where(earlier.chat_id == QueuedUpdate.chat_id)
+        .where(earlier.update_id < QueuedUpdate.update_id)
+        .where(earlier.done_at.is_(None))
+    )
+    candidates = (
+        select(QueuedUpdate.update_id)
+        .where(QueuedUpdate.done_at.is_(None))
+        .where(or_(QueuedUpdate.claimed_at.is_(None),
+                   QueuedUpdate.claimed_at < now - timedelta(seconds=VISIBILITY_TIMEOUT)))
+        .where(~earlier_pending.exists())
+        .order_by(QueuedUpdate.update_id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    with Session(engine) as session, session.begin():
+        rows = session.execute(
+            update(QueuedUpdate)
+            .where(QueuedUpdate.update_id.in_(candidates))
+            .values(claimed_at=now, claimed_by=worker_id, attempts=QueuedUpdate.attempts + 1)
+            .returning(QueuedUpdate.update_id, QueuedUpdate.payload, QueuedUpdate.attempts, QueuedUpdate.received_at)
+        ).all()
+    return sorted(rows, key=lambda row: row.update_id)
+
+def complete(engine, update_id):
+    with Session(engine) as session, session.begin():
+        session.execute(update(QueuedUpdate).where(QueuedUpdate.update_id == update_id).values(done_at=datetime.utcnow()))
+
+def unclaim(engine, update_ids):
+    """Hand claimed updates back without waiting for the visibility timeout"""
+    with Session(engine) as session, session.begin():
+        session.execute(
+            update(QueuedUpdate).where(QueuedUpdate.update_id.in_(update_ids))
+            .values(claimed_at=None, claimed_by=None, attempts=QueuedUpdate.attempts - 1)
+        )
+
+def status(engine):
+    """Queue figures for the admin panel, which can't see the replicas' supervisors"""
+    now = datetime.utcnow()
+    try:
+        with Session(engine) as session:
+            pending = session.scalar(select(func.count(QueuedUpdate.update_id)).where(QueuedUpdate.done_at.is_(None)))
+            last_done = session.scalar(select(func.max(QueuedUpdate.done_at)))
+            workers = session.scalars(
+                select(QueuedUpdate.claimed_by).distinct().where(QueuedUpdate.claimed_at > now - ACTIVE_WINDOW)
+            ).all()
+    except SQLAlchemyError as e:
+        logger.warning("Could not read the update queue: %s", e)
+        return {"cluster": True, "error": str(e)}
+    # claimed_by is "<host>:<pid>:<consumer>"
+    data = {"cluster": True, "pending": pending, "replicas": sorted({w.rsplit(":", 1)[0] for w in workers if w})}
+    if last_done is not None:
+        data["last_handled_age"] = round((now - last_done).total_seconds())
+    return data
+
+def purge(engine):
+    """Remove handled updates older than KEEP_DONE"""
+    with Session(engine) as session, session.begin():
+        return session.execute(delete(QueuedUpdate).where(QueuedUpdate.done_at < datetime.utcnow() - KEEP_DONE)).rowcount
+
+
+class BotCluster:
+    """Election loop and queue consumers for one replica"""
+
+    def __init__(self, bot, engine=None, consumers=CONSUMERS):
+        self.bot = bot
+        self.engine = engine or database.get_engine()
+        self.lock = LeaderLock(self.engine)
+        self.consumers = consumers
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._threads = []
+
+    def run(self):
+        """Start the threads and block until stop() (or a KeyboardInterrupt from SIGTERM)"""
+        # Concurrency comes from the consumer threads; each runs its handlers inline
+        self.bot.threaded = False
+        self._threads = [threading.Thread(target=self._lead, name="bot-leader", daemon=True)]
+        self._threads += [
+            threading.Thread(target=self._consume, args=(f"{self.name}:{i}",), name=f"bot-consumer-{i}", daemon=True)
+            for i in range(max(1, self.consumers))
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info("Bot replica %s started with %s queue consumers", self.name, self.consumers)
+        while not self._stop.wait(1):
+            pass
+
+    def stop(self, timeout):
+        """Let go of the leader lock right away, then wait for in-flight updates"""
+        self._stop.set()
+        self.lock.release()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            if thread.name.startswith("bot-consumer"):
+                thread.join(max(0.0, deadline - time.monotonic()))
+
+    def _lead(self):
+        while not self._stop.is_set():
+            try:
+                if not self.lock.acquire():
+                    self._stop.wait(LEADER_RETRY)
+                    continue
+            except SQLAlchemyError as e:
+                logger.warning("Leader election failed: %s", e)
+                self._stop.wait(LEADER_RETRY)
+                continue
+
+            logger.info("Replica %s is now the polling leader", self.name)
+            metrics.BOT_LEADER.set(1)
+            try:
+                self._poll()
+            finally:
+                self.lock.release()
+                metrics.BOT_LEADER.set(0)
+                logger.info("Replica %s stopped polling", self.name)
+
+    def _poll(self):
+        offset = None
+        last_purge = 0.0
+        self.bot.remove_webhook()
+        while not self._stop.is_set() and self.lock.still_held():
+            try:
+                json_updates = telebot.apihelper.get_updates(
+                    self.bot.token, offset=offset, timeout=LONG_POLL_TIMEOUT,
+                    allowed_updates=self.bot.allowed_updates(), long_polling_timeout=LONG_POLL_TIMEOUT)
+                if json_updates:
+                    enqueue(self.engine, json_updates)
+                    # Only confirmed to Telegram (by the next offset) once they are safely queued
+                    offset = json_updates[-1]["update_id"] + 1
+                if time.monotonic() - last_purge > 600:
+                    last_purge = time.monotonic()
+                    purge(self.engine)
+            except Exception as e:
+                # Includes the 409 from a previous leader whose long poll hasn't returned yet
+                logger.warning("Polling failed, retrying: %s", e)
+                self._stop.wait(LEADER_RETRY)
+
+    def _consume(self, worker_id):
+        idle = IDLE_MIN
+        while not self._stop.is_set():
+            try:
+                rows = claim(self.engine, worker_id)
+            except SQLAlchemyError as e:
+                logger.warning("Claiming queued updates failed: %s", e)
+                self._stop.wait(IDLE_MAX)
+                continue
+            # What the supervisor's heartbeat reads as "still receiving updates"
+            self.bot.last_poll = time.time()
+            if not rows:
+                self._stop.wait(idle)
+                idle = min(idle * 2, IDLE_MAX)
+                continue
+
+            idle = IDLE_MIN
+            for index, row in enumerate(rows):
+                if self._stop.is_set():
+                    self._unclaim([r.update_id for r in rows[index:]])
+                    break
+                metrics.UPDATE_QUEUE_WAIT.observe((datetime.utcnow() - row.received_at).total_seconds())
+                try:
+                    if row.attempts > MAX_ATTEMPTS:
+                        logger.error("Giving up on update %s after %s attempts", row.update_id, row.attempts - 1)
+                    else:
+                        updates = self.bot.parse_updates([json.loads(row.payload)])
+                        if updates:
+                            self.bot.process_new_updates(updates)
+                except Exception as e:
+                    # Handler errors aren't retried, the same as with plain polling
+                    logger.error("Error handling queued update %s: %s", row.update_id, e)
+                    logger.exception(e)
+                finally:
+                    try:
+                        complete(self.engine, row.update_id)
+                    except SQLAlchemyError as e:
+                        # Handed out again after the visibility timeout
+                        logger.warning("Could not mark update %s handled: %s", row.update_id, e)
+
+    def _unclaim(self, update_ids):
+        try:
+            unclaim(self.engine, update_ids)
+        except SQLAlchemyError as e:
+            logger.warning("Could not hand back %s claimed updates: %s", len(update_ids), e)
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Supervisor for the Telegram bot process.
+
+Runs start_bot.py as a child process and keeps it healthy:
+
+- a locked PID file, so only one supervisor (and one polling bot) runs at a time
+- the child's stdout/stderr go to logs/bot_output.log instead of an unread pipe
+- the bot writes a heartbeat file; a child whose polling loop stops advancing,
+  or whose handlers stop completing while work is queued, is restarted
+- stop sends SIGTERM so the bot finishes in-flight updates before exiting,
+  with SIGKILL only after BOT_STOP_TIMEOUT
+- a child that exits is restarted with exponential backoff
+
+    python bot_supervisor.py run        supervise in the foreground (systemd, docker)
+    python bot_supervisor.py start      start a supervisor in the background
+    python bot_supervisor.py stop       stop the supervisor and drain the bot
+    python bot_supervisor.py restart    restart the bot under the running supervisor
+    python bot_supervisor.py status     print the supervisor status as JSON
+
+The admin panel uses start/stop/restart/status through the same functions.
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import signal
+import logging
+import threading
+import subprocess
+
+logger = logging.getLogger("bot_supervisor")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+RUN_DIR = os.environ.get("BOT_RUN_DIR", os.path.join(ROOT, "logs"))
+PID_FILE = os.path.join(RUN_DIR, "bot_supervisor.pid")
+STATUS_FILE = os.path.join(RUN_DIR, "bot_status.json")
+HEARTBEAT_FILE = os.environ.get("BOT_HEARTBEAT_FILE", os.path.join(RUN_DIR, "bot_heartbeat.json"))
+OUTPUT_FILE = os.path.join(RUN_DIR, "bot_output.log")
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+# Heartbeat written by the bot every HEARTBEAT_INTERVAL seconds
+HEARTBEAT_INTERVAL = _env_float("BOT_HEARTBEAT_INTERVAL", 10)
+# No successful getUpdates for this long (long polling returns at least every 60s) means the bot is stuck
+HEARTBEAT_TIMEOUT = _env_float("BOT_HEARTBEAT_TIMEOUT", 180)
+# Updates queued but no handler finished for this long means the handlers are stuck
+STALL_TIMEOUT = _env_float("BOT_STALL_TIMEOUT", 120)
+# Time the bot gets to finish in-flight updates after SIGTERM
+STOP_TIMEOUT = _env_float("BOT_STOP_TIMEOUT", 30)
+BACKOFF_INITIAL = _env_float("BOT_RESTART_BACKOFF", 1)
+BACKOFF_MAX = _env_float("BOT_RESTART_BACKOFF_MAX", 300)
+# A child that ran this long resets the backoff
+STABLE_AFTER = _env_float("BOT_STABLE_AFTER", 60)
+
+
+def _write_json(path, data):
+    """Write a JSON file atomically so readers never see a partial file"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# --- Bot side -------------------------------------------------------------
+
+def start_heartbeat(health, path=None, interval=None):
+    """
+    Write health() to the heartbeat file from a daemon thread.
+
+    health() returns a dict; the supervisor reads last_poll, pending and
+    last_task_done from it (all times are Unix timestamps).
+    """
+    path = path or HEARTBEAT_FILE
+    interval = interval or HEARTBEAT_INTERVAL
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def beat():
+        while True:
+            try:
+                data = dict(health())
+                data.update(pid=os.getpid(), time=time.time())
+                _write_json(path, data)
+            except Exception as e:
+                logger.warning("Could not write heartbeat: %s", e)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=beat, name="bot-heartbeat", daemon=True)
+    thread.start()
+    return thread
+
+
+# --- Supervisor -----------------------------------------------------------
+
+class Supervisor:
+    """Runs and restarts the bot process; one instance per PID file"""
+
+    def __init__(self, command=None):
+        self.command = command or [sys.executable, os.path.join(ROOT, "start_bot.py")]
+        self.child = None
+        self.child_started_at = None
+        self.restarts = 0
+        self.last_exit_code = None
+        self.last_restart_reason = None
+        self.state = "starting"
+        self.started_at = time.time()
+        self._stop = threading.Event()
+        self._restart = threading.Event()
+        self._lock_file = None
+
+    def acquire_lock(self):
+        """Take the PID file lock; returns False if another supervisor holds it"""
+        os.makedirs(RUN_DIR, exist_ok=True)
+        lock_file = open(PID_FILE, "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._lock_file = lock_file
+        return True
+
+    def release_lock(self):
+        if self._lock_file is not None:
+            try:
+                os.unlink(PID_FILE)
+            except OSError:
+                pass
+            self._lock_file.close()
+            self._lock_file = None
+
+    def write_status(self):
+        _write_json(STATUS_FILE, {
+            "state": self.state,
+            "supervisor_pid": os.getpid(),
+            "supervisor_started_at": self.started_at,
+            "bot_pid": self.child.pid if self.child and self.child.poll() is None else None,
+            "bot_started_at": self.child_started_at,
+            "restarts": self.restarts,
+            "last_exit_code": self.last_exit_code,
+            "last_restart_reason": self.last_restart_reason,
+            "updated_at": time.time(),
+        })
+
+    def spawn(self):
+        env = os.environ.copy()
+        env["BOT_SUBPROCESS"] = "1"
+        env["BOT_HEARTBEAT_FILE"] = HEARTBEAT_FILE
+        # Logs already go to logs/bot.log; the output file only catches stray prints and crashes
+        env["LOG_CONSOLE"] = "0"
+        try:
+            os.unlink(HEARTBEAT_FILE)
+        except OSError:
+            pass
+        with open(OUTPUT_FILE, "ab") as output:
+            self.child = subprocess.Popen(
+                self.command, cwd=ROOT, env=env,
+                stdin=subprocess.DEVNULL, stdout=output, stderr=subprocess.STDOUT,
+            )
+        self.child_started_at = time.time()
+        self.state = "running"
+        logger.info("Started bot process %s", self.child.pid)
+        self.write_status()
+
+    def unhealthy_reason(self, now=None):
+        """Why the running child should be restarted, or None if it looks healthy"""
+        now = now or time.time()
+        heartbeat = _read_json(HEARTBEAT_FILE)
+        if not heartbeat or heartbeat.get("pid") != self.child.pid:
+            if now - self.child_started_at > HEARTBEAT_TIMEOUT:
+                return "no heartbeat since start"
+            return None
+        if now - heartbeat.get("time", 0) > HEARTBEAT_TIMEOUT:
+            return "heartbeat stopped"
+        last_poll = heartbeat.get("last_poll") or self.child_started_at
+        if now - last_poll > HEARTBEAT_TIMEOUT:
+            return f"no successful getUpdates for {now - last_poll:.0f}s"
+        last_done = heartbeat.get("last_task_done") or self.child_started_at
+        if heartbeat.get("pending", 0) > 0 and now - last_done > STALL_TIMEOUT:
+            return f"{heartbeat['pending']} updates pending, none finished for {now - last_done:.0f}s"
+        return None
+
+    def stop_child(self):
+        """SIGTERM, wait for the bot to drain, then SIGKILL"""
+        child = self.child
+        if child is None or child.poll() is not None:
+            return
+        logger.info("Stopping bot process %s", child.pid)
+        child.terminate()
+        try:
+            child.wait(STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logger.warning("Bot process %s did not stop within %ss, killing it", child.pid, STOP_TIMEOUT)
+            child.kill()
+            child.wait()
+        self.last_exit_code = child.returncode
+
+    def run(self):
+        if not self.acquire_lock():
+            logger.error("Another bot supervisor is already running (%s)", PID_FILE)
+            return 1
+        signal.signal(signal.SIGTERM, lambda *args: self._stop.set())
+        signal.signal(signal.SIGINT, lambda *args: self._stop.set())
+        signal.signal(signal.SIGHUP, lambda *args: self._restart.set())
+
+        backoff = BACKOFF_INITIAL
+        next_check = 0
+        try:
+            self.spawn()
+            while not self._stop.is_set():
+                self._stop.wait(1)
+                if self._stop.is_set():
+                    break
+
+                reason = None
+                if self._restart.is_set():
+                    self._restart.clear()
+                    reason = "restart requested"
+                    backoff = 0
+                elif self.child.poll() is not None:
+                    self.last_exit_code = self.child.returncode
+                    reason = f"exited with code {self.child.returncode}"
+                elif time.monotonic() >= next_check:
+                    next_check = time.monotonic() + HEARTBEAT_INTERVAL
+                    reason = self.unhealthy_reason()
+                if reason is None:
+                    continue
+
+                logger.warning("Restarting bot: %s", reason)
+                self.stop_child()
+                self.restarts += 1
+                self.last_restart_reason = reason
+                if time.time() - self.child_started_at >= STABLE_AFTER and reason != "restart requested":
+                    backoff = BACKOFF_INITIAL
+                if backoff:
+                    self.state = "backoff"
+                    self.write_status()
+                    logger.info("Waiting %.0fs before restarting the bot", backoff)
+                    if self._stop.wait(backoff):
+                        break
+                backoff = min(max(backoff * 2, BACKOFF_INITIAL), BACKOFF_MAX)
+                self.spawn()
+        finally:
+            self.state = "stopping"
+            self.write_status()
+            self.stop_child()
+            self.state = "stopped"
+            self.write_status()
+            self.release_lock()
+            logger.info("Bot supervisor stopped")
+        return 0
+
+
+# --- Control (admin panel and CLI) ----------------------------------------
+
+def supervisor_pid():
+    """PID of the running supervisor, or None"""
+    try:
+        with open(PID_FILE) as f:
+            pid = int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return None
+    return pid if pid and _pid_alive(pid) else None
+
+def start():
+    """Start a background supervisor; returns its PID, or None if one is already running"""
+    if supervisor_pid():
+        return None
+    os.makedirs(RUN_DIR, exist_ok=True)
+    with open(os.path.join(RUN_DIR, "bot_supervisor.out"), "ab") as output:
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "run"],
+            cwd=ROOT, stdin=subprocess.DEVNULL, stdout=output, stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+    return process.pid
+
+def stop(wait=0):
+    """Ask the supervisor to drain and stop the bot; returns False if none is running"""
+    pid = supervisor_pid()
+    if not pid:
+        return False
+    os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline and _pid_alive(pid):
+        time.sleep(0.2)
+    return True
+
+def restart():
+    """Restart the bot process under the running supervisor; returns False if none is running"""
+    pid = supervisor_pid()
+    if not pid:
+        return False
+    os.kill(pid, signal.SIGHUP)
+    return True
+
+def status():
+    """Supervisor status, last heartbeat and derived ages for display"""
+    now = time.time()
+    data = _read_json(STATUS_FILE) or {}
+    running = supervisor_pid() is not None
+    if not running and data.get("state") not in (None, "stopped"):
+        data["state"] = "dead"
+    data["running"] = running
+    heartbeat = _read_json(HEARTBEAT_FILE) or {}
+    if heartbeat and heartbeat.get("pid") == data.get("bot_pid"):
+        data["heartbeat"] = heartbeat
+        data["heartbeat_age"] = round(now - heartbeat.get("time", now))
+        if heartbeat.get("last_poll"):
+            data["last_poll_age"] = round(now - heartbeat["last_poll"])
+    if data.get("bot_started_at") and data.get("bot_pid"):
+        data["uptime"] = round(now - data["bot_started_at"])
+    return data
+
+def main(argv):
+    action = argv[1] if len(argv) > 1 else "status"
+    if action == "run":
+        import logging_config
+        import bot_cluster
+        logging_config.setup_logging(bot_cluster.log_name("supervisor"))
+        return Supervisor().run()
+    if action == "start":
+        pid = start()
+        print(f"Supervisor started (pid {pid})" if pid else "Supervisor is already running")
+        return 0
+    if action == "stop":
+        print("Stopping" if stop(wait=STOP_TIMEOUT + 5) else "Supervisor is not running")
+        return 0
+    if action == "restart":
+        print("Restart requested" if restart() else "Supervisor is not running")
+        return 0
+    if action == "status":
+        print(json.dumps(status(), indent=2))
+        return 0
+    print(__doc__)
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,6 +1,7 @@
 import json
 import os
 import logging
+import secrets
 from config import SUBSCRIPTION_PLANS, BOT_ADMINS, SUPPORT_CONTACT, ADMIN_CHANNEL, PUBLIC_CHANNEL
 
 logger = logging.getLogger(__name__)
@@ -21,14 +22,23 @@ DEFAULT_CONFIG = {
 
 # In-memory configuration
 _config = None
+# Modification time of the config file when it was last loaded or saved
+_config_mtime = None
+
+def _file_mtime():
+    try:
+        return os.path.getmtime(CONFIG_FILE)
+    except OSError:
+        return None
 
 def _load_config():
     """Load configuration from file or initialize with defaults"""
-    global _config
+    global _config, _config_mtime
     try:
         if os.path.exists(CONFIG_FILE):
             with open(CONFIG_FILE, 'r') as f:
                 _config = json.load(f)
+                _config_mtime = _file_mtime()
                 logger.info("Configuration loaded from file")
         else:
             _config = DEFAULT_CONFIG
@@ -40,13 +50,34 @@ def _load_config():
         
 def _save_config():
     """Save current configuration to file"""
+    global _config_mtime
     try:
         with open(CONFIG_FILE, 'w') as f:
             json.dump(_config, f, indent=4)
+        _config_mtime = _file_mtime()
         logger.info("Configuration saved to file")
     except Exception as e:
         logger.error(f"Error saving configuration: {e}")
 
+_reload_listeners = []
+
+def add_reload_listener(callback):
+    """Register a callback run after the configuration is reloaded from disk"""
+    _reload_listeners.append(callback)
+
+def reload_if_changed():
+    """Reload the configuration if another process has saved it since we last read it"""
+    mtime = _file_mtime()
+    if mtime is None or mtime == _config_mtime:
+        return False
+    _load_config()
+    for callback in _reload_listeners:
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Error in config reload listener: {e}")
+    return True
+
 def get_subscription_plans():
     """Get the current subscription plans"""
     if _config is None:
@@ -226,6 +257,39 @@ def set_channel_subscription_required(required):
     logger.info(f"Updated channel subscription requirement: {required}")
     return True
 
+def get_ipn_secret():
+    """Get the NowPayments IPN secret used to verify payment callbacks"""
+    if _config is None:
+        _load_config()
+    return _config.get("nowpayments_ipn_secret") or os.environ.get("NOWPAYMENTS_IPN_SECRET", "")
+
+def set_ipn_secret(secret):
+    """Set the NowPayments IPN secret"""
+    if _config is None:
+        _load_config()
+        
+    _config["nowpayments_ipn_secret"] = secret
+    _save_config()
+    logger.info("Updated NowPayments IPN secret")
+    return True
+
+def get_webhook_secret():
+    """Get the secret token Telegram sends with each webhook update"""
+    if _config is None:
+        _load_config()
+    return _config.get("telegram_webhook_secret") or os.environ.get("TELEGRAM_WEBHOOK_SECRET", "")
+
+def ensure_webhook_secret():
+    """Return the webhook secret token, generating and saving one if none is set"""
+    secret = get_webhook_secret()
+    if not secret:
+        # Telegram allows A-Z, a-z, 0-9, _ and - (1-256 characters)
+        secret = secrets.token_urlsafe(32)
+        _config["telegram_webhook_secret"] = secret
+        _save_config()
+        logger.info("Generated a new Telegram webhook secret token")
+    return secret
+
 def get_config_value(key, default=None):
     """Get a configuration value by key with a default fallback"""
     if _config is None:
@@ -0,0 +1,182 @@
+"""
+Next-step handler storage shared by every process that handles updates.
+
+telebot keeps register_next_step_handler() callbacks in the memory of the
+process that registered them. In webhook mode the user's reply usually
+reaches a different gunicorn worker, and any restart loses them, so the
+multi-step flows (username, activation link, rejection reason, channel
+settings) break. DatabaseHandlerBackend keeps them in the conversation_state
+table instead: one row per chat with its pending steps as JSON and an expiry.
+
+Callbacks are stored as module:name, so they must be module-level functions,
+and their arguments must be JSON-serializable.
+
+A process that is the only consumer of updates (the polling bot) calls
+own_all(): the rows are loaded into memory once and lookups are answered from
+there, with writes still going to the table so steps survive a restart.
+"""
+
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from telebot import Handler
+from telebot.handler_backends import HandlerBackend
+
+import database
+from models import ConversationState
+
+logger = logging.getLogger(__name__)
+
+# How long a pending step waits for the user's reply
+TTL_SECONDS = int(os.environ.get("BOT_CONVERSATION_TTL", 86400))
+# Expired rows are removed at most this often, from register_handler
+SWEEP_INTERVAL = 600
+
+
+def _callback_name(callback):
+    name = getattr(callback, "__qualname__", "")
+    if not name or "<" in name or "." in name:
+        raise ValueError(f"Next-step callback {callback!r} must be a module-level function to be stored")
+    return f"{callback.__module__}:{name}"
+
+def _resolve(callback_name):
+    module, _, name = callback_name.partition(":")
+    try:
+        return getattr(importlib.import_module(module), name)
+    except (ImportError, AttributeError):
+        logger.warning("Dropping stored next-step handler %s: callback not found", callback_name)
+        return None
+
+def dump_handlers(handlers):
+    return json.dumps([
+        {"callback": _callback_name(handler.callback), "args": list(handler.args), "kwargs": handler.kwargs}
+        for handler in handlers
+    ])
+
+def load_handlers(raw):
+    handlers = []
+    for item in json.loads(raw):
+        callback = _resolve(item["callback"])
+        if callback is not None:
+            handlers.append(Handler(callback, *item["args"], **item["kwargs"]))
+    return handlers
+
+
+class DatabaseHandlerBackend(HandlerBackend):
+    """telebot handler backend on the conversation_state table"""
+
+    def __init__(self, ttl=TTL_SECONDS, engine=None):
+        # HandlerBackend.__init__ only sets the handlers dict, which is a property here
+        self.ttl = ttl
+        self._engine = engine
+        self._exclusive = False
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = database.get_engine()
+        return self._engine
+
+    @property
+    def handlers(self):
+        """Pending chats, when this process owns the store; None means only the table knows"""
+        return self._cache if self._exclusive else None
+
+    def own_all(self):
+        """Serve lookups from memory; only valid while no other process handles updates"""
+        now = datetime.utcnow()
+        with Session(self.engine) as session:
+            rows = session.execute(
+                select(ConversationState.chat_id, ConversationState.handlers, ConversationState.expires_at)
+                .where(ConversationState.expires_at > now)
+            ).all()
+        with self._lock:
+            self._cache = {row.chat_id: (row.expires_at, load_handlers(row.handlers)) for row in rows}
+            self._exclusive = True
+        logger.info("Loaded %s pending conversations", len(rows))
+
+    def register_handler(self, handler_group_id, handler):
+        chat_id = int(handler_group_id)
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+        handlers = None
+        for attempt in range(2):
+            try:
+                with Session(self.engine) as session, session.begin():
+                    row = session.get(ConversationState, chat_id, with_for_update=True)
+                    if row is None:
+                        handlers = [handler]
+                        session.add(ConversationState(
+                            chat_id=chat_id, handlers=dump_handlers(handlers), updated_at=now, expires_at=expires_at
+                        ))
+                    else:
+                        handlers = (load_handlers(row.handlers) if row.expires_at > now else []) + [handler]
+                        row.handlers = dump_handlers(handlers)
+                        row.updated_at = now
+                        row.expires_at = expires_at
+                break
+            except IntegrityError:
+                # Another process inserted the row first; append to it instead
+                if attempt:
+                    raise
+        if self._exclusive:
+            with self._lock:
+                self._cache[chat_id] = (expires_at, handlers)
+        self._sweep()
+
+    def clear_handlers(self, handler_group_id):
+        chat_id = int(handler_group_id)
+        if self._exclusive:
+            with self._lock:
+                self._cache.pop(chat_id, None)
+        self._delete(chat_id)
+
+    def get_handlers(self, handler_group_id):
+        """Take the chat's pending handlers; the row is removed in the same statement so only one worker gets them"""
+        chat_id = int(handler_group_id)
+        if self._exclusive:
+            with self._lock:
+                cached = self._cache.pop(chat_id, None)
+            if cached is None:
+                return None
+            self._delete(chat_id)
+            expires_at, handlers = cached
+            return handlers if expires_at > datetime.utcnow() else None
+
+        with Session(self.engine) as session, session.begin():
+            row = session.execute(
+                delete(ConversationState).where(ConversationState.chat_id == chat_id)
+                .returning(ConversationState.handlers, ConversationState.expires_at)
+            ).first()
+        if row is None or row.expires_at <= datetime.utcnow():
+            return None
+        return load_handlers(row.handlers) or None
+
+    def _delete(self, chat_id):
+        with Session(self.engine) as session, session.begin():
+            session.execute(delete(ConversationState).where(ConversationState.chat_id == chat_id))
+
+    def _sweep(self):
+        if time.monotonic() - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = time.monotonic()
+        now = datetime.utcnow()
+        with Session(self.engine) as session, session.begin():
+            removed = session.execute(delete(ConversationState).where(ConversationState.expires_at <= now)).rowcount
+        if self._exclusive:
+            with self._lock:
+                for chat_id in [key for key, (expires_at, _) in self._cache.items() if expires_at <= now]:
+                    del self._cache[chat_id]
+        if removed:
+            logger.info("Removed %s expired conversations", removed)
@@ -0,0 +1,232 @@
+"""
+Shared data-access layer for the web app and the Telegram bot.
+
+Both processes use the single engine owned by Flask-SQLAlchemy, so a gunicorn
+worker that imports the bot module still holds exactly one connection pool.
+Pool sizing is controlled through environment variables:
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT_MS
+"""
+
+import os
+import time
+import logging
+import threading
+import functools
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import DeclarativeBase, scoped_session, sessionmaker
+
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///telegram_premium.db")
+
+# Latest revision in migrations/versions; `python migrate.py check` keeps the two in step
+SCHEMA_REVISION = "0007"
+
+class Base(DeclarativeBase):
+    pass
+
+# Flask-SQLAlchemy extension; models import it from here so they don't depend on app.py
+db = SQLAlchemy(model_class=Base)
+
+_flask_app = None
+_engine = None
+_engine_lock = threading.Lock()
+
+# Pool events counted from SQLAlchemy pool listeners
+POOL_EVENTS = ("connects", "checkouts", "checkins", "invalidations")
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid value for {name}, using {default}")
+        return default
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+def engine_options(url=None):
+    """Build the engine options shared by every process"""
+    url = url or DATABASE_URL
+    options = {
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 300),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+    }
+
+    if not url.startswith("sqlite"):
+        options["pool_size"] = _env_int("DB_POOL_SIZE", 5)
+        options["max_overflow"] = _env_int("DB_MAX_OVERFLOW", 5)
+        options["pool_timeout"] = _env_int("DB_POOL_TIMEOUT", 30)
+
+    statement_timeout = _env_int("DB_STATEMENT_TIMEOUT_MS", 15000)
+    if statement_timeout and url.startswith("postgresql"):
+        options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+
+    return options
+
+def _count(name):
+    metrics.DB_POOL_EVENTS.labels(name).inc()
+
+def _pool_method_value(pool, name):
+    method = getattr(pool, name, None)
+    return method() if callable(method) else 0
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if tracing.current_span() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if starts:
+        elapsed = (time.perf_counter() - starts.pop()) * 1000
+        tracing.record("sql_ms", elapsed)
+        tracing.record("sql_statements", 1)
+
+def instrument_engine(engine):
+    """Attach pool event listeners that feed pool_stats() and /metrics; safe to call more than once"""
+    if getattr(engine, "_premium_bot_instrumented", False):
+        return engine
+    
+    event.listen(engine, "connect", lambda *args: _count("connects"))
+    event.listen(engine.pool, "checkout", lambda *args: _count("checkouts"))
+    event.listen(engine.pool, "checkin", lambda *args: _count("checkins"))
+    event.listen(engine.pool, "invalidate", lambda *args: _count("invalidations"))
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    metrics.DB_POOL_CHECKED_OUT.set_function(lambda: _pool_method_value(engine.pool, "checkedout"))
+    metrics.DB_POOL_SIZE.set_function(lambda: _pool_method_value(engine.pool, "size"))
+    engine._premium_bot_instrumented = True
+    return engine
+
+def init_app(flask_app):
+    """Configure Flask-SQLAlchemy on a Flask app and make it the owner of the process-wide engine"""
+    global _flask_app
+    flask_app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
+    flask_app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options()
+    flask_app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(flask_app)
+    _flask_app = flask_app
+    return flask_app
+
+def get_app():
+    """
+    Return the Flask app that owns the engine.
+    
+    Inside the web process this is the app from app.py. A process that never
+    imports the web app (the standalone bot) gets a bare Flask app instead, so
+    it doesn't load every route and template just to reach the database.
+    """
+    if _flask_app is None:
+        with _engine_lock:
+            if _flask_app is None:
+                from flask import Flask
+                init_app(Flask("premium_bot"))
+    return _flask_app
+
+def get_engine():
+    """Return the process-wide engine (the one Flask-SQLAlchemy created for the app)"""
+    global _engine
+    if _engine is None:
+        flask_app = get_app()
+        with _engine_lock:
+            if _engine is None:
+                with flask_app.app_context():
+                    _engine = instrument_engine(db.engine)
+    return _engine
+
+def create_scoped_session():
+    """
+    Create a thread-local session registry bound to the shared engine.
+    
+    The engine is looked up when the first session is created rather than
+    here, so importing a module that holds a registry opens no connections.
+    """
+    factory = sessionmaker(autocommit=False, autoflush=False)
+    
+    def new_session(**kwargs):
+        if factory.kw.get("bind") is None:
+            factory.configure(bind=get_engine())
+        return factory(**kwargs)
+    
+    return scoped_session(new_session)
+
+_unit_of_work_depth = threading.local()
+
+def unit_of_work(session_registry):
+    """
+    Build a decorator that runs a function as one unit of work on a scoped session.
+    
+    The thread's session is rolled back if the function raises and removed when
+    the outermost wrapped call returns, so identity maps don't outlive an update
+    and a failed commit can't poison the next update handled by the same thread.
+    Nested calls (a handler calling another handler) share the outer session.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            depth = getattr(_unit_of_work_depth, "value", 0)
+            _unit_of_work_depth.value = depth + 1
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                session_registry.rollback()
+                raise
+            finally:
+                _unit_of_work_depth.value = depth
+                if depth == 0:
+                    session_registry.remove()
+        return wrapper
+    return decorator
+
+def schema_revision(engine=None):
+    """Revision recorded in alembic_version, or None if the database was never migrated"""
+    try:
+        with (engine or get_engine()).connect() as connection:
+            return connection.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    except SQLAlchemyError:
+        return None
+
+def check_schema():
+    """
+    Fail fast when the database isn't at SCHEMA_REVISION.
+    
+    A single query at boot; schema changes only happen in migrate.py, once per
+    deploy, so workers never race each other on DDL.
+    """
+    current = schema_revision()
+    if current != SCHEMA_REVISION:
+        raise RuntimeError(
+            f"Database schema is at revision {current or 'none'}, expected {SCHEMA_REVISION}; "
+            "run `python migrate.py` before starting"
+        )
+    return current
+
+def pool_stats():
+    """Return current pool usage and cumulative pool counters"""
+    engine = get_engine()
+    pool = engine.pool
+    stats = {"pool_class": type(pool).__name__}
+
+    # Not every pool implementation (e.g. SQLite's) exposes the sizing methods
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            try:
+                stats[name] = method()
+            except Exception:
+                pass
+
+    for name in POOL_EVENTS:
+        stats[name] = int(metrics.DB_POOL_EVENTS.labels(name).get())
+    return stats
@@ -0,0 +1,96 @@
+"""
+Small in-memory helpers for dropping duplicate deliveries before they reach the database.
+"""
+
+import hashlib
+import threading
+from collections import deque
+
+
+class RecentKeySet:
+    """
+    Bounded set of recently seen keys.
+
+    Keys are reduced to 8-byte digests so the memory footprint stays constant
+    regardless of key size; the oldest entries are evicted first once the
+    capacity is reached. This is only a fast path - callers still need a
+    durable check (e.g. a unique constraint) behind it.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self._seen = set()
+        self._order = deque()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(key):
+        if isinstance(key, (tuple, list)):
+            key = "\x1f".join("" if part is None else str(part) for part in key)
+        raw = hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(raw, "big")
+
+    def __contains__(self, key):
+        return self._digest(key) in self._seen
+
+    def __len__(self):
+        return len(self._seen)
+
+    def add(self, key):
+        """Remember a key, evicting the oldest one if the set is full"""
+        digest = self._digest(key)
+        with self._lock:
+            if digest in self._seen:
+                return
+            self._seen.add(digest)
+            self._order.append(digest)
+            if len(self._order) > self.capacity:
+                self._seen.discard(self._order.popleft())
+
+    def clear(self):
+        with self._lock:
+            self._seen.clear()
+            self._order.clear()
+
+
+class UpdateIdWindow:
+    """
+    Sliding window over Telegram update_ids, kept as a bitset.
+
+    Telegram numbers updates sequentially, so the last ``size`` ids fit in one
+    integer used as a bitmask anchored at the highest id seen: memory stays at
+    size/8 bytes and a lookup is a shift and a mask. An id below the window is
+    taken as a new sequence (Telegram picks a random start again after a week
+    without updates) and resets the window instead of being dropped; so does
+    an id a whole window or more ahead.
+    """
+
+    def __init__(self, size=4096):
+        self.size = size
+        self._high = None
+        self._bits = 0
+        self._lock = threading.Lock()
+
+    def check_and_add(self, update_id):
+        """Record an update_id; returns True if it was already seen"""
+        with self._lock:
+            if self._high is None or update_id <= self._high - self.size:
+                self._high, self._bits = update_id, 1
+                return False
+            if update_id - self._high >= self.size:
+                # Nothing in the window survives the jump; shifting by the gap would allocate gap/8 bytes
+                self._high, self._bits = update_id, 1
+                return False
+            if update_id > self._high:
+                self._bits = ((self._bits << (update_id - self._high)) | 1) & ((1 << self.size) - 1)
+                self._high = update_id
+                return False
+            bit = 1 << (self._high - update_id)
+            if self._bits & bit:
+                return True
+            self._bits |= bit
+            return False
+
+    def clear(self):
+        with self._lock:
+            self._high, self._bits = None, 0
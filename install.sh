@@ -60,24 +60,7 @@ fi
 
 # میگریشن و ایجاد ساختار دیتابیس
 echo -e "\n${YELLOW}[6/7] ایجاد ساختار دیتابیس...${NC}"
-python3 -c "
-from app import app, db
-import models
-with app.app_context():
-    db.create_all()
-    try:
-        from models import AdminUser
-        from werkzeug.security import generate_password_hash
-        # بررسی وجود ادمین
-        admin = db.session.query(AdminUser).filter_by(username='admin').first()
-        if not admin:
-            admin = AdminUser(username='admin', password_hash=generate_password_hash('admin'), is_super_admin=True)
-            db.session.add(admin)
-            db.session.commit()
-            print('Admin user created: admin/admin')
-    except Exception as e:
-        print(f'Error checking or creating admin: {e}')
-"
+python3 migrate.py
 
 # ساخت سرویس systemd برای اجرای خودکار ربات
 echo -e "\n${YELLOW}[7/7] ساخت سرویس systemd برای اجرای خودکار...${NC}"
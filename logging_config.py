@@ -3,6 +3,15 @@
 """
 
 import os
+import sys
+import time
+import gzip
+import json
+import glob
+import queue
+import shutil
+import atexit
+import threading
 import logging
 import logging.handlers
 from datetime import datetime
@@ -18,20 +27,202 @@ if not os.path.exists(LOG_DIR):
 LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s - %(message)s"
 DEBUG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s (%(filename)s:%(lineno)d) - %(message)s"
 
-# ایجاد فایل لاگ روزانه
-def get_log_file(prefix):
-    today = datetime.now().strftime('%Y-%m-%d')
-    return os.path.join(LOG_DIR, f"{prefix}_{today}.log")
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+# چرخش و نگهداری فایل‌های لاگ
+LOG_ROTATE_WHEN = os.environ.get('LOG_ROTATE_WHEN', 'midnight')
+LOG_MAX_BYTES = _env_int('LOG_MAX_BYTES', 10*1024*1024)
+LOG_RETENTION_DAYS = _env_int('LOG_RETENTION_DAYS', 14)
+LOG_MAX_TOTAL_BYTES = _env_int('LOG_MAX_TOTAL_MB', 200) * 1024 * 1024
+
+class _SegmentCompressor:
+    """
+    ترد پس‌زمینه برای فشرده‌سازی قطعه‌های چرخیده و اعمال سیاست نگهداری.
+    ترد نویسنده لاگ هرگز منتظر gzip نمی‌ماند.
+    """
+    
+    def __init__(self):
+        self._jobs = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def submit(self, handler, segment=None):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='log-compressor', daemon=True)
+                self._thread.start()
+        self._jobs.put((handler, segment))
+    
+    def _run(self):
+        while True:
+            handler, segment = self._jobs.get()
+            try:
+                if segment:
+                    _gzip_segment(segment)
+                handler.sweep()
+            except Exception as e:
+                # لاگ کردن از اینجا می‌تواند به خود همین هندلر برگردد
+                sys.stderr.write(f"Log compression failed for {segment}: {e}\n")
+
+_compressor = _SegmentCompressor()
+
+def _gzip_segment(path):
+    """فشرده‌سازی یک قطعه و حذف نسخه اصلی"""
+    if not os.path.exists(path):
+        return
+    tmp_path = path + '.gz.tmp'
+    with open(path, 'rb') as src, gzip.open(tmp_path, 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(tmp_path, path + '.gz')
+    os.remove(path)
+
+class CompressingTimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """
+    هندلر فایل با چرخش زمانی (پیش‌فرض نیمه‌شب) و چرخش اضطراری بر اساس اندازه.
+    قطعه‌های چرخیده در ترد پس‌زمینه gzip می‌شوند و قطعه‌های قدیمی‌تر از
+    retention_days یا بیش از سقف max_total_bytes حذف می‌شوند.
+    """
+    
+    def __init__(self, filename, when=None, max_bytes=None, retention_days=None,
+                 max_total_bytes=None, encoding='utf-8', delay=False, segment_glob=None):
+        super().__init__(filename, when=when or LOG_ROTATE_WHEN, backupCount=0,
+                         encoding=encoding, delay=delay)
+        # الگوی قطعه‌هایی که سیاست نگهداری روی آنها اعمال می‌شود (برای فایل‌های هر پردازه، کل خانواده)
+        self.segment_glob = segment_glob
+        self.max_bytes = LOG_MAX_BYTES if max_bytes is None else max_bytes
+        self.retention_days = LOG_RETENTION_DAYS if retention_days is None else retention_days
+        self.max_total_bytes = LOG_MAX_TOTAL_BYTES if max_total_bytes is None else max_total_bytes
+        # قطعه‌های فشرده‌نشده از اجرای قبلی (مثلا بعد از کرش) و پاکسازی اولیه
+        for leftover in self._segments(compressed=False, pattern=self.baseFilename + '.*'):
+            _compressor.submit(self, leftover)
+        _compressor.submit(self)
+    
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes and self.stream is not None:
+            # اندازه فعلی فایل کافی است؛ قالب‌بندی دوباره رکورد لازم نیست
+            return self.stream.tell() >= self.max_bytes
+        return False
+    
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            segment = self._segment_name()
+            os.rename(self.baseFilename, segment)
+            _compressor.submit(self, segment)
+        
+        now = int(time.time())
+        self.rolloverAt = self.computeRollover(now)
+        if not self.delay:
+            self.stream = self._open()
+    
+    def _segment_name(self):
+        # نام قطعه بر اساس زمان چرخش؛ چند چرخش در یک ثانیه پسوند شماره‌دار می‌گیرند
+        base = f"{self.baseFilename}.{time.strftime('%Y-%m-%d_%H-%M-%S')}"
+        name = base
+        counter = 1
+        while os.path.exists(name) or os.path.exists(name + '.gz'):
+            name = f"{base}.{counter}"
+            counter += 1
+        return name
+    
+    def _segments(self, compressed=True, pattern=None):
+        pattern = pattern or self.segment_glob or self.baseFilename + '.*'
+        result = []
+        for path in glob.glob(pattern):
+            if path.endswith('.tmp'):
+                continue
+            if path.endswith('.gz') == compressed:
+                result.append(path)
+        return result
+    
+    def sweep(self):
+        """حذف قطعه‌های فشرده قدیمی بر اساس سن و حجم کل"""
+        segments = []
+        for path in self._segments():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            segments.append((stat.st_mtime, stat.st_size, path))
+        segments.sort()
+        
+        if self.retention_days:
+            cutoff = time.time() - self.retention_days * 86400
+            while segments and segments[0][0] < cutoff:
+                _remove_quietly(segments.pop(0)[2])
+        
+        if self.max_total_bytes:
+            total = sum(size for _, size, _ in segments)
+            while segments and total > self.max_total_bytes:
+                _, size, path = segments.pop(0)
+                total -= size
+                _remove_quietly(path)
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+# مسیر فایل لاگ هر بخش؛ تاریخ‌گذاری را هندلر چرخشی در زمان چرخش انجام می‌دهد
+def get_log_file(prefix, pid=None):
+    if pid is not None:
+        return os.path.join(LOG_DIR, f"{prefix}-{pid}.log")
+    return os.path.join(LOG_DIR, f"{prefix}.log")
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _adopt_dead_process_logs(handler, prefix):
+    """
+    فایل‌های لاگ پردازه‌های مرده همین خانواده (مثلا worker قبلی gunicorn) به قطعه
+    تبدیل و فشرده می‌شوند تا سیاست نگهداری شامل آنها هم بشود.
+    """
+    for path in glob.glob(os.path.join(LOG_DIR, f"{prefix}-*.log")):
+        pid = os.path.basename(path)[len(prefix) + 1:-len('.log')]
+        if not pid.isdigit() or int(pid) == os.getpid() or _pid_alive(int(pid)):
+            continue
+        for leftover in glob.glob(path + '.*'):
+            if not leftover.endswith(('.gz', '.tmp')):
+                _compressor.submit(handler, leftover)
+        try:
+            if os.path.getsize(path) == 0:
+                _remove_quietly(path)
+                continue
+        except OSError:
+            continue
+        segment = f"{path}.{time.strftime('%Y-%m-%d_%H-%M-%S')}"
+        try:
+            # پردازه دیگری ممکن است همزمان همین فایل را برداشته باشد
+            os.rename(path, segment)
+        except OSError:
+            continue
+        _compressor.submit(handler, segment)
 
 # پیکربندی لاگر اصلی
-def setup_logger(name, level=logging.INFO, log_file=None, max_bytes=10*1024*1024, backup_count=5):
+def setup_logger(name, level=logging.INFO, log_file=None, max_bytes=None, retention_days=None):
     """
-    راه‌اندازی یک لاگر با فایل چرخشی
+    راه‌اندازی یک لاگر مستقل با فایل چرخشی
     :param name: نام لاگر
     :param level: سطح لاگینگ 
     :param log_file: مسیر فایل لاگ
-    :param max_bytes: حداکثر اندازه هر فایل لاگ
-    :param backup_count: تعداد فایل‌های پشتیبان
+    :param max_bytes: حداکثر اندازه فایل پیش از چرخش اضطراری
+    :param retention_days: تعداد روزهای نگهداری قطعه‌های فشرده
     :return: لاگر پیکربندی شده
     """
     
@@ -53,137 +244,319 @@ def setup_logger(name, level=logging.INFO, log_file=None, max_bytes=10*1024*1024
     console_handler.setFormatter(formatter)
     logger.addHandler(console_handler)
     
-    # هندلر فایل با چرخش خودکار
+    # هندلر فایل با چرخش زمانی و فشرده‌سازی
     if log_file:
-        file_handler = logging.handlers.RotatingFileHandler(
-            log_file, 
-            maxBytes=max_bytes, 
-            backupCount=backup_count,
-            encoding='utf-8'
+        file_handler = CompressingTimedRotatingFileHandler(
+            log_file,
+            max_bytes=max_bytes,
+            retention_days=retention_days
         )
         file_handler.setFormatter(formatter)
         logger.addHandler(file_handler)
     
+    logger.propagate = False
+    return logger
+
+# لاگرهای بخش‌های مختلف سیستم؛ همه به پایپ‌لاین مشترک و یک فایل لاگ می‌رسند
+COMPONENT_LOGGERS = {
+    'telegram': 'telegram_bot',
+    'api': 'api',
+    'payment': 'payment',
+    'database': 'database',
+    'webhook': 'webhook',
+    'callback': 'callback',
+    'app': 'app',
+}
+
+def _component_logger(name, level):
+    setup_logging()
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
     return logger
 
-# لاگرهای پیش‌فرض برای بخش‌های مختلف سیستم
 def get_telegram_logger(level=logging.DEBUG):
     """لاگر مخصوص ربات تلگرام"""
-    return setup_logger(
-        'telegram_bot', 
-        level=level, 
-        log_file=get_log_file('telegram')
-    )
+    return _component_logger('telegram_bot', level)
 
 def get_api_logger(level=logging.DEBUG):
     """لاگر مخصوص API"""
-    return setup_logger(
-        'api', 
-        level=level, 
-        log_file=get_log_file('api')
-    )
+    return _component_logger('api', level)
 
 def get_payment_logger(level=logging.DEBUG):
     """لاگر مخصوص پرداخت‌ها"""
-    return setup_logger(
-        'payment', 
-        level=level, 
-        log_file=get_log_file('payment')
-    )
+    return _component_logger('payment', level)
 
 def get_database_logger(level=logging.DEBUG):
     """لاگر مخصوص دیتابیس"""
-    return setup_logger(
-        'database', 
-        level=level, 
-        log_file=get_log_file('database')
-    )
+    return _component_logger('database', level)
 
 def get_webhook_logger(level=logging.DEBUG):
     """لاگر مخصوص وب‌هوک‌ها"""
-    return setup_logger(
-        'webhook', 
-        level=level, 
-        log_file=get_log_file('webhook')
-    )
+    return _component_logger('webhook', level)
 
 def get_callback_logger(level=logging.DEBUG):
     """لاگر مخصوص callback‌های تلگرام"""
-    return setup_logger(
-        'callback', 
-        level=level, 
-        log_file=get_log_file('callback')
-    )
+    return _component_logger('callback', level)
 
 # لاگر عمومی برای کل برنامه
 def get_app_logger():
     """لاگر عمومی برنامه"""
-    return setup_logger(
-        'app', 
-        level=logging.INFO, 
-        log_file=os.path.join(LOG_DIR, 'app.log')
-    )
+    return _component_logger('app', logging.INFO)
 
 # تنظیم لاگرهای کتابخانه‌های خارجی
 def setup_external_loggers():
-    """تنظیم لاگینگ برای کتابخانه‌های خارجی"""
-    # تنظیم لاگر telebot
-    telebot_logger = setup_logger(
-        'telebot', 
-        level=logging.INFO, 
-        log_file=os.path.join(LOG_DIR, 'telebot.log')
-    )
-    
-    # تنظیم لاگر sqlalchemy
-    sqlalchemy_logger = setup_logger(
-        'sqlalchemy.engine', 
-        level=logging.WARNING, 
-        log_file=os.path.join(LOG_DIR, 'sqlalchemy.log')
-    )
-    
-    # تنظیم لاگر requests
-    requests_logger = setup_logger(
-        'requests', 
-        level=logging.WARNING, 
-        log_file=os.path.join(LOG_DIR, 'requests.log')
-    )
-    
-    # تنظیم لاگر urllib3
-    urllib3_logger = setup_logger(
-        'urllib3', 
-        level=logging.WARNING, 
-        log_file=os.path.join(LOG_DIR, 'urllib3.log')
-    )
+    """تنظیم سطح لاگ کتابخانه‌های خارجی"""
+    logging.getLogger('telebot').setLevel(logging.INFO)
+    logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
+    logging.getLogger('requests').setLevel(logging.WARNING)
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
 
 # تنظیم تمام لاگرهای سیستم
-def setup_all_loggers():
-    """تنظیم تمام لاگرهای سیستم"""
-    # لاگرهای داخلی
-    telegram_logger = get_telegram_logger()
-    api_logger = get_api_logger()
-    payment_logger = get_payment_logger()
-    database_logger = get_database_logger()
-    webhook_logger = get_webhook_logger()
-    callback_logger = get_callback_logger()
-    app_logger = get_app_logger()
+def setup_all_loggers(process_name='debug'):
+    """
+    تنظیم تمام لاگرهای سیستم روی یک فایل چرخشی مشترک.
+    نام لاگر در هر رکورد JSON ثبت می‌شود، پس جدا کردن فایل‌ها لازم نیست.
+    """
+    setup_logging(process_name, level=logging.DEBUG)
+    
+    loggers = {
+        key: _component_logger(name, logging.INFO if key == 'app' else logging.DEBUG)
+        for key, name in COMPONENT_LOGGERS.items()
+    }
     
     # لاگرهای خارجی
     setup_external_loggers()
     
-    # تنظیم لاگر ریشه
-    root_logger = setup_logger(
-        'root', 
-        level=logging.WARNING, 
-        log_file=os.path.join(LOG_DIR, 'root.log')
-    )
+    loggers['root'] = logging.getLogger()
+    return loggers
+
+# ---------------------------------------------------------------------------
+# پایپ‌لاین لاگینگ غیرهمزمان
+#
+# همه رکوردها از طریق یک صف به ترد QueueListener می‌رسند؛ قالب‌بندی پیام،
+# تبدیل به JSON و نوشتن روی دیسک در همان ترد انجام می‌شود و ترد درخواست
+# فقط رکورد را در صف می‌گذارد.
+# ---------------------------------------------------------------------------
+
+# لاگرهایی که سطح آنها از پنل ادمین قابل تنظیم است
+CONTROLLED_LOGGERS = [
+    'root',
+    'app',
+    'api',
+    'run_telegram_bot',
+    'payment_events',
+    'nowpayments',
+    'telebot',
+    'werkzeug',
+    'sqlalchemy.engine',
+]
+
+LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
+
+# نرخ نمونه‌برداری پیش‌فرض برای لاگرهای پرحجم (فقط سطوح پایین‌تر از WARNING)
+DEFAULT_SAMPLING = {
+    'telebot': 0.1,
+    'urllib3': 0.1,
+}
+
+class JsonFormatter(logging.Formatter):
+    """فرمت JSON یک‌خطی برای لاگ‌های ساختاریافته"""
+    
+    _RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+    
+    def format(self, record):
+        payload = {
+            'ts': datetime.utcfromtimestamp(record.created).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+            'src': f"{record.filename}:{record.lineno}",
+        }
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        
+        # فیلدهای اضافه (extra=...) به صورت کلید جداگانه
+        for key, value in record.__dict__.items():
+            if key not in self._RESERVED and not key.startswith('_'):
+                payload[key] = value
+        
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """نمونه‌برداری قطعی از رکوردهای پرحجم؛ WARNING و بالاتر همیشه عبور می‌کنند"""
+    
+    def __init__(self, rates=None):
+        super().__init__()
+        # رکوردها از چند ترد همزمان می‌رسند؛ بدون قفل شمارنده‌ها گم می‌شوند و نرخ به هم می‌خورد
+        self._lock = threading.Lock()
+        self.set_rates(rates or {})
+    
+    def set_rates(self, rates):
+        # نرخ 0.1 یعنی از هر ۱۰ رکورد یکی نگه داشته می‌شود
+        every = {}
+        for name, rate in rates.items():
+            try:
+                rate = float(rate)
+            except (TypeError, ValueError):
+                continue
+            every[name] = 0 if rate <= 0 else max(1, round(1 / min(rate, 1.0)))
+        with self._lock:
+            self._every = every
+            self._counters = {}
+            self._resolved = {}
+    
+    def _every_for(self, name):
+        if name in self._resolved:
+            return self._resolved[name]
+        current = name
+        value = 1
+        while current:
+            if current in self._every:
+                value = self._every[current]
+                break
+            current = current.rpartition('.')[0]
+        self._resolved[name] = value
+        return value
+    
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self._every:
+            return True
+        every = self._every_for(record.name)
+        if every == 1:
+            return True
+        if every == 0:
+            return False
+        with self._lock:
+            count = self._counters.get(record.name, 0)
+            self._counters[record.name] = count + 1
+        return count % every == 0
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    هندلر صف که فقط msg % args را در ترد فراخواننده می‌سازد.
+    آرگومان‌ها (اشیای قابل تغییر یا مدل‌های ORM که session آنها بسته می‌شود) باید همین‌جا
+    به رشته تبدیل شوند؛ بقیه قالب‌بندی (JSON، زمان، traceback) در ترد listener انجام می‌شود.
+    """
+    
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+_listener = None
+_sampling_filter = SamplingFilter(DEFAULT_SAMPLING)
+_setup_lock = threading.Lock()
+
+def _build_output_handlers(process_name, per_process=False):
+    """هندلرهای خروجی که در ترد listener اجرا می‌شوند"""
+    if per_process:
+        # هر پردازه (مثلا هر worker گانیکورن) فایل و چرخش خودش را دارد؛ نگهداری روی کل خانواده اعمال می‌شود
+        file_handler = CompressingTimedRotatingFileHandler(
+            get_log_file(process_name, os.getpid()),
+            segment_glob=os.path.join(LOG_DIR, f"{process_name}-*.log.*"))
+        _adopt_dead_process_logs(file_handler, process_name)
+    else:
+        file_handler = CompressingTimedRotatingFileHandler(get_log_file(process_name))
+    file_handler.setFormatter(JsonFormatter())
+    
+    # LOG_CONSOLE=0 خروجی کنسول را خاموش می‌کند (مثلاً وقتی supervisor خروجی را در فایل می‌ریزد)
+    if os.environ.get('LOG_CONSOLE', '1').lower() in ('0', 'false', 'no'):
+        return [file_handler]
     
+    console_handler = logging.StreamHandler()
+    if os.environ.get('LOG_JSON_CONSOLE', '').lower() in ('1', 'true', 'yes'):
+        console_handler.setFormatter(JsonFormatter())
+    else:
+        console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    
+    return [console_handler, file_handler]
+
+def apply_log_levels(levels):
+    """اعمال سطح لاگ برای هر لاگر: {'telebot': 'WARNING', ...}"""
+    for name, level in (levels or {}).items():
+        level = str(level).upper()
+        if level not in LOG_LEVELS:
+            continue
+        logging.getLogger(None if name == 'root' else name).setLevel(level)
+
+def apply_sampling(rates):
+    """اعمال نرخ نمونه‌برداری؛ مقادیر پیش‌فرض با تنظیمات ادمین جایگزین می‌شوند"""
+    merged = dict(DEFAULT_SAMPLING)
+    merged.update(rates or {})
+    _sampling_filter.set_rates(merged)
+
+def get_log_levels():
+    """سطح فعلی لاگرهای قابل تنظیم"""
     return {
-        'telegram': telegram_logger,
-        'api': api_logger,
-        'payment': payment_logger,
-        'database': database_logger,
-        'webhook': webhook_logger,
-        'callback': callback_logger,
-        'app': app_logger,
-        'root': root_logger
-    }
\ No newline at end of file
+        name: logging.getLevelName(logging.getLogger(None if name == 'root' else name).getEffectiveLevel())
+        for name in CONTROLLED_LOGGERS
+    }
+
+def apply_config_settings():
+    """خواندن سطح‌ها و نرخ نمونه‌برداری از config_manager و اعمال آنها"""
+    import config_manager
+    apply_log_levels(config_manager.get_config_value('log_levels', {}))
+    apply_sampling(config_manager.get_config_value('log_sampling', {}))
+
+def _watch_config(interval):
+    """بررسی دوره‌ای فایل تنظیمات تا تغییرات پنل ادمین به همه پردازه‌ها برسد"""
+    import config_manager
+    while True:
+        threading.Event().wait(interval)
+        try:
+            if config_manager.reload_if_changed():
+                apply_config_settings()
+        except Exception:
+            logging.getLogger(__name__).exception("Error reloading logging settings")
+
+def setup_logging(process_name='app', level=None, watch_interval=30, per_process=False):
+    """
+    راه‌اندازی پایپ‌لاین لاگینگ مبتنی بر صف برای کل پردازه.
+    فراخوانی دوباره اثری ندارد.
+    :param process_name: نام فایل لاگ (مثلا web یا bot)
+    :param per_process: فایل جدا برای هر پردازه (process_name-<pid>.log)، وقتی چند پردازه با یک نام اجرا می‌شوند
+    :param level: سطح لاگر ریشه؛ پیش‌فرض از متغیر محیطی LOG_LEVEL
+    :param watch_interval: فاصله بررسی تغییرات تنظیمات (ثانیه)؛ 0 یعنی غیرفعال
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+        
+        log_queue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(
+            log_queue,
+            *_build_output_handlers(process_name, per_process),
+            respect_handler_level=True
+        )
+        _listener.start()
+        atexit.register(_listener.stop)
+        
+        queue_handler = LazyQueueHandler(log_queue)
+        queue_handler.addFilter(_sampling_filter)
+        # شناسه trace در ترد فراخواننده خوانده می‌شود، نه در ترد listener
+        import tracing
+        queue_handler.addFilter(tracing.TraceIdFilter())
+        
+        root_logger = logging.getLogger()
+        for handler in root_logger.handlers[:]:
+            root_logger.removeHandler(handler)
+        root_logger.addHandler(queue_handler)
+        root_logger.setLevel(level or os.environ.get('LOG_LEVEL', 'INFO').upper())
+        
+        try:
+            apply_config_settings()
+        except Exception:
+            logging.getLogger(__name__).exception("Error applying logging settings")
+        
+        if watch_interval:
+            threading.Thread(
+                target=_watch_config,
+                args=(watch_interval,),
+                name='log-config-watcher',
+                daemon=True
+            ).start()
+        
+        return _listener
@@ -0,0 +1,389 @@
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Counters, gauges and histograms are created once at import time and updated
+from request and update handlers; render() produces the text served at
+/metrics. Each process (every gunicorn worker and the standalone bot) keeps
+its own registry, so a scrape only sees the process that answered it.
+"""
+
+import os
+import time
+import bisect
+import logging
+import threading
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds, from fast DB lookups to slow third-party calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Label combinations beyond this are folded into one overflow series
+MAX_SERIES = 200
+OVERFLOW_LABEL = "__overflow__"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Base for a metric family; children are keyed by their label values"""
+
+    type_name = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+            self._children[()] = self._default
+        (registry or REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **kwargs):
+        """Return the child series for the given label values"""
+        if kwargs:
+            values = tuple(kwargs.get(name, "") for name in self.labelnames)
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    if len(self._children) >= MAX_SERIES:
+                        values = (OVERFLOW_LABEL,) * len(self.labelnames)
+                        child = self._children.get(values)
+                    if child is None:
+                        child = self._new_child()
+                        self._children[values] = child
+        return child
+
+    def _series(self):
+        with self._lock:
+            return list(self._children.items())
+
+    def collect(self):
+        """Yield exposition lines for this family"""
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type_name}"
+        for values, child in self._series():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"
+
+
+class _Value:
+    __slots__ = ("_value", "_lock", "_function")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+        self._function = None
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value):
+        with self._lock:
+            self._value = float(value)
+
+    def set_function(self, function):
+        """Read the value from a callable at collection time"""
+        self._function = function
+
+    def get(self):
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception:
+                return float("nan")
+        return self._value
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    type_name = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def get(self):
+        return self._default.get()
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be read from a callable"""
+
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def set_function(self, function):
+        self._default.set_function(function)
+
+    def get(self):
+        return self._default.get()
+
+
+class _HistogramValue:
+    __slots__ = ("_upper_bounds", "_counts", "_sum", "_lock")
+
+    def __init__(self, upper_bounds):
+        self._upper_bounds = upper_bounds
+        self._counts = [0] * (len(upper_bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self):
+        return _Timer(self.observe)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._counts), self._sum
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self._upper_bounds = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self._upper_bounds)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        """Context manager / decorator observing the elapsed time in seconds"""
+        return self._default.time()
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type_name}"
+        bounds = self._upper_bounds + (float("inf"),)
+        for values, child in self._series():
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class _Timer:
+    def __init__(self, observe):
+        self._observe = observe
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._observe(time.perf_counter() - self._start)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class Registry:
+    """Collection of metric families rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicate metric: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+def render():
+    """Exposition text for the default registry"""
+    return REGISTRY.render()
+
+def time_function(histogram, label_func=None, errors=None):
+    """
+    Decorator observing a function's duration into a histogram.
+
+    label_func receives the call's arguments and returns the label values,
+    e.g. the callback action of a Telegram callback query. When an errors
+    counter with the same labels is given, calls that raise are counted there.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            labels = label_func(*args, **kwargs) if label_func else ()
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    (errors.labels(*labels) if labels else errors).inc()
+                raise
+            finally:
+                child = histogram.labels(*labels) if labels else histogram
+                child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+# ---------------------------------------------------------------------------
+# Application metrics
+# ---------------------------------------------------------------------------
+
+PROCESS_START_TIME = Gauge("process_start_time_seconds", "Start time of the process since unix epoch in seconds")
+PROCESS_START_TIME.set(time.time())
+
+ORDERS_CREATED = Counter("premium_bot_orders_created_total", "Orders created from the bot")
+PAYMENTS_CONFIRMED = Counter("premium_bot_payments_confirmed_total", "Orders moved to PAYMENT_RECEIVED by a payment event")
+PAYMENT_EVENTS = Counter("premium_bot_payment_events_total", "Payment status updates by pipeline outcome", ["outcome"])
+
+IPN_REQUESTS = Counter("premium_bot_ipn_requests_total", "Payment webhook requests by HTTP status", ["status"])
+IPN_LATENCY = Histogram("premium_bot_ipn_request_seconds", "Payment webhook handling time")
+
+CALLBACK_LATENCY = Histogram("premium_bot_callback_query_seconds", "Callback query handling time by action", ["action"])
+CALLBACK_ERRORS = Counter("premium_bot_callback_query_errors_total", "Callback queries that raised, by action", ["action"])
+CALLBACK_ACK_LATENCY = Histogram("premium_bot_callback_ack_seconds", "Time from receiving a callback query to answering it, by action and where it was answered", ["action", "source"])
+USERNAME_STEP_LATENCY = Histogram("premium_bot_username_step_seconds", "Username step (order and payment creation) handling time")
+
+TELEGRAM_REQUEST_LATENCY = Histogram("premium_bot_telegram_request_seconds", "Telegram Bot API call time by method", ["method"])
+TELEGRAM_HTTP_LATENCY = Histogram("premium_bot_telegram_http_seconds", "Time of each HTTP attempt of a Bot API call, by method and HTTP status (error when there was no response)", ["method", "status"])
+TELEGRAM_HTTP_RETRIES = Counter("premium_bot_telegram_http_retries_total", "Bot API calls retried by the HTTP transport, by method and reason", ["method", "reason"])
+TELEGRAM_ERRORS = Counter("premium_bot_telegram_errors_total", "Failed Telegram Bot API calls by method and error code", ["method", "code"])
+BOT_LEADER = Gauge("premium_bot_leader", "1 while this bot replica holds the polling leader lock")
+UPDATE_QUEUE_WAIT = Histogram("premium_bot_update_queue_wait_seconds", "Time updates spend in the shared update queue before a replica claims them")
+TELEGRAM_UPDATES_SKIPPED = Counter("premium_bot_telegram_updates_skipped_total", "Updates dropped before parsing because no handler takes them, by update type", ["type"])
+TELEGRAM_WEBHOOK_DROPPED = Counter("premium_bot_telegram_webhook_dropped_total", "Webhook requests dropped before processing, by reason", ["reason"])
+TELEGRAM_WEBHOOK_REPLIES = Counter("premium_bot_telegram_webhook_replies_total", "Bot API calls returned in the webhook response instead of sent, by method", ["method"])
+SEND_WAIT = Histogram("premium_bot_send_wait_seconds", "Time outgoing messages waited for the send rate limits, by lane", ["lane"])
+SEND_WAITING = Gauge("premium_bot_send_waiting", "Outgoing messages currently waiting for the send rate limits, by lane", ["lane"])
+SEND_BUDGET_FULL = Counter("premium_bot_send_budget_full_total", "Sends that found the second's shared send budget used up and waited, by lane", ["lane"])
+SEND_RETRIES = Counter("premium_bot_send_retries_total", "Outgoing messages retried after a 429 from Telegram, by lane", ["lane"])
+
+NOWPAYMENTS_REQUEST_LATENCY = Histogram("premium_bot_nowpayments_request_seconds", "NowPayments API call time by endpoint", ["method", "endpoint"])
+NOWPAYMENTS_ERRORS = Counter("premium_bot_nowpayments_errors_total", "Failed NowPayments API calls by endpoint", ["method", "endpoint"])
+
+DB_POOL_EVENTS = Counter("premium_bot_db_pool_events_total", "Connection pool events", ["event"])
+DB_POOL_CHECKED_OUT = Gauge("premium_bot_db_pool_checked_out", "Connections currently checked out of the pool")
+DB_POOL_SIZE = Gauge("premium_bot_db_pool_size", "Configured connection pool size")
+
+# ---------------------------------------------------------------------------
+# Standalone exporter for processes without a web server (start_bot.py)
+# ---------------------------------------------------------------------------
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    # Extra GET routes (path -> callable returning (status, content_type, body))
+    routes = {}
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            status, content_type, body = 200, CONTENT_TYPE, render()
+        elif path in self.routes:
+            status, content_type, body = self.routes[path](self)
+        else:
+            status, content_type, body = 404, "text/plain", "Not found\n"
+
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics %s - " + format, self.address_string(), *args)
+
+_server = None
+
+def start_http_server(port=None, host=None):
+    """Serve /metrics from a daemon thread; returns the server or None if disabled"""
+    global _server
+    if _server is not None:
+        return _server
+
+    port = int(port if port is not None else os.environ.get("METRICS_PORT", 9101))
+    host = host or os.environ.get("METRICS_HOST", "127.0.0.1")
+    if not port:
+        return None
+
+    _server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Metrics server listening on %s:%s", host, port)
+    return _server
@@ -1,34 +1,103 @@
-from app import app, db
-from alembic import op
-import sqlalchemy as sa
-from sqlalchemy.sql import text
+#!/usr/bin/env python3
+"""
+Database migrations, run once per deploy before the web workers and the bot start.
 
-# Add new columns to AdminUser model
-with app.app_context():
+    python migrate.py            upgrade to the latest revision and create the default admin
+    python migrate.py check      exit 1 unless the database is at the revision this code expects
+    python migrate.py current    print the database's revision
+
+Revisions live in migrations/versions. A database created by the old
+db.create_all() start-up (no alembic_version table) is stamped with the
+initial revision first, so only the later revisions run against it.
+"""
+
+import os
+import sys
+
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, inspect, pool
+from sqlalchemy.orm import Session
+from werkzeug.security import generate_password_hash
+
+import database
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BASELINE_REVISION = "0001"
+
+def alembic_config():
+    """Alembic config that works from any working directory"""
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+    config.set_main_option("sqlalchemy.url", database.DATABASE_URL.replace("%", "%%"))
+    return config
+
+def head_revision(config=None):
+    return ScriptDirectory.from_config(config or alembic_config()).get_current_head()
+
+def _engine():
+    return create_engine(database.DATABASE_URL, poolclass=pool.NullPool)
+
+def upgrade(revision="head"):
+    """Bring the schema up to date, stamping databases built by create_all first"""
+    config = alembic_config()
+    engine = _engine()
+    try:
+        tables = set(inspect(engine).get_table_names())
+    finally:
+        engine.dispose()
+    if "alembic_version" not in tables and "user" in tables:
+        print(f"Existing schema without version table, stamping {BASELINE_REVISION}")
+        command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, revision)
+
+def ensure_default_admin():
+    """Create the admin/admin web user if no admin exists yet"""
+    from models import AdminUser
+    engine = _engine()
     try:
-        # Check if column exists first
-        conn = db.engine.connect()
-        result = conn.execute(text("SELECT column_name FROM information_schema.columns WHERE table_name='admin_user' AND column_name='api_key_hash'"))
-        if result.rowcount == 0:
-            print("Adding api_key_hash column to admin_user table...")
-            conn.execute(text("ALTER TABLE admin_user ADD COLUMN api_key_hash VARCHAR(256)"))
-            conn.commit()
-            print("Added api_key_hash column successfully!")
-        else:
-            print("Column api_key_hash already exists in admin_user table.")
-
-        # Add updated_at column if it doesn't exist
-        result = conn.execute(text("SELECT column_name FROM information_schema.columns WHERE table_name='admin_user' AND column_name='updated_at'"))
-        if result.rowcount == 0:
-            print("Adding updated_at column to admin_user table...")
-            conn.execute(text("ALTER TABLE admin_user ADD COLUMN updated_at TIMESTAMP DEFAULT NOW()"))
-            conn.commit()
-            print("Added updated_at column successfully!")
-        else:
-            print("Column updated_at already exists in admin_user table.")
-            
-        conn.close()
+        with Session(engine) as session:
+            if session.query(AdminUser).filter_by(username="admin").first():
+                return False
+            session.add(AdminUser(
+                username="admin",
+                password_hash=generate_password_hash("admin"),  # Change this in production
+                is_super_admin=True
+            ))
+            session.commit()
+            print("Default admin user created: admin/admin")
+            return True
+    finally:
+        engine.dispose()
+
+def check():
+    """Compare the database revision with the one this code expects"""
+    head = head_revision()
+    if head != database.SCHEMA_REVISION:
+        print(f"database.SCHEMA_REVISION is {database.SCHEMA_REVISION} but the latest migration is {head}")
+        return 1
+    current = database.schema_revision(_engine())
+    if current != head:
+        print(f"Database is at revision {current}, expected {head}; run: python migrate.py")
+        return 1
+    print(f"Database schema is up to date ({head})")
+    return 0
+
+def main(argv):
+    action = argv[1] if len(argv) > 1 else "upgrade"
+    if action == "upgrade":
+        upgrade()
+        ensure_default_admin()
         print("Migration completed successfully!")
-        
-    except Exception as e:
-        print(f"Error during migration: {str(e)}")
\ No newline at end of file
+        return 0
+    if action == "check":
+        return check()
+    if action == "current":
+        print(database.schema_revision(_engine()) or "none")
+        return 0
+    print(__doc__)
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,53 @@
+"""
+Alembic environment.
+
+Connects with a plain SQLAlchemy engine built from DATABASE_URL rather than
+through the Flask app, so migrating doesn't start the web app. On PostgreSQL
+an advisory lock serializes concurrent runs (e.g. two deploys at once).
+"""
+
+from alembic import context
+from sqlalchemy import create_engine, pool, text
+
+import database
+import models  # noqa: F401  (registers the tables on the metadata)
+
+# Arbitrary key for pg_advisory_lock, shared by every migration run
+MIGRATION_LOCK_ID = 724_040
+
+config = context.config
+target_metadata = database.db.metadata
+
+def database_url():
+    return config.get_main_option("sqlalchemy.url") or database.DATABASE_URL
+
+def run_migrations_offline():
+    context.configure(url=database_url(), target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    engine = create_engine(database_url(), poolclass=pool.NullPool)
+    with engine.connect() as connection:
+        is_postgres = connection.dialect.name == "postgresql"
+        if is_postgres:
+            connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            connection.commit()
+        try:
+            context.configure(
+                connection=connection,
+                target_metadata=target_metadata,
+                render_as_batch=connection.dialect.name == "sqlite",
+            )
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            if is_postgres:
+                connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+                connection.commit()
+    engine.dispose()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,92 @@
+"""Initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 00:00:00
+
+Tables as they were before versioned migrations, when db.create_all() built
+them. Databases created that way are stamped with this revision by
+migrate.py instead of running it.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "user",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("telegram_id", sa.String(50), nullable=False, unique=True),
+        sa.Column("username", sa.String(100)),
+        sa.Column("first_name", sa.String(100)),
+        sa.Column("last_name", sa.String(100)),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+    )
+    op.create_table(
+        "admin_user",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(100), nullable=False, unique=True),
+        sa.Column("password_hash", sa.String(256), nullable=False),
+        sa.Column("is_super_admin", sa.Boolean()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_table(
+        "order",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("order_id", sa.String(50), nullable=False, unique=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), nullable=False),
+        sa.Column("plan_id", sa.String(50), nullable=False),
+        sa.Column("plan_name", sa.String(100), nullable=False),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("currency", sa.String(10)),
+        sa.Column("status", sa.String(50), nullable=False),
+        sa.Column("telegram_username", sa.String(100), nullable=False),
+        sa.Column("admin_notes", sa.Text()),
+        sa.Column("payment_id", sa.String(100)),
+        sa.Column("payment_url", sa.String(255)),
+        sa.Column("activation_link", sa.String(255)),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+        sa.Column("expires_at", sa.DateTime()),
+    )
+    op.create_table(
+        "payment_transaction",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("payment_id", sa.String(100), nullable=False, unique=True),
+        sa.Column("order_id", sa.Integer(), sa.ForeignKey("order.id"), nullable=False),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("currency", sa.String(10)),
+        sa.Column("pay_currency", sa.String(10)),
+        sa.Column("status", sa.String(50), nullable=False),
+        sa.Column("ipn_data", sa.JSON()),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+        sa.Column("completed_at", sa.DateTime()),
+    )
+    op.create_table(
+        "broadcast_message",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("admin_id", sa.Integer(), sa.ForeignKey("admin_user.id"), nullable=False),
+        sa.Column("message_text", sa.Text(), nullable=False),
+        sa.Column("sent_count", sa.Integer()),
+        sa.Column("failed_count", sa.Integer()),
+        sa.Column("status", sa.String(20)),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("completed_at", sa.DateTime()),
+    )
+
+
+def downgrade():
+    op.drop_table("broadcast_message")
+    op.drop_table("payment_transaction")
+    op.drop_table("order")
+    op.drop_table("admin_user")
+    op.drop_table("user")
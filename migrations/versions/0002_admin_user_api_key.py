@@ -0,0 +1,38 @@
+"""Add api_key_hash and updated_at to admin_user
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 00:00:00
+
+Replaces the ad-hoc information_schema probes of the old migrate.py and
+migration.sql. Columns that already exist (databases built by create_all
+after the model gained them) are left alone.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def _columns(table):
+    return {column["name"] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    existing = _columns("admin_user")
+    with op.batch_alter_table("admin_user") as batch:
+        if "api_key_hash" not in existing:
+            batch.add_column(sa.Column("api_key_hash", sa.String(256), nullable=True))
+        if "updated_at" not in existing:
+            batch.add_column(sa.Column("updated_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("admin_user") as batch:
+        batch.drop_column("updated_at")
+        batch.drop_column("api_key_hash")
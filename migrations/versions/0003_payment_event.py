@@ -0,0 +1,34 @@
+"""Add payment_event for IPN deduplication
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases built by create_all may already have the table
+    if sa.inspect(op.get_bind()).has_table("payment_event"):
+        return
+    op.create_table(
+        "payment_event",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("payment_id", sa.String(100), nullable=False),
+        sa.Column("payment_status", sa.String(50), nullable=False),
+        sa.Column("gateway_updated_at", sa.String(50), nullable=False),
+        sa.Column("received_at", sa.DateTime()),
+        sa.UniqueConstraint("payment_id", "payment_status", "gateway_updated_at", name="uq_payment_event"),
+    )
+
+
+def downgrade():
+    op.drop_table("payment_event")
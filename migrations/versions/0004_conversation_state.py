@@ -0,0 +1,34 @@
+"""Add conversation_state for next-step handlers shared across workers
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases built by create_all may already have the table
+    if sa.inspect(op.get_bind()).has_table("conversation_state"):
+        return
+    op.create_table(
+        "conversation_state",
+        sa.Column("chat_id", sa.BigInteger(), primary_key=True, autoincrement=False),
+        sa.Column("handlers", sa.Text(), nullable=False),
+        sa.Column("updated_at", sa.DateTime()),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_conversation_state_expires_at", "conversation_state", ["expires_at"])
+
+
+def downgrade():
+    op.drop_index("ix_conversation_state_expires_at", table_name="conversation_state")
+    op.drop_table("conversation_state")
@@ -0,0 +1,37 @@
+"""Add update_queue for leader-elected polling across bot replicas
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases built by create_all may already have the table
+    if sa.inspect(op.get_bind()).has_table("update_queue"):
+        return
+    op.create_table(
+        "update_queue",
+        sa.Column("update_id", sa.BigInteger(), primary_key=True, autoincrement=False),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column("received_at", sa.DateTime()),
+        sa.Column("claimed_at", sa.DateTime()),
+        sa.Column("claimed_by", sa.String(100)),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("done_at", sa.DateTime()),
+    )
+    op.create_index("ix_update_queue_done_at", "update_queue", ["done_at"])
+
+
+def downgrade():
+    op.drop_index("ix_update_queue_done_at", table_name="update_queue")
+    op.drop_table("update_queue")
@@ -0,0 +1,30 @@
+"""Add send_budget for the Telegram rate budget shared by all processes
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases built by create_all may already have the table
+    if sa.inspect(op.get_bind()).has_table("send_budget"):
+        return
+    op.create_table(
+        "send_budget",
+        sa.Column("slot", sa.BigInteger(), primary_key=True, autoincrement=False),
+        sa.Column("used", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade():
+    op.drop_table("send_budget")
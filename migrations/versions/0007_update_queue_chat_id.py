@@ -0,0 +1,31 @@
+"""Add update_queue.chat_id so a chat's queued updates are handled in order
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # Databases built by create_all may already have the column
+    if "chat_id" in {column["name"] for column in inspector.get_columns("update_queue")}:
+        return
+    with op.batch_alter_table("update_queue") as batch:
+        batch.add_column(sa.Column("chat_id", sa.BigInteger(), nullable=True))
+    op.create_index("ix_update_queue_chat_id", "update_queue", ["chat_id", "update_id"])
+
+
+def downgrade():
+    op.drop_index("ix_update_queue_chat_id", table_name="update_queue")
+    with op.batch_alter_table("update_queue") as batch:
+        batch.drop_column("chat_id")
@@ -1,6 +1,6 @@
 from datetime import datetime
 from flask_login import UserMixin
-from app import db
+from database import db
 
 class User(db.Model):
     """Model representing a Telegram user"""
@@ -87,3 +87,57 @@ class BroadcastMessage(db.Model):
     
     def __repr__(self):
         return f'<BroadcastMessage id={self.id} status={self.status}>'
+
+class PaymentEvent(db.Model):
+    """Model recording each distinct IPN delivery so gateway retries are processed only once"""
+    id = db.Column(db.Integer, primary_key=True)
+    payment_id = db.Column(db.String(100), nullable=False)
+    payment_status = db.Column(db.String(50), nullable=False)
+    gateway_updated_at = db.Column(db.String(50), nullable=False, default='')
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('payment_id', 'payment_status', 'gateway_updated_at', name='uq_payment_event'),
+    )
+    
+    def __repr__(self):
+        return f'<PaymentEvent {self.payment_id} {self.payment_status}>'
+
+class ConversationState(db.Model):
+    """Model holding a chat's pending next-step handlers, shared by every process that handles updates"""
+    __tablename__ = 'conversation_state'
+    chat_id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    handlers = db.Column(db.Text, nullable=False)  # JSON list of {"callback", "args", "kwargs"}
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<ConversationState {self.chat_id}>'
+
+class QueuedUpdate(db.Model):
+    """Model for a Telegram update fetched by the polling leader and waiting for a replica to handle it"""
+    __tablename__ = 'update_queue'
+    update_id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    payload = db.Column(db.Text, nullable=False)  # raw update JSON from getUpdates
+    chat_id = db.Column(db.BigInteger)  # chat (or user) the update comes from; its updates are handled in order
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    claimed_by = db.Column(db.String(100))
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    done_at = db.Column(db.DateTime, index=True)
+    
+    __table_args__ = (
+        db.Index('ix_update_queue_chat_id', 'chat_id', 'update_id'),
+    )
+    
+    def __repr__(self):
+        return f'<QueuedUpdate {self.update_id}>'
+
+class SendBudget(db.Model):
+    """Model counting the Telegram messages all processes sent in one second, for the shared rate budget"""
+    __tablename__ = 'send_budget'
+    slot = db.Column(db.BigInteger, primary_key=True, autoincrement=False)  # unix time in whole seconds
+    used = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<SendBudget {self.slot}: {self.used}>'
@@ -1,19 +1,85 @@
 import os
+import hmac
+import hashlib
 import requests
 import json
+import time
 import logging
 from datetime import datetime
 
+import metrics
+import tracing
+
 logger = logging.getLogger(__name__)
 
+# API base URL; point it at a local simulator (python -m simulators) for offline testing
+NOWPAYMENTS_API_URL = os.environ.get("NOWPAYMENTS_API_URL", "https://api.nowpayments.io/v1")
+
+# Fields every IPN payload must carry
+IPN_REQUIRED_FIELDS = ("payment_id", "payment_status", "pay_address", "price_amount", "price_currency")
+
+# Keyed HMAC templates per IPN secret; copying a template skips re-deriving the key pads
+_ipn_hmac_templates = {}
+
+def _ipn_hmac(secret):
+    template = _ipn_hmac_templates.get(secret)
+    if template is None:
+        template = hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha512)
+        _ipn_hmac_templates.clear()
+        _ipn_hmac_templates[secret] = template
+    return template.copy()
+
+def canonicalize_ipn_body(ipn_data):
+    """
+    Serialize IPN data the way NowPayments signs it: keys sorted recursively, no whitespace,
+    non-ASCII characters as UTF-8 rather than \\u escapes
+    """
+    return json.dumps(ipn_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def verify_ipn_signature(raw_body, signature, ipn_secret, ipn_data=None):
+    """
+    Verify the x-nowpayments-sig header (HMAC-SHA512 of the sorted JSON body).
+    
+    The raw request bytes are tried first: NowPayments posts the body already in
+    canonical form, so the common case needs no parsing or re-serialization. Only
+    when that does not match is the body canonicalized and checked again.
+    """
+    if not signature or not ipn_secret:
+        return False
+        
+    signature = signature.strip().lower()
+    
+    mac = _ipn_hmac(ipn_secret)
+    mac.update(raw_body)
+    if hmac.compare_digest(mac.hexdigest(), signature):
+        return True
+        
+    if ipn_data is None:
+        try:
+            ipn_data = json.loads(raw_body)
+        except ValueError:
+            return False
+            
+    mac = _ipn_hmac(ipn_secret)
+    mac.update(canonicalize_ipn_body(ipn_data))
+    return hmac.compare_digest(mac.hexdigest(), signature)
+
+def has_required_ipn_fields(ipn_data):
+    """Check that an IPN payload carries all the fields we rely on"""
+    for field in IPN_REQUIRED_FIELDS:
+        if field not in ipn_data:
+            logger.warning(f"Missing required field in IPN data: {field}")
+            return False
+    return True
+
 class NowPayments:
     """
     NowPayments API client for handling cryptocurrency payments
     """
     
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, base_url=None):
         self.api_key = api_key or os.environ.get("NOWPAYMENTS_API_KEY")
-        self.base_url = "https://api.nowpayments.io/v1"
+        self.base_url = (base_url or NOWPAYMENTS_API_URL).rstrip("/")
         self.headers = {
             "x-api-key": self.api_key,
             "Content-Type": "application/json"
@@ -24,19 +90,31 @@ class NowPayments:
         Make a request to the NowPayments API
         """
         url = f"{self.base_url}/{endpoint}"
+        # Label by route, not by id: "payment/123" is counted as "payment"
+        endpoint_label = endpoint.split("/", 1)[0]
+        start = time.perf_counter()
         try:
-            if method.lower() == "get":
-                response = requests.get(url, headers=self.headers)
-            elif method.lower() == "post":
-                response = requests.post(url, headers=self.headers, json=data)
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
-                
-            response.raise_for_status()
-            return response.json()
+            with tracing.span(f"nowpayments.{endpoint_label}", method=method.upper()):
+                headers = self.headers
+                traceparent = tracing.traceparent()
+                if traceparent:
+                    headers = dict(headers, traceparent=traceparent)
+                    
+                if method.lower() == "get":
+                    response = requests.get(url, headers=headers)
+                elif method.lower() == "post":
+                    response = requests.post(url, headers=headers, json=data)
+                else:
+                    raise ValueError(f"Unsupported HTTP method: {method}")
+                    
+                response.raise_for_status()
+                return response.json()
         except requests.exceptions.RequestException as e:
-            logger.error(f"Error making {method} request to {endpoint}: {e}")
+            metrics.NOWPAYMENTS_ERRORS.labels(method.upper(), endpoint_label).inc()
+            logger.error("Error making %s request to %s: %s", method, endpoint, e)
             return None
+        finally:
+            metrics.NOWPAYMENTS_REQUEST_LATENCY.labels(method.upper(), endpoint_label).observe(time.perf_counter() - start)
             
     def get_status(self):
         """
@@ -109,19 +187,15 @@ class NowPayments:
         """
         return self._make_request("get", f"min-amount/{currency}")
         
-    def verify_ipn_callback(self, ipn_data):
+    def verify_ipn_callback(self, ipn_data, signature=None, ipn_secret=None, raw_body=None):
         """
         Verify if an IPN (Instant Payment Notification) callback is valid
         """
-        # In a real implementation, you would verify the authenticity of the IPN data
-        # based on NowPayments' documentation
-        
-        required_fields = ["payment_id", "payment_status", "pay_address", "price_amount", "price_currency"]
-        
-        # Check if all required fields are present
-        for field in required_fields:
-            if field not in ipn_data:
-                logger.warning(f"Missing required field in IPN data: {field}")
-                return False
-                
-        return True
+        if not has_required_ipn_fields(ipn_data):
+            return False
+            
+        ipn_secret = ipn_secret or os.environ.get("NOWPAYMENTS_IPN_SECRET")
+        if raw_body is None:
+            raw_body = canonicalize_ipn_body(ipn_data)
+            
+        return verify_ipn_signature(raw_body, signature, ipn_secret, ipn_data)
@@ -0,0 +1,153 @@
+"""
+Payment event pipeline shared by the payment webhook endpoints.
+
+Every status update from the gateway goes through process_payment_event, which
+loads the transaction and its order in one query, checks the update against the
+payment and order state machines and only then writes anything.
+"""
+
+import logging
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+import tracing
+from dedupe import RecentKeySet
+from models import Order, PaymentTransaction, PaymentEvent
+
+logger = logging.getLogger(__name__)
+
+# Legacy status names mapped to their NowPayments equivalent
+STATUS_ALIASES = {
+    "COMPLETED": "FINISHED",
+    "PARTIALLY-PAID": "PARTIALLY_PAID",
+}
+
+# Allowed payment status transitions; anything else is regressive or illegal
+PAYMENT_TRANSITIONS = {
+    "WAITING": {"CONFIRMING", "CONFIRMED", "SENDING", "PARTIALLY_PAID", "FINISHED", "FAILED", "EXPIRED"},
+    "CONFIRMING": {"CONFIRMED", "SENDING", "PARTIALLY_PAID", "FINISHED", "FAILED"},
+    "PARTIALLY_PAID": {"CONFIRMING", "CONFIRMED", "SENDING", "FINISHED", "FAILED", "EXPIRED"},
+    "CONFIRMED": {"SENDING", "FINISHED", "FAILED"},
+    "SENDING": {"FINISHED", "FAILED"},
+    "FINISHED": {"REFUNDED"},
+    "FAILED": {"REFUNDED"},
+    "EXPIRED": set(),
+    "REFUNDED": set(),
+}
+
+# Payment statuses that mean the customer has paid
+PAID_STATUSES = {"CONFIRMED", "SENDING", "FINISHED"}
+
+# Order statuses from which a confirmed payment moves the order to PAYMENT_RECEIVED
+ORDER_PAYABLE_STATUSES = {"PENDING", "AWAITING_PAYMENT", "ADMIN_REVIEW", "AWAITING_CREDIT", "ERROR"}
+
+# Outcome of a payment event; http_status is what the webhook should answer with
+PaymentEventResult = namedtuple(
+    "PaymentEventResult",
+    ["outcome", "http_status", "message", "transaction", "order", "notify"]
+)
+
+# Recently processed deliveries, keyed on (payment_id, payment_status, updated_at)
+seen_events = RecentKeySet(capacity=4096)
+
+def normalize_status(status):
+    """Normalize a gateway payment status to the upper-case names used in the database"""
+    status = str(status or "").strip().upper()
+    return STATUS_ALIASES.get(status, status)
+
+def can_transition_payment(current, new):
+    """Check whether a payment may move from its current status to a new one"""
+    current = normalize_status(current)
+    if current not in PAYMENT_TRANSITIONS:
+        # Unknown legacy values never block a known status
+        return new in PAYMENT_TRANSITIONS
+    return new in PAYMENT_TRANSITIONS[current]
+
+def load_transaction_with_order(session, payment_id):
+    """Load a payment transaction and its order in a single round trip"""
+    row = session.execute(
+        select(PaymentTransaction, Order)
+        .join(Order, PaymentTransaction.order_id == Order.id)
+        .where(PaymentTransaction.payment_id == str(payment_id))
+    ).first()
+    if row is None:
+        return None, None
+    return row[0], row[1]
+
+def _result(outcome, http_status, message, transaction=None, order=None, notify=False):
+    metrics.PAYMENT_EVENTS.labels(outcome).inc()
+    return PaymentEventResult(outcome, http_status, message, transaction, order, notify)
+
+@tracing.traced()
+def process_payment_event(session, payment_id, payment_status, ipn_data, gateway_updated_at=""):
+    """
+    Apply a payment status update to its transaction and order.
+
+    Duplicates and transitions the state machines do not allow are answered
+    without any database writes, so the gateway stops retrying them. A new
+    delivery of the status the payment already has is recorded (event row and
+    payload) but leaves the order alone.
+    """
+    status = normalize_status(payment_status)
+    if status not in PAYMENT_TRANSITIONS:
+        return _result("invalid", 400, f"Unknown payment status: {payment_status}")
+
+    event_key = (str(payment_id), status, str(gateway_updated_at or ""))
+    if event_key in seen_events:
+        return _result("duplicate", 200, "Duplicate IPN ignored")
+
+    transaction, order = load_transaction_with_order(session, payment_id)
+    if transaction is None:
+        logger.error("Payment transaction not found: %s", payment_id)
+        return _result("not_found", 404, "Payment transaction not found")
+
+    current = normalize_status(transaction.status)
+    if current != status and not can_transition_payment(current, status):
+        seen_events.add(event_key)
+        logger.warning("Rejected payment transition for %s: %s -> %s", payment_id, current, status)
+        return _result("rejected", 200, f"Transition {current} -> {status} ignored", transaction, order)
+
+    # Record the delivery first; the unique constraint rejects concurrent duplicates
+    try:
+        session.add(PaymentEvent(
+            payment_id=str(payment_id),
+            payment_status=status,
+            gateway_updated_at=event_key[2]
+        ))
+        session.flush()
+    except IntegrityError:
+        session.rollback()
+        seen_events.add(event_key)
+        logger.info("Duplicate IPN ignored: %s %s", payment_id, status)
+        return _result("duplicate", 200, "Duplicate IPN ignored")
+
+    now = datetime.utcnow()
+    transaction.ipn_data = ipn_data
+    transaction.updated_at = now
+    if current == status:
+        # Same status again (e.g. with new confirmations): keep the latest payload only
+        session.commit()
+        seen_events.add(event_key)
+        return _result("unchanged", 200, f"Payment already {status}", transaction, order)
+
+    transaction.status = status
+    notify = False
+    if status in PAID_STATUSES:
+        if transaction.completed_at is None:
+            transaction.completed_at = now
+        if order.status in ORDER_PAYABLE_STATUSES:
+            logger.info("Payment confirmed for order #%s: Status changed from %s to PAYMENT_RECEIVED", order.order_id, order.status)
+            order.status = "PAYMENT_RECEIVED"
+            order.updated_at = now
+            notify = True
+            metrics.PAYMENTS_CONFIRMED.inc()
+
+    session.commit()
+    seen_events.add(event_key)
+    logger.info("Payment status updated: %s %s -> %s", payment_id, current, status)
+
+    return _result("applied", 200, f"Payment updated: {status}", transaction, order, notify)
@@ -60,11 +60,11 @@ pip3 install -r requirements.txt 2>/dev/null || pip3 install pytelegrambotapi te
 # اجرای ربات در حالت پولینگ
 echo -e "\n${GREEN}در حال راه‌اندازی ربات در حالت پولینگ...${NC}"
 echo -e "${YELLOW}توجه: این فرآیند در پس‌زمینه اجرا می‌شود.${NC}"
-echo -e "${YELLOW}برای مشاهده لاگ‌ها: tail -f bot_polling.log${NC}"
-echo -e "${YELLOW}برای توقف ربات: pkill -f start_bot.py${NC}"
+echo -e "${YELLOW}برای مشاهده لاگ‌ها: tail -f logs/bot.log${NC}"
+echo -e "${YELLOW}برای توقف ربات: python3 bot_supervisor.py stop${NC}"
 
-# اجرای ربات در پس‌زمینه و ذخیره لاگ‌ها
-nohup python3 start_bot.py > bot_polling.log 2>&1 &
+# اجرای ربات در پس‌زمینه زیر نظر supervisor (خروجی در logs/bot_output.log)
+python3 bot_supervisor.py start
 
 echo -e "\n${GREEN}ربات با موفقیت در حالت پولینگ راه‌اندازی شد.${NC}"
 echo -e "${BLUE}ربات شما اکنون با نام کاربری تنظیم شده در فایل .env، به پیام‌ها پاسخ می‌دهد.${NC}"
@@ -73,4 +73,4 @@ echo -e "${BLUE}=========================================${NC}"
 # نمایش لاگ‌های اخیر
 sleep 2
 echo -e "\n${YELLOW}لاگ‌های اخیر:${NC}"
-tail -n 10 bot_polling.log
\ No newline at end of file
+tail -n 10 logs/bot.log
\ No newline at end of file
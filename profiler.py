@@ -0,0 +1,225 @@
+"""
+Stack-sampling profiler that can be switched on from the admin panel.
+
+While a session runs, a daemon thread snapshots every other thread's stack
+with sys._current_frames() at a fixed interval and counts identical stacks.
+The result is written in collapsed-stack format ("frame;frame;frame count"),
+which flamegraph.pl, speedscope and inferno read directly.
+
+Sessions are local to a process, and the admin request lands on any one
+gunicorn worker, so start and stop are not applied directly: the admin panel
+stores them as a request in the shared config file. Every process watching
+that target (each web worker, or the bot) picks it up on its next config
+check and writes its own profile to the same directory, where the admin
+panel lists them for download.
+"""
+
+import os
+import sys
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime
+
+import config_manager
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join("logs", "profiles"))
+MAX_DURATION = 300
+MIN_INTERVAL_MS = 1
+DEFAULT_INTERVAL_MS = 10
+
+# Config key holding the pending profiling request for another process
+REQUEST_KEY = "profiler_request"
+
+# Requests older than this are ignored, so a restart doesn't replay an old one
+REQUEST_MAX_AGE = 300
+
+_session = None
+_session_lock = threading.Lock()
+_handled_request_id = None
+
+
+class ProfilerBusy(Exception):
+    """A profiling session is already running in this process"""
+
+
+class _Session:
+    def __init__(self, process_name, duration, interval):
+        self.process_name = process_name
+        self.duration = duration
+        self.interval = interval
+        self.started_at = time.time()
+        self.samples = 0
+        self.stacks = {}
+        self.filename = "{}-{}.collapsed".format(
+            process_name, datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+        )
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + self.duration
+        code_labels = {}
+        try:
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        label = code_labels.get(code)
+                        if label is None:
+                            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                            code_labels[code] = label
+                        stack.append(label)
+                        frame = frame.f_back
+                    stack.append(names.get(thread_id, "thread-%d" % thread_id))
+                    key = ";".join(reversed(stack))
+                    self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+                self._stop.wait(self.interval)
+            self._write()
+        except Exception:
+            logger.exception("Sampling profiler failed")
+        finally:
+            _finish(self)
+
+    def _write(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, self.filename)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+        os.replace(tmp_path, path)
+        logger.info("Profile written to %s (%s samples)", path, self.samples)
+
+    def status(self):
+        return {
+            "process": self.process_name,
+            "filename": self.filename,
+            "duration": self.duration,
+            "elapsed": round(time.time() - self.started_at, 1),
+            "samples": self.samples,
+        }
+
+
+def _finish(session):
+    global _session
+    with _session_lock:
+        if _session is session:
+            _session = None
+
+def start(duration, interval_ms=DEFAULT_INTERVAL_MS, process_name="web"):
+    """Start sampling this process for duration seconds; returns the output file name"""
+    global _session
+    duration = max(1, min(int(duration), MAX_DURATION))
+    interval = max(MIN_INTERVAL_MS, int(interval_ms)) / 1000.0
+    with _session_lock:
+        if _session is not None:
+            raise ProfilerBusy("A profiling session is already running")
+        _session = _Session(process_name, duration, interval)
+        _session.start()
+    logger.info("Profiling %s for %ss every %.0f ms", process_name, duration, interval * 1000)
+    return _session.filename
+
+def stop():
+    """Stop the running session early; the partial profile is still written"""
+    with _session_lock:
+        if _session is not None:
+            _session.stop()
+
+def status():
+    """Status of the running session in this process, or None"""
+    session = _session
+    return session.status() if session is not None else None
+
+def list_profiles():
+    """Profiles written by any process, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if not name.endswith(".collapsed"):
+            continue
+        stat = os.stat(os.path.join(PROFILE_DIR, name))
+        profiles.append({
+            "name": name,
+            "size": stat.st_size,
+            "created_at": datetime.fromtimestamp(stat.st_mtime),
+        })
+    profiles.sort(key=lambda profile: profile["created_at"], reverse=True)
+    return profiles
+
+def profile_path(name):
+    """Absolute path of a profile file, or None if the name is not a profile in PROFILE_DIR"""
+    if not name.endswith(".collapsed") or os.path.basename(name) != name:
+        return None
+    path = os.path.abspath(os.path.join(PROFILE_DIR, name))
+    return path if os.path.isfile(path) else None
+
+def request_remote(target, duration, interval_ms=DEFAULT_INTERVAL_MS):
+    """Ask the target's processes ("web" or "bot") to profile themselves on their next config check"""
+    config_manager.set_config_value(REQUEST_KEY, {
+        "id": uuid.uuid4().hex,
+        "action": "start",
+        "target": target,
+        "duration": int(duration),
+        "interval_ms": int(interval_ms),
+        "requested_at": time.time(),
+    })
+
+def request_remote_stop(target):
+    """Ask the target's processes to stop their sessions early"""
+    config_manager.set_config_value(REQUEST_KEY, {
+        "id": uuid.uuid4().hex,
+        "action": "stop",
+        "target": target,
+        "requested_at": time.time(),
+    })
+
+def active_request():
+    """The stored start request while its sessions may still be running, or None"""
+    request = config_manager.get_config_value(REQUEST_KEY)
+    if not isinstance(request, dict) or request.get("action", "start") != "start":
+        return None
+    if time.time() > float(request.get("requested_at", 0)) + float(request.get("duration", 0)):
+        return None
+    return request
+
+def handle_config_request(process_name, session_name=None):
+    """Start or stop a session if the config holds a fresh request addressed to this process"""
+    global _handled_request_id
+    request = config_manager.get_config_value(REQUEST_KEY)
+    if not isinstance(request, dict) or request.get("target") != process_name:
+        return None
+    if request.get("id") == _handled_request_id:
+        return None
+    _handled_request_id = request.get("id")
+    if time.time() - float(request.get("requested_at", 0)) > REQUEST_MAX_AGE:
+        return None
+    if request.get("action") == "stop":
+        stop()
+        return None
+    try:
+        return start(request.get("duration", 30), request.get("interval_ms", DEFAULT_INTERVAL_MS),
+                     session_name or process_name)
+    except ProfilerBusy:
+        logger.warning("Ignoring profiling request: a session is already running")
+        return None
+
+def watch_config_requests(process_name, session_name=None):
+    """Serve profiling requests addressed to this process whenever the config file changes"""
+    config_manager.add_reload_listener(lambda: handle_config_request(process_name, session_name))
@@ -2,4 +2,4 @@
 
 # راه‌اندازی مستقیم ربات بدون نیاز به سرویس سیستمی
 cd ~/premium-bot
-gunicorn --bind 0.0.0.0:5000 --reload main:app
\ No newline at end of file
+python3 migrate.py && gunicorn --bind 0.0.0.0:5000 --reload main:app
\ No newline at end of file
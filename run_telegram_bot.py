@@ -1,47 +1,21 @@
 import os
+import time
 import logging
 import random
 import string
 import telebot
 from telebot import types
 from datetime import datetime, timedelta
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker
 
-# Set up detailed logging
-import os
-from logging.handlers import RotatingFileHandler
-import traceback
 import sys
-
-# Create logs directory if it doesn't exist
-if not os.path.exists('logs'):
-    os.makedirs('logs')
-
-# Configure root logger
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        # Console handler
-        logging.StreamHandler(),
-        # File handler with rotation
-        RotatingFileHandler(
-            'logs/telegram_bot.log',
-            maxBytes=10485760,  # 10MB
-            backupCount=5
-        )
-    ]
-)
+import threading
+import contextvars
+import functools
+import logging_config
 
 # Get logger for this module
 logger = logging.getLogger(__name__)
 
-# Also log all telebot logs
-telebot_logger = logging.getLogger('telebot')
-telebot_logger.setLevel(logging.DEBUG)
-
 # Handle uncaught exceptions
 def handle_exception(exc_type, exc_value, exc_traceback):
     if issubclass(exc_type, KeyboardInterrupt):
@@ -51,16 +25,26 @@ def handle_exception(exc_type, exc_value, exc_traceback):
     
     logger.critical("Uncaught exception", exc_info=(exc_type, exc_value, exc_traceback))
 
-# Install exception handler
-sys.excepthook = handle_exception
-
-logger.info("Starting Telegram bot application")
+def init_bot_process():
+    """
+    Process-wide set-up for running the bot on its own: logging and the
+    uncaught-exception hook. Importing this module does neither, so the web
+    process can import it without side effects.
+    """
+    logging_config.setup_logging('bot')
+    sys.excepthook = handle_exception
+    logger.info("Starting Telegram bot application")
 
 # Import application components
 from config import ORDER_EXPIRATION_HOURS
 import config_manager
 from nowpayments import NowPayments
 from models import User, Order, PaymentTransaction
+from conversation_state import DatabaseHandlerBackend
+from send_scheduler import SendScheduler, SharedBudget, shared_budget_enabled, lane, INTERACTIVE, ADMIN, ANNOUNCEMENT, BROADCAST
+import metrics
+import tracing
+import telegram_transport
 
 # Initialize bot with token from config or environment variable
 BOT_TOKEN = config_manager.get_config_value("bot_token") or os.environ.get("TELEGRAM_BOT_TOKEN")
@@ -68,7 +52,313 @@ if not BOT_TOKEN:
     logger.error("No bot token provided. Set the TELEGRAM_BOT_TOKEN environment variable or configure it in admin panel.")
     exit(1)
 
-bot = telebot.TeleBot(BOT_TOKEN)
+# Bot API endpoint override, e.g. a local simulator or a self-hosted Bot API server
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL")
+if TELEGRAM_API_URL:
+    if "{0}" not in TELEGRAM_API_URL:
+        TELEGRAM_API_URL = TELEGRAM_API_URL.rstrip("/") + "/bot{0}/{1}"
+    telebot.apihelper.API_URL = TELEGRAM_API_URL
+    logger.info("Using Telegram Bot API at %s", TELEGRAM_API_URL.split("/bot")[0])
+
+# Pooled keep-alive connections, per-call timeouts and retries (see telegram_transport.py)
+telegram_transport.install()
+
+class WebhookReply:
+    """
+    A Bot API call held back to be returned in the webhook response.
+    
+    Telegram executes a method call found in the body of the webhook response,
+    which saves the round trip of sending it ourselves. At most one call is
+    held; any other Bot API request made while the update is handled, a newer
+    reply included, sends the held call first. So it is the last reply that
+    ends up in the response, and the user still sees messages in the order the
+    handlers produced them.
+    """
+    
+    def __init__(self):
+        self._held = None
+    
+    def hold(self, method, params, send):
+        self.flush()
+        payload = {"method": method}
+        for key, value in params.items():
+            if value is not None:
+                payload[key] = value.to_dict() if hasattr(value, "to_dict") else value
+        self._held = (payload, send)
+    
+    def flush(self):
+        """Send the held call as a normal request"""
+        held, self._held = self._held, None
+        if held is not None:
+            held[1]()
+    
+    def take(self):
+        """The held call's payload for the webhook response, or None"""
+        held, self._held = self._held, None
+        return held[0] if held is not None else None
+
+# Set while an update from the webhook is handled in webhook-reply mode
+_webhook_reply = contextvars.ContextVar("webhook_reply", default=None)
+
+_api_make_request = telebot.apihelper._make_request
+
+def _make_request_after_held_reply(*args, **kwargs):
+    reply = _webhook_reply.get()
+    if reply is not None:
+        reply.flush()
+    return _api_make_request(*args, **kwargs)
+
+telebot.apihelper._make_request = _make_request_after_held_reply
+
+# Callback ack policy value: the handler answers the query itself
+DEFER_ANSWER = object()
+
+# Update types whose handler list isn't named <type>_handlers
+_HANDLER_LISTS = {"inline_query": "inline_handlers", "chosen_inline_result": "chosen_inline_handlers"}
+
+class PremiumBot(telebot.TeleBot):
+    """TeleBot whose dispatched handlers (including next-step handlers) each run as one database unit of work"""
+    
+    def __init__(self, token, threaded=True, num_threads=2, **kwargs):
+        super().__init__(token, threaded=False, **kwargs)
+        # The worker pool starts its threads on first use instead of at import
+        self.threaded = threaded
+        self._num_threads = num_threads
+        self._worker_pool = None
+        self._worker_pool_lock = threading.Lock()
+        # Health reported to the supervisor's heartbeat (see bot_supervisor.py)
+        self.last_poll = None
+        self.last_task_done = None
+        self._pending = 0
+        self._pending_changed = threading.Condition()
+        # How callback queries are answered before their handler runs, by action (see answer_early)
+        self.callback_acks = {}
+        self._ack_pool = None
+        # Update types and message kinds parse_updates lets through, worked out on first use
+        self._routing = None
+        # Sends are counted against a budget shared with the web workers unless TELEGRAM_SHARED_BUDGET=0
+        self.scheduler = SendScheduler(budget=SharedBudget() if shared_budget_enabled() else None)
+    
+    @property
+    def worker_pool(self):
+        if self._worker_pool is None:
+            with self._worker_pool_lock:
+                if self._worker_pool is None:
+                    self._worker_pool = telebot.util.ThreadPool(self, num_threads=self._num_threads)
+        return self._worker_pool
+    
+    @property
+    def ack_pool(self):
+        """Threads that only answer callback queries, so answers don't queue behind running handlers"""
+        if self._ack_pool is None:
+            with self._worker_pool_lock:
+                if self._ack_pool is None:
+                    self._ack_pool = telebot.util.ThreadPool(self, num_threads=2)
+        return self._ack_pool
+    
+    def process_new_updates(self, updates):
+        # One trace per update; it stays open until the handlers it dispatched finish
+        for update in updates:
+            with tracing.start_trace("telegram_update", update_id=update.update_id):
+                super().process_new_updates([update])
+    
+    def process_new_callback_query(self, new_callback_queries):
+        for call in new_callback_queries:
+            call.received_at = time.perf_counter()
+            self.answer_early(call)
+        super().process_new_callback_query(new_callback_queries)
+    
+    @staticmethod
+    def callback_action(call):
+        """The callback action name: callback_data without its argument"""
+        return (call.data or "").split(":", 1)[0]
+    
+    def answer_early(self, call):
+        """
+        Answer a callback query as it arrives, before its handler is queued.
+        
+        callback_acks maps an action to the answer text, or to a function of
+        the query returning it; unlisted actions get a silent answer. Actions
+        mapped to DEFER_ANSWER are answered by their handler instead, because
+        the toast or alert depends on the outcome.
+        """
+        text = self.callback_acks.get(self.callback_action(call))
+        if callable(text):
+            text = text(call)
+        if text is DEFER_ANSWER or not self._claim_answer(call):
+            return
+        if self.threaded and _webhook_reply.get() is None:
+            self.ack_pool.put(self._send_answer, call, text, False, "early")
+        else:
+            self._send_answer(call, text, False, "early")
+    
+    def answer_callback(self, call, text=None, show_alert=False):
+        """Answer a callback query from its handler; returns False if it was already answered"""
+        if not self._claim_answer(call):
+            return False
+        self._send_answer(call, text, show_alert, "handler")
+        return True
+    
+    def answers_callbacks(self, handler):
+        """Decorator for callback query handlers: answer silently afterwards if nothing else did"""
+        @functools.wraps(handler)
+        def run(call):
+            try:
+                return handler(call)
+            finally:
+                if self._claim_answer(call):
+                    self._send_answer(call, None, False, "after_handler")
+        return run
+    
+    @staticmethod
+    def _claim_answer(call):
+        # A query is claimed by answer_early before its handler is queued, then only the handler's thread touches it
+        if getattr(call, "answered", False):
+            return False
+        call.answered = True
+        return True
+    
+    def _send_answer(self, call, text, show_alert, source):
+        reply = _webhook_reply.get()
+        try:
+            if reply is not None:
+                reply.hold("answerCallbackQuery", dict(callback_query_id=call.id, text=text, show_alert=show_alert or None),
+                           lambda: self.answer_callback_query(call.id, text, show_alert=show_alert))
+            else:
+                self.answer_callback_query(call.id, text, show_alert=show_alert)
+        except Exception as e:
+            # An unanswered query only leaves the spinner up; never fail the handler over it
+            logger.warning("Could not answer callback query %s: %s", call.id, e)
+        received = getattr(call, "received_at", None)
+        if received is not None:
+            metrics.CALLBACK_ACK_LATENCY.labels(self.callback_action(call), source).observe(time.perf_counter() - received)
+    
+    def _exec_task(self, task, *args, **kwargs):
+        # Regular handlers all go through _run_middlewares_and_handler, so name their span by update type
+        span_name = kwargs.get("update_type") or getattr(task, "__name__", "task")
+        task = self._counted(tracing.bind(db_unit_of_work(task), name=span_name))
+        if _webhook_reply.get() is None:
+            super()._exec_task(task, *args, **kwargs)
+            return
+        
+        # Webhook-reply mode: run in the request thread so the reply can go back in the response
+        try:
+            task(*args, **kwargs)
+        except Exception as e:
+            if not self._handle_exception(e):
+                raise
+    
+    def _counted(self, task):
+        with self._pending_changed:
+            self._pending += 1
+        
+        def run(*args, **kwargs):
+            try:
+                return task(*args, **kwargs)
+            finally:
+                with self._pending_changed:
+                    self._pending -= 1
+                    self.last_task_done = time.time()
+                    self._pending_changed.notify_all()
+        return run
+    
+    def get_updates(self, offset=None, limit=None, timeout=20, allowed_updates=None, long_polling_timeout=20):
+        json_updates = telebot.apihelper.get_updates(
+            self.token, offset=offset, limit=limit, timeout=timeout, allowed_updates=allowed_updates,
+            long_polling_timeout=long_polling_timeout)
+        self.last_poll = time.time()
+        # Skipped updates still move the polling offset on
+        if json_updates:
+            self.last_update_id = max(self.last_update_id, json_updates[-1]["update_id"])
+        return self.parse_updates(json_updates)
+    
+    def allowed_updates(self):
+        """Update types some handler is registered for, for getUpdates/setWebhook"""
+        return [kind for kind in telebot.util.update_types
+                if kind == "message" or getattr(self, _HANDLER_LISTS.get(kind, f"{kind}_handlers"), None)]
+    
+    def parse_updates(self, json_updates):
+        """
+        Build Update objects for the raw updates a handler could take.
+        
+        Telegram may still deliver other types (e.g. a webhook set before
+        allowed_updates was passed), and most plain messages go nowhere: every
+        message handler here is a command, so a message only matters if it is
+        a command or its chat waits for a next-step reply. Everything else is
+        dropped by peeking at the dict, before telebot builds the object graph.
+        """
+        if self.update_listener:
+            # Listeners see every update
+            return [telebot.types.Update.de_json(raw) for raw in json_updates]
+        if self._routing is None:
+            # Handlers are all registered when this module is imported, before any update arrives
+            self._routing = (frozenset(self.allowed_updates()),
+                             all("commands" in handler["filters"] for handler in self.message_handlers))
+        allowed, commands_only = self._routing
+        updates = []
+        for raw in json_updates:
+            kind = next((key for key in raw if key != "update_id"), None)
+            wanted = kind in allowed
+            if wanted and kind == "message" and commands_only:
+                wanted = self._may_handle_message(raw["message"])
+            if wanted:
+                updates.append(telebot.types.Update.de_json(raw))
+            else:
+                metrics.TELEGRAM_UPDATES_SKIPPED.labels(kind or "unknown").inc()
+        return updates
+    
+    def _may_handle_message(self, message):
+        if str(message.get("text", "")).startswith("/"):
+            return True
+        # Backends expose .handlers only when it can be checked without consuming the step
+        pending = getattr(self.next_step_backend, "handlers", None)
+        return pending is None or message.get("chat", {}).get("id") in pending
+    
+    def health(self):
+        """Polling and handler progress for the supervisor's heartbeat"""
+        with self._pending_changed:
+            pending = self._pending
+        return {"last_poll": self.last_poll, "last_task_done": self.last_task_done, "pending": pending}
+    
+    def drain(self, timeout):
+        """Wait until dispatched handlers finish and the messages they queued are sent; False at the timeout"""
+        deadline = time.monotonic() + timeout
+        with self._pending_changed:
+            if not self._pending_changed.wait_for(lambda: self._pending == 0, timeout):
+                return False
+        return self.scheduler.flush(max(0.0, deadline - time.monotonic()))
+    
+    def _timed_api_call(self, method, func, *args, **kwargs):
+        """Call a Bot API method, recording its latency and failures"""
+        start = time.perf_counter()
+        try:
+            with tracing.span(f"telegram.{method}"):
+                return func(*args, **kwargs)
+        except telebot.apihelper.ApiTelegramException as e:
+            metrics.TELEGRAM_ERRORS.labels(method, e.error_code).inc()
+            raise
+        except Exception:
+            metrics.TELEGRAM_ERRORS.labels(method, "network").inc()
+            raise
+        finally:
+            metrics.TELEGRAM_REQUEST_LATENCY.labels(method).observe(time.perf_counter() - start)
+    
+    def send_message(self, chat_id, text, *args, on_error=None, **kwargs):
+        # Waits for the chat's and the bot's send rate limits, or queues admin alerts (see send_scheduler.py);
+        # on_error(exception) is called if a queued message can't be sent
+        return self.scheduler.send(chat_id, self._timed_api_call, "sendMessage", super().send_message,
+                                   chat_id, text, *args, on_error=on_error, **kwargs)
+    
+    def edit_message_text(self, *args, **kwargs):
+        # Edits only count against the bot-wide limit, so an admin reviewing orders isn't held to the group rate
+        return self.scheduler.call(None, self._timed_api_call, "editMessageText", super().edit_message_text,
+                                   *args, **kwargs)
+    
+    def answer_callback_query(self, *args, **kwargs):
+        return self._timed_api_call("answerCallbackQuery", super().answer_callback_query, *args, **kwargs)
+
+# Next-step handlers live in the database so any worker can take the user's reply
+bot = PremiumBot(BOT_TOKEN, next_step_backend=DatabaseHandlerBackend())
 
 # Initialize NowPayments API client using key from config or environment
 NOWPAYMENTS_API_KEY = config_manager.get_config_value("nowpayments_api_key") or os.environ.get("NOWPAYMENTS_API_KEY")
@@ -77,16 +367,42 @@ nowpayments_api = NowPayments(NOWPAYMENTS_API_KEY)
 if not NOWPAYMENTS_API_KEY:
     logger.warning("No NowPayments API key provided. Payment functionality will not work.")
 
-# Database setup
-DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///telegram_premium.db")
-engine = create_engine(DATABASE_URL)
-db_session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+# Database setup: share the web app's engine and pool instead of opening a second one
+import database
+db_session = database.create_scoped_session()
+db_unit_of_work = database.unit_of_work(db_session)
 
 # Helper functions
+def send_reply(chat_id, text, **kwargs):
+    """
+    Send the message that answers the update being handled.
+    
+    In webhook-reply mode the message goes back in the webhook response
+    instead of a separate sendMessage request. Nothing is returned, so use
+    bot.send_message when the sent Message is needed (e.g. for a next-step
+    handler).
+    """
+    reply = _webhook_reply.get()
+    if reply is None:
+        bot.send_message(chat_id, text, **kwargs)
+    else:
+        reply.hold("sendMessage", dict(chat_id=chat_id, text=text, **kwargs),
+                   lambda: bot.send_message(chat_id, text, **kwargs))
+
+def edit_reply(text, chat_id, message_id, **kwargs):
+    """Like send_reply, for editMessageText on the message a callback came from"""
+    reply = _webhook_reply.get()
+    if reply is None:
+        bot.edit_message_text(text, chat_id, message_id, **kwargs)
+    else:
+        reply.hold("editMessageText", dict(text=text, chat_id=chat_id, message_id=message_id, **kwargs),
+                   lambda: bot.edit_message_text(text, chat_id, message_id, **kwargs))
+
 def generate_order_id():
     """Generate a random 5-digit order ID"""
     return ''.join(random.choices(string.digits, k=5))
 
+@tracing.traced()
 def get_or_create_user(message):
     """Get or create user from message"""
     telegram_id = str(message.from_user.id)
@@ -101,7 +417,7 @@ def get_or_create_user(message):
         )
         db_session.add(user)
         db_session.commit()
-        logger.info(f"Created new user: {user.username}")
+        logger.info("Created new user: %s", user.username)
     else:
         # Update user info if needed
         if user.username != message.from_user.username or \
@@ -112,7 +428,7 @@ def get_or_create_user(message):
             user.last_name = message.from_user.last_name
             user.updated_at = datetime.utcnow()
             db_session.commit()
-            logger.info(f"Updated user: {user.username}")
+            logger.info("Updated user: %s", user.username)
             
     return user
 
@@ -150,7 +466,7 @@ def create_subscription_required_message(chat_id, required_channel):
         "After joining, click the \"Check Subscription\" button below."
     )
     
-    bot.send_message(chat_id, subscription_text, parse_mode="Markdown", reply_markup=markup)
+    send_reply(chat_id, subscription_text, parse_mode="Markdown", reply_markup=markup)
     return
 
 def check_channel_subscription(user_id):
@@ -177,7 +493,7 @@ def check_channel_subscription(user_id):
         # Check if user is a member, creator, or administrator of the channel
         return chat_member.status in ['member', 'creator', 'administrator']
     except Exception as e:
-        logger.error(f"Error checking channel subscription: {str(e)}")
+        logger.error("Error checking channel subscription: %s", e)
         # If there's an error (e.g., bot is not in the channel), don't block the user
         return True
 
@@ -290,7 +606,7 @@ def handle_start(message):
             plans_button = types.InlineKeyboardButton("📱 View Plans", callback_data="show_plans")
             markup.add(plans_button)
             
-            bot.send_message(message.chat.id, features_text, parse_mode="Markdown", reply_markup=markup)
+            send_reply(message.chat.id, features_text, parse_mode="Markdown", reply_markup=markup)
             return
         
         elif param == 'support':
@@ -321,7 +637,7 @@ def handle_start(message):
         "Please select an option from the menu below:"
     )
     
-    bot.send_message(message.chat.id, welcome_text, reply_markup=create_main_menu())
+    send_reply(message.chat.id, welcome_text, reply_markup=create_main_menu())
 
 @bot.message_handler(commands=['plans'])
 def handle_plans(message):
@@ -342,7 +658,7 @@ def handle_plans(message):
     
     plans_text += "Select a plan to proceed with your purchase:"
     
-    bot.send_message(message.chat.id, plans_text, parse_mode="Markdown", reply_markup=create_plans_menu())
+    send_reply(message.chat.id, plans_text, parse_mode="Markdown", reply_markup=create_plans_menu())
 
 @bot.message_handler(commands=['orders', 'myorders'])
 def handle_my_orders(message):
@@ -395,7 +711,7 @@ def handle_my_orders(message):
         back_button = types.InlineKeyboardButton("🔙 Back to Main Menu", callback_data="back_to_main")
         markup.add(back_button)
         
-        bot.send_message(message.chat.id, orders_text, parse_mode="Markdown", reply_markup=markup)
+        send_reply(message.chat.id, orders_text, parse_mode="Markdown", reply_markup=markup)
     else:
         # No orders found
         markup = types.InlineKeyboardMarkup()
@@ -404,7 +720,7 @@ def handle_my_orders(message):
         markup.add(plans_button)
         markup.add(back_button)
         
-        bot.send_message(
+        send_reply(
             message.chat.id,
             "🛒 *Your Orders*\n\nYou don't have any orders yet. Browse our subscription plans to make a purchase!",
             parse_mode="Markdown",
@@ -432,7 +748,7 @@ def handle_help(message):
         "If you have any questions, use the /support command to contact our team."
     )
     
-    bot.send_message(message.chat.id, help_text, parse_mode="Markdown")
+    send_reply(message.chat.id, help_text, parse_mode="Markdown")
 
 @bot.message_handler(commands=['support'])
 def handle_support(message):
@@ -444,7 +760,7 @@ def handle_support(message):
         "We're here to assist you with any questions or issues you may have regarding your Telegram Premium subscription purchase."
     )
     
-    bot.send_message(message.chat.id, support_text, parse_mode="Markdown")
+    send_reply(message.chat.id, support_text, parse_mode="Markdown")
 
 @bot.message_handler(commands=['admin'])
 def handle_admin(message):
@@ -456,19 +772,42 @@ def handle_admin(message):
             "Welcome to the admin panel. Please select an option below:"
         )
         
-        bot.send_message(message.chat.id, admin_text, parse_mode="Markdown", reply_markup=create_admin_menu())
+        send_reply(message.chat.id, admin_text, parse_mode="Markdown", reply_markup=create_admin_menu())
     else:
-        bot.send_message(message.chat.id, "⛔ You don't have permission to access the admin panel.")
+        send_reply(message.chat.id, "⛔ You don't have permission to access the admin panel.")
 
 # Callback query handlers
+def callback_action(call):
+    """Metric label for a callback query: the action name without its argument"""
+    return (bot.callback_action(call),)
+
+def is_channel_message(message):
+    return bool(message and getattr(message, 'sender_chat', None) and message.sender_chat.type == 'channel')
+
+def _defer_in_channel(call):
+    # Admin buttons in the admin channel answer with a toast once the order is found
+    return DEFER_ANSWER if is_channel_message(call.message) else None
+
+# Callback queries are answered on arrival (see PremiumBot.answer_early); these need more than a silent answer
+bot.callback_acks.update({
+    "check_subscription": DEFER_ANSWER,
+    "payment_confirmed": DEFER_ANSWER,
+    "confirm_plan": "Plan selected!",
+    "review_order": _defer_in_channel,
+    "approve_order": _defer_in_channel,
+    "reject_order": _defer_in_channel,
+})
+
 @bot.callback_query_handler(func=lambda call: True)
+@metrics.time_function(metrics.CALLBACK_LATENCY, callback_action, errors=metrics.CALLBACK_ERRORS)
+@bot.answers_callbacks
 def handle_callback_query(call):
     if call.data == "check_subscription":
         # Check if user is subscribed to the required channel
         if check_channel_subscription(call.from_user.id):
             # User is subscribed, show the main menu
-            bot.answer_callback_query(call.id, "✅ Subscription confirmed!")
-            bot.edit_message_text(
+            bot.answer_callback(call, "✅ Subscription confirmed!")
+            edit_reply(
                 "Welcome to the Telegram Premium Subscription Bot.\nPlease select an option from the menu below:",
                 call.message.chat.id,
                 call.message.message_id,
@@ -481,10 +820,10 @@ def handle_callback_query(call):
             if not channel_name.startswith('@') and not channel_name.startswith('-100'):
                 channel_name = f"@{channel_name}"
                 
-            bot.answer_callback_query(call.id, "⚠️ You haven't joined the channel yet!", show_alert=True)
+            bot.answer_callback(call, "⚠️ You haven't joined the channel yet!", show_alert=True)
             
     elif call.data == "show_plans":
-        bot.edit_message_text(
+        edit_reply(
             "📱 *Available Subscription Plans*\n\nSelect a plan to proceed with your purchase:",
             call.message.chat.id,
             call.message.message_id,
@@ -493,7 +832,7 @@ def handle_callback_query(call):
         )
     
     elif call.data == "back_to_main":
-        bot.edit_message_text(
+        edit_reply(
             "Welcome to the Telegram Premium Subscription Bot.\nPlease select an option from the menu below:",
             call.message.chat.id,
             call.message.message_id,
@@ -523,7 +862,7 @@ def handle_callback_query(call):
             )
             db_session.add(user)
             db_session.commit()
-            logger.info(f"Created new user from callback: {user.username}")
+            logger.info("Created new user from callback: %s", user.username)
             
         # Get user's orders from the database
         orders = db_session.query(Order).filter_by(user_id=user.id).order_by(Order.created_at.desc()).all()
@@ -681,8 +1020,6 @@ def handle_callback_query(call):
         
         if plan:
             # Store the selected plan in user state
-            bot.answer_callback_query(call.id, "Plan selected!")
-            
             # Ask for username
             username_request = (
                 "Please enter the Telegram username (with @) for which you want to activate Premium:\n\n"
@@ -708,12 +1045,12 @@ def handle_callback_query(call):
             
             # Register the next step handler with improved error handling
             try:
-                logger.info(f"Registering next step handler for plan {plan_id}")
+                logger.info("Registering next step handler for plan %s", plan_id)
                 bot.register_next_step_handler(sent_msg, process_username_step, plan_id=plan_id)
                 # Send a debug message
-                logger.debug(f"Handler registered successfully for message ID {sent_msg.message_id}")
+                logger.debug("Handler registered successfully for message ID %s", sent_msg.message_id)
             except Exception as e:
-                logger.error(f"Error registering handler: {e}")
+                logger.error("Error registering handler: %s", e)
                 # Fallback mechanism in case of registration error
                 bot.send_message(
                     call.message.chat.id,
@@ -797,7 +1134,7 @@ def handle_callback_query(call):
                 # Check if this is from a channel message
                 if hasattr(call.message, 'sender_chat') and call.message.sender_chat and call.message.sender_chat.type == 'channel':
                     # For channel messages, we just acknowledge and open in private chat
-                    bot.answer_callback_query(call.id, "🔍 Opening order details in private chat...")
+                    bot.answer_callback(call, "🔍 Opening order details in private chat...")
                     
                     # Create buttons for private chat
                     markup = types.InlineKeyboardMarkup(row_width=2)
@@ -842,7 +1179,7 @@ def handle_callback_query(call):
                 if hasattr(call.message, 'sender_chat') and call.message.sender_chat and call.message.sender_chat.type == 'channel':
                     # When in a channel, we can't edit message and use next_step_handler
                     # So we send a direct message to the admin instead
-                    bot.answer_callback_query(call.id, "✅ Opening order approval in private chat...")
+                    bot.answer_callback(call, "✅ Opening order approval in private chat...")
                     
                     # Send a new message to the admin's private chat
                     activation_request = (
@@ -896,7 +1233,7 @@ def handle_callback_query(call):
                 if hasattr(call.message, 'sender_chat') and call.message.sender_chat and call.message.sender_chat.type == 'channel':
                     # When in a channel, we can't edit message and use next_step_handler
                     # So we send a direct message to the admin instead
-                    bot.answer_callback_query(call.id, "❌ Opening order rejection in private chat...")
+                    bot.answer_callback(call, "❌ Opening order rejection in private chat...")
                     
                     # Send a new message to the admin's private chat
                     rejection_request = (
@@ -1031,7 +1368,7 @@ def handle_callback_query(call):
         
         # Extract order ID from callback data
         order_id = call.data.split(':')[1]
-        logger.info(f"Payment confirmation received for order #{order_id}")
+        logger.info("Payment confirmation received for order #%s", order_id)
         
         # Find the specific order
         order = db_session.query(Order).filter_by(
@@ -1041,7 +1378,7 @@ def handle_callback_query(call):
         
         if not order:
             # Try to find by user as fallback
-            logger.warning(f"Order #{order_id} not found, trying to find by user")
+            logger.warning("Order #%s not found, trying to find by user", order_id)
             order = db_session.query(Order).filter_by(
                 user_id=user.id,
                 status="AWAITING_PAYMENT"
@@ -1080,7 +1417,7 @@ def handle_callback_query(call):
             # Notify admins about new order for review
             notify_admins_about_order(order)
         else:
-            bot.answer_callback_query(call.id, "No pending order found.", show_alert=True)
+            bot.answer_callback(call, "No pending order found.", show_alert=True)
             
     elif call.data == "payment_help":
         # Provide help with payment
@@ -1110,24 +1447,25 @@ def handle_callback_query(call):
         )
 
 # Message handlers for multi-step processes
+@metrics.time_function(metrics.USERNAME_STEP_LATENCY)
 def process_username_step(message, plan_id):
-    logger.info(f"Processing username step with plan_id: {plan_id}")
+    logger.info("Processing username step with plan_id: %s", plan_id)
     user = get_or_create_user(message)
     plan = config_manager.get_plan_by_id(plan_id)
     
     if not plan:
-        logger.error(f"Plan not found with ID: {plan_id}")
+        logger.error("Plan not found with ID: %s", plan_id)
         bot.send_message(message.chat.id, "❌ Error: Plan not found. Please try again.")
         return
     
-    logger.info(f"Plan found: {plan['name']}")
+    logger.info("Plan found: %s", plan['name'])
     
     username = message.text.strip()
-    logger.info(f"Received username: {username}")
+    logger.info("Received username: %s", username)
     
     # Simple validation
     if not username.startswith('@'):
-        logger.warning(f"Invalid username format: {username}")
+        logger.warning("Invalid username format: %s", username)
         bot.send_message(
             message.chat.id,
             "❌ Invalid username format. Username must start with @. Please try again."
@@ -1155,6 +1493,7 @@ def process_username_step(message, plan_id):
     
     db_session.add(new_order)
     db_session.commit()
+    metrics.ORDERS_CREATED.inc()
     
     # Create payment with NowPayments
     try:
@@ -1183,7 +1522,7 @@ def process_username_step(message, plan_id):
             notify_admins_about_order(new_order)
             return
         
-        logger.info(f"Creating payment for order #{order_id} - {plan['name']} - ${plan['price']}")
+        logger.info("Creating payment for order #%s - %s - $%s", order_id, plan['name'], plan['price'])
         payment_response = nowpayments_api.create_payment(
             price=plan['price'],
             currency='USD',
@@ -1193,7 +1532,7 @@ def process_username_step(message, plan_id):
         )
         
         if payment_response and 'payment_id' in payment_response:
-            logger.info(f"Payment created successfully: ID {payment_response['payment_id']}")
+            logger.info("Payment created successfully: ID %s", payment_response['payment_id'])
             
             # Save payment information
             payment = PaymentTransaction(
@@ -1247,7 +1586,7 @@ def process_username_step(message, plan_id):
             )
         else:
             # Handle payment creation error - switch to manual mode
-            logger.warning(f"Payment response error: {payment_response}")
+            logger.warning("Payment response error: %s", payment_response)
             
             # Update the order status to admin review
             new_order.status = 'ADMIN_REVIEW'
@@ -1274,7 +1613,7 @@ def process_username_step(message, plan_id):
                 reply_markup=markup
             )
     except Exception as e:
-        logger.error(f"Error creating payment: {e}")
+        logger.error("Error creating payment: %s", e)
         logger.exception(e)
         
         # Don't delete the order, but change status for admin review
@@ -1305,7 +1644,7 @@ def process_username_step(message, plan_id):
                     reply_markup=markup
                 )
             except Exception as inner_e:
-                logger.error(f"Error updating order after payment failure: {inner_e}")
+                logger.error("Error updating order after payment failure: %s", inner_e)
                 db_session.rollback()
                 
                 # Last resort - simple error message
@@ -1381,11 +1720,11 @@ def process_channel_settings(message):
                 reply_markup=markup
             )
             
-            logger.info(f"Channel settings updated by admin {user_id}")
-            logger.info(f"New settings - Admin: {admin_channel}, Public: {public_channel}, Required: {required_channel}, Subscription Required: {channel_subscription_required}, Notifications: {notification_enabled}")
+            logger.info("Channel settings updated by admin %s", user_id)
+            logger.info("New settings - Admin: %s, Public: %s, Required: %s, Subscription Required: %s, Notifications: %s", admin_channel, public_channel, required_channel, channel_subscription_required, notification_enabled)
             
         except Exception as e:
-            logger.error(f"Error processing channel settings: {e}")
+            logger.error("Error processing channel settings: %s", e)
             
             # Send error message
             error_message = (
@@ -1452,7 +1791,7 @@ def process_activation_link(message, order_id):
                         parse_mode="Markdown"
                     )
             except Exception as e:
-                logger.error(f"Error notifying user about approved order: {e}")
+                logger.error("Error notifying user about approved order: %s", e)
             
             # Confirmation for admin
             admin_confirmation = (
@@ -1513,6 +1852,7 @@ def process_rejection_reason(message, order_id):
         bot.send_message(message.chat.id, "⛔ You don't have permission to perform this action.")
 
 # Utility functions
+@lane(ADMIN)
 def notify_admins_about_order(order):
     """Notify all admins about a new order for review"""
     admin_ids = config_manager.get_bot_admins()
@@ -1542,14 +1882,15 @@ def notify_admins_about_order(order):
             markup.row(approve_button, reject_button)
             markup.add(view_button)
             
-            # Send to admin channel using HTML parse mode
+            # Send to admin channel using HTML parse mode; the message is queued, so failures arrive in on_error
             bot.send_message(
                 admin_channel, 
                 notification, 
                 parse_mode="HTML",
-                reply_markup=markup
+                reply_markup=markup,
+                on_error=lambda e: logger.error("Failed to send notification to admin channel %s: %s", admin_channel, e)
             )
-            logger.info(f"Notification sent to admin channel: {admin_channel}")
+            logger.info("Notification queued for admin channel: %s", admin_channel)
             
             # Also send a notification to the public channel if configured and enabled
             # We're allowing sending to the same channel with a different message
@@ -1571,7 +1912,7 @@ def notify_admins_about_order(order):
                     
                     # Check if we're sending to the same channel
                     if public_channel == admin_channel:
-                        logger.info(f"Public channel is same as admin channel: {public_channel}")
+                        logger.info("Public channel is same as admin channel: %s", public_channel)
                     
                     # Create attractive inline keyboard with multiple buttons
                     markup = types.InlineKeyboardMarkup(row_width=2)
@@ -1592,14 +1933,15 @@ def notify_admins_about_order(order):
                         public_channel, 
                         public_notification, 
                         parse_mode="HTML",
-                        reply_markup=markup
+                        reply_markup=markup,
+                        on_error=lambda e: logger.error("Failed to send notification to public channel %s: %s", public_channel, e)
                     )
-                    logger.info(f"Notification sent to public channel: {public_channel}")
+                    logger.info("Notification queued for public channel: %s", public_channel)
                 except Exception as e:
-                    logger.error(f"Failed to send notification to public channel {public_channel}: {e}")
+                    logger.error("Failed to send notification to public channel %s: %s", public_channel, e)
             
         except Exception as e:
-            logger.error(f"Failed to send notification to admin channel {admin_channel}: {e}")
+            logger.error("Failed to send notification to admin channel %s: %s", admin_channel, e)
             # Continue to notify individual admins as fallback
     
     # Fallback: Notify individual admins
@@ -1620,10 +1962,13 @@ def notify_admins_about_order(order):
     
     for admin_id in admin_ids:
         try:
-            bot.send_message(admin_id, notification, parse_mode="HTML")
+            bot.send_message(admin_id, notification, parse_mode="HTML",
+                             on_error=lambda e, admin_id=admin_id: logger.error("Error sending notification to admin %s: %s", admin_id, e))
         except Exception as e:
-            logger.error(f"Error sending notification to admin {admin_id}: {e}")
+            logger.error("Error sending notification to admin %s: %s", admin_id, e)
             
+@db_unit_of_work
+@lane(ADMIN)
 def notify_admins_about_payment(order, transaction):
     """Notify all admins about a completed payment"""
     admin_ids = config_manager.get_bot_admins()
@@ -1667,13 +2012,14 @@ def notify_admins_about_payment(order, transaction):
                 admin_channel, 
                 notification, 
                 parse_mode="HTML",
-                reply_markup=markup
+                reply_markup=markup,
+                on_error=lambda e: logger.error("Failed to send payment notification to admin channel %s: %s", admin_channel, e)
             )
-            logger.info(f"Payment notification sent to admin channel: {admin_channel}")
+            logger.info("Payment notification queued for admin channel: %s", admin_channel)
             
             # Important: Do not return here, we want to continue even if admin channel notification succeeds
         except Exception as e:
-            logger.error(f"Failed to send payment notification to admin channel {admin_channel}: {e}")
+            logger.error("Failed to send payment notification to admin channel %s: %s", admin_channel, e)
             # Continue to notify individual admins as fallback
     
     # Fallback: Individual admin notifications if channel fails
@@ -1705,10 +2051,11 @@ def notify_admins_about_payment(order, transaction):
                 admin_id, 
                 notification, 
                 parse_mode="HTML",
-                reply_markup=markup
+                reply_markup=markup,
+                on_error=lambda e, admin_id=admin_id: logger.error("Error sending payment notification to admin %s: %s", admin_id, e)
             )
         except Exception as e:
-            logger.error(f"Error sending payment notification to admin {admin_id}: {e}")
+            logger.error("Error sending payment notification to admin %s: %s", admin_id, e)
     
     # Also send to public channel if enabled
     send_public_purchase_announcement(order, transaction)
@@ -1716,12 +2063,13 @@ def notify_admins_about_payment(order, transaction):
     # Also notify the customer
     notify_customer_about_payment(order, transaction)
 
+@lane(INTERACTIVE)
 def notify_customer_about_payment(order, transaction):
     """Notify customer about their payment confirmation"""
     try:
         customer = db_session.query(User).get(order.user_id)
         if not customer:
-            logger.error(f"Customer not found for order {order.order_id}")
+            logger.error("Customer not found for order %s", order.order_id)
             return
             
         # Format amount with 2 decimal places
@@ -1757,20 +2105,22 @@ def notify_customer_about_payment(order, transaction):
             reply_markup=markup
         )
     except Exception as e:
-        logger.error(f"Error notifying customer about payment: {e}")
+        logger.error("Error notifying customer about payment: %s", e)
         
+@db_unit_of_work
+@lane(INTERACTIVE)
 def notify_customer_about_approval(order):
     """Notify customer about their approved order with activation link"""
     try:
         # Find the user
         customer = db_session.query(User).get(order.user_id)
         if not customer:
-            logger.error(f"Customer not found for order {order.order_id}")
+            logger.error("Customer not found for order %s", order.order_id)
             return False
             
         # Check if we have activation link
         if not order.activation_link:
-            logger.error(f"No activation link available for order {order.order_id}")
+            logger.error("No activation link available for order %s", order.order_id)
             return False
             
         # HTML formatted notification
@@ -1808,7 +2158,7 @@ def notify_customer_about_approval(order):
             parse_mode="HTML",
             reply_markup=markup
         )
-        logger.info(f"Approval notification sent to user {customer.telegram_id} for order #{order.order_id}")
+        logger.info("Approval notification sent to user %s for order #%s", customer.telegram_id, order.order_id)
         
         # Also send to the public channel if configured
         public_channel = config_manager.get_public_channel()
@@ -1840,23 +2190,24 @@ def notify_customer_about_approval(order):
                     parse_mode="HTML",
                     reply_markup=markup
                 )
-                logger.info(f"Activation announcement sent to public channel: {public_channel}")
+                logger.info("Activation announcement sent to public channel: %s", public_channel)
             except Exception as channel_err:
-                logger.error(f"Failed to send public channel announcement: {str(channel_err)}")
+                logger.error("Failed to send public channel announcement: %s", channel_err)
         
         return True
     except Exception as e:
-        logger.error(f"Failed to notify customer about approval: {str(e)}")
+        logger.error("Failed to notify customer about approval: %s", e)
         logger.exception(e)
         return False
         
+@lane(INTERACTIVE)
 def notify_customer_about_rejection(order):
     """Notify customer about their rejected order and reason"""
     try:
         # Find the user
         customer = db_session.query(User).get(order.user_id)
         if not customer:
-            logger.error(f"Customer not found for order {order.order_id}")
+            logger.error("Customer not found for order %s", order.order_id)
             return False
         
         # Prepare rejection reason
@@ -1895,12 +2246,13 @@ def notify_customer_about_rejection(order):
             parse_mode="HTML",
             reply_markup=markup
         )
-        logger.info(f"Rejection notification sent to user {customer.telegram_id} for order #{order.order_id}")
+        logger.info("Rejection notification sent to user %s for order #%s", customer.telegram_id, order.order_id)
         return True
     except Exception as e:
-        logger.error(f"Error notifying customer about rejection: {e}")
+        logger.error("Error notifying customer about rejection: %s", e)
         return False
 
+@lane(ANNOUNCEMENT)
 def send_public_purchase_announcement(order, transaction):
     """Send purchase announcement to public channel"""
     public_channel = config_manager.get_public_channel()
@@ -1913,7 +2265,7 @@ def send_public_purchase_announcement(order, transaction):
         
     # Check if we're sending to the same channel
     if public_channel == admin_channel:
-        logger.info(f"Public channel is same as admin channel: {public_channel}, still sending announcement")
+        logger.info("Public channel is same as admin channel: %s, still sending announcement", public_channel)
         
     try:
         # Format amount with 2 decimal places
@@ -1964,11 +2316,12 @@ def send_public_purchase_announcement(order, transaction):
             public_channel,
             announcement,
             parse_mode="HTML",
-            reply_markup=markup
+            reply_markup=markup,
+            on_error=lambda e: logger.error("Error sending purchase announcement to public channel: %s", e)
         )
-        logger.info(f"Purchase announcement sent to public channel: {public_channel}")
+        logger.info("Purchase announcement queued for public channel: %s", public_channel)
     except Exception as e:
-        logger.error(f"Error sending purchase announcement to public channel: {e}")
+        logger.error("Error sending purchase announcement to public channel: %s", e)
 
 # Polling mode for development
 def start_polling():
@@ -1981,49 +2334,84 @@ def start_polling():
         
         # Log bot information
         bot_info = bot.get_me()
-        logger.info(f"Bot started: @{bot_info.username} (ID: {bot_info.id})")
+        logger.info("Bot started: @%s (ID: %s)", bot_info.username, bot_info.id)
+        
+        # This process now gets every update, so pending steps can be answered from memory
+        bot.next_step_backend.own_all()
         
         # Start polling with better error handling
-        bot.infinity_polling(timeout=60, long_polling_timeout=60)
+        bot.infinity_polling(timeout=60, long_polling_timeout=60, allowed_updates=bot.allowed_updates())
     except Exception as e:
-        logger.error(f"Error starting polling: {str(e)}")
+        logger.error("Error starting polling: %s", e)
         logger.exception(e)
         
 # For webhook mode in production
 def set_webhook(webhook_url):
     """Set webhook for the bot"""
-    logger.info(f"Setting webhook to: {webhook_url}")
+    logger.info("Setting webhook to: %s", webhook_url)
     try:
         # First, remove any existing webhook
         bot.remove_webhook()
         logger.info("Existing webhook removed")
         
         # Set the new webhook
-        result = bot.set_webhook(url=webhook_url)
+        result = bot.set_webhook(url=webhook_url, secret_token=config_manager.ensure_webhook_secret(),
+                                 allowed_updates=bot.allowed_updates())
         
         if result:
             # Get webhook info to verify
             webhook_info = bot.get_webhook_info()
-            logger.info(f"Webhook set successfully. Info: {webhook_info}")
+            logger.info("Webhook set successfully. Info: %s", webhook_info)
             return True
         else:
             logger.error("Failed to set webhook")
             return False
     except Exception as e:
-        logger.error(f"Error setting webhook: {str(e)}")
+        logger.error("Error setting webhook: %s", e)
         logger.exception(e)
         return False
 
+def handle_webhook_update(update_json):
+    """
+    Process a webhook update; returns (ok, reply).
+    
+    reply is the Bot API call to put in the webhook response, or None. It is
+    only produced when webhook_reply is enabled in the config: the update is
+    then handled synchronously in the request thread and the last message
+    sent through send_reply/edit_reply is returned instead of sent; earlier
+    ones are sent as normal requests before it, to keep their order. Errors in
+    a returned call are not reported back by Telegram, which is why the mode
+    is opt-in. The returned call takes its send tokens like any other message
+    (see send_scheduler.py), so the response may wait on the rate limits.
+    """
+    if not config_manager.get_config_value("webhook_reply", False):
+        return process_webhook_update(update_json), None
+    
+    reply = WebhookReply()
+    token = _webhook_reply.set(reply)
+    try:
+        ok = process_webhook_update(update_json)
+    finally:
+        _webhook_reply.reset(token)
+    
+    payload = reply.take()
+    if payload is not None:
+        # Telegram sends the reply for us, but it still counts against the bot's send limits
+        bot.scheduler.acquire(payload["chat_id"] if payload["method"] == "sendMessage" else None)
+        metrics.TELEGRAM_WEBHOOK_REPLIES.labels(payload["method"]).inc()
+    return ok, payload
+
 # Function to process webhook updates from Flask
 def process_webhook_update(update_json):
     """Process webhook update from Flask"""
-    logger.info(f"Received webhook update")
+    logger.info("Received webhook update")
     try:
-        update = telebot.types.Update.de_json(update_json)
-        bot.process_new_updates([update])
+        updates = bot.parse_updates([update_json])
+        if updates:
+            bot.process_new_updates(updates)
         return True
     except Exception as e:
-        logger.error(f"Error processing webhook update: {str(e)}")
+        logger.error("Error processing webhook update: %s", e)
         logger.exception(e)
         return False
 
@@ -2034,14 +2422,13 @@ def send_broadcast_message(broadcast_id):
     """
     from models import BroadcastMessage
     from app import app, db
-    import time
     
     try:
         # Get the broadcast message from the database
         with app.app_context():
             broadcast = BroadcastMessage.query.get(broadcast_id)
             if not broadcast:
-                logger.error(f"Broadcast message {broadcast_id} not found")
+                logger.error("Broadcast message %s not found", broadcast_id)
                 return False
                 
             # Update status to sending
@@ -2054,17 +2441,17 @@ def send_broadcast_message(broadcast_id):
             sent_count = 0
             failed_count = 0
             
-            logger.info(f"Starting broadcast message {broadcast_id} to {total_users} users")
+            logger.info("Starting broadcast message %s to %s users", broadcast_id, total_users)
             
-            # Send the message to all users
+            # Send the message to all users, in the lowest-priority lane so replies to users go first
             for user in users:
                 try:
-                    # Send the message
-                    bot.send_message(
-                        chat_id=user.telegram_id,
-                        text=broadcast.message_text,
-                        parse_mode="Markdown"
-                    )
+                    with lane(BROADCAST):
+                        bot.send_message(
+                            chat_id=user.telegram_id,
+                            text=broadcast.message_text,
+                            parse_mode="Markdown"
+                        )
                     sent_count += 1
                     
                     # Update the broadcast stats periodically (every 10 users)
@@ -2072,11 +2459,8 @@ def send_broadcast_message(broadcast_id):
                         broadcast.sent_count = sent_count
                         broadcast.failed_count = failed_count
                         db.session.commit()
-                        
-                    # Add a small delay to avoid rate limiting
-                    time.sleep(0.1)
                 except Exception as e:
-                    logger.error(f"Error sending broadcast to user {user.telegram_id}: {str(e)}")
+                    logger.error("Error sending broadcast to user %s: %s", user.telegram_id, e)
                     failed_count += 1
             
             # Update final stats
@@ -2086,10 +2470,10 @@ def send_broadcast_message(broadcast_id):
             broadcast.completed_at = datetime.utcnow()
             db.session.commit()
             
-            logger.info(f"Broadcast message {broadcast_id} completed: {sent_count} sent, {failed_count} failed")
+            logger.info("Broadcast message %s completed: %s sent, %s failed", broadcast_id, sent_count, failed_count)
             return True
     except Exception as e:
-        logger.error(f"Error processing broadcast message {broadcast_id}: {str(e)}")
+        logger.error("Error processing broadcast message %s: %s", broadcast_id, e)
         logger.exception(e)
         
         # Update status to failed
@@ -2100,13 +2484,17 @@ def send_broadcast_message(broadcast_id):
                     broadcast.status = "FAILED"
                     db.session.commit()
         except Exception as update_err:
-            logger.error(f"Error updating broadcast status: {str(update_err)}")
+            logger.error("Error updating broadcast status: %s", update_err)
             
         return False
 
 if __name__ == "__main__":
+    init_bot_process()
     logger.info("Bot script started directly")
     
+    import profiler
+    profiler.watch_config_requests("bot")
+    
     # Check if bot is enabled in config
     if config_manager.get_config_value("bot_enabled", default=False):
         logger.info("Bot is enabled, starting in polling mode")
@@ -0,0 +1,353 @@
+"""
+Rate limiting for outgoing Telegram messages.
+
+Telegram allows about 30 messages per second per bot, about one per second
+in a private chat and 20 per minute in a group or channel; going over gets a
+429 with retry_after. PremiumBot sends every message through
+SendScheduler.call(), which waits for a token from the chat's bucket and then
+from the global bucket. Global tokens are handed out by lane, so a user's
+reply never queues behind a broadcast:
+
+    INTERACTIVE   replies and notifications to users (default)
+    ADMIN         admin alerts
+    ANNOUNCEMENT  public channel posts
+    BROADCAST     admin broadcasts to every user
+
+Code picks a lane with ``with lane(BROADCAST):`` or the ``@lane(ADMIN)``
+decorator. A 429 pushes the chat's bucket back by retry_after and the call
+is retried. Sends block the calling thread and return the sent Message,
+except in the admin and announcement lanes: nobody waits on those, so they
+are queued for sender threads and a handler isn't held up by, say, the admin
+chat's one-message-a-second limit. A queued send that fails is logged, or
+handed to the on_error callback the caller passed with it.
+
+A reply returned in a webhook response is sent by Telegram, not by us, but
+counts against the same limits; the bot takes its tokens with acquire()
+before returning the response.
+
+The web workers, the bot and broadcast threads all send with the same token,
+so the global limit is also kept across processes: SharedBudget counts each
+second's sends in the send_budget table, and every process takes its global
+tokens from that count as well. Lower lanes may only use part of each
+second (BROADCAST 60%), which leaves room for the bot's replies however busy
+a broadcast in a gunicorn worker is. Per-chat buckets stay per process.
+"""
+
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from sqlalchemy import delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from telebot.apihelper import ApiTelegramException
+
+import database
+import metrics
+from models import SendBudget
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE, ADMIN, ANNOUNCEMENT, BROADCAST = range(4)
+LANE_NAMES = ("interactive", "admin", "announcement", "broadcast")
+# Lanes whose sends are queued instead of waited for
+BACKGROUND_LANES = frozenset((ADMIN, ANNOUNCEMENT))
+SENDER_THREADS = 2
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+# Messages per second, with a burst of about one second's worth globally
+GLOBAL_RATE = _env_float("TELEGRAM_GLOBAL_RATE", 30)
+# Telegram lets the few messages one update sends to a chat go out together
+PRIVATE_CHAT_RATE, PRIVATE_CHAT_BURST = _env_float("TELEGRAM_CHAT_RATE", 1), 3
+GROUP_CHAT_RATE, GROUP_CHAT_BURST = _env_float("TELEGRAM_GROUP_RATE_PER_MINUTE", 20) / 60.0, 3
+MAX_RETRIES = 3
+# A longer retry_after is raised to the caller instead of holding its thread
+MAX_RETRY_AFTER = 60
+# Idle per-chat buckets are dropped once there are more than this many
+MAX_CHAT_BUCKETS = 10000
+# Share of each second's shared budget a lane may use, by lane
+LANE_SHARE = (1.0, 0.9, 0.8, 0.6)
+# After a database error the shared budget is skipped (local limits only) for this long
+BUDGET_RETRY = 30
+
+def shared_budget_enabled():
+    return os.environ.get("TELEGRAM_SHARED_BUDGET", "1").lower() in ("1", "true", "yes")
+
+_lane = contextvars.ContextVar("send_lane", default=INTERACTIVE)
+
+@contextmanager
+def lane(priority):
+    """Send the messages in this block (or decorated function) in the given lane"""
+    token = _lane.set(priority)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+class TokenBucket:
+    """Token bucket; not thread-safe on its own, SendScheduler holds its lock around it"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now):
+        """Take a token even if it is only available later; returns the seconds until it is"""
+        self._refill(now)
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def try_take(self, now):
+        """Take a token if one is available; returns 0, or the seconds until one will be"""
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds, now):
+        """Make the next token available no sooner than `seconds` from now"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+def _retry_after(error):
+    if error.error_code != 429:
+        return None
+    return (error.result_json or {}).get("parameters", {}).get("retry_after")
+
+def _chat_limits(chat_id):
+    # Group, supergroup and channel ids are negative; @username targets are channels
+    try:
+        is_group = int(chat_id) < 0
+    except (TypeError, ValueError):
+        is_group = True
+    return (GROUP_CHAT_RATE, GROUP_CHAT_BURST) if is_group else (PRIVATE_CHAT_RATE, PRIVATE_CHAT_BURST)
+
+
+class SharedBudget:
+    """Per-second send counts in the database, shared by every process using the bot token"""
+
+    def __init__(self, rate=GLOBAL_RATE, engine=None):
+        self.rate = rate
+        self._engine = engine
+        self._purged = 0
+        self._skip_until = 0.0
+
+    @property
+    def engine(self):
+        # Looked up on first send so importing the bot module opens no connection
+        if self._engine is None:
+            self._engine = database.get_engine()
+        return self._engine
+
+    def take(self, priority):
+        """Wait until the current second has room for a message in this lane"""
+        ceiling = max(1, int(self.rate * LANE_SHARE[priority]))
+        while True:
+            now = time.time()
+            if now < self._skip_until:
+                return
+            slot = int(now)
+            try:
+                if self._claim(slot, ceiling):
+                    return
+            except SQLAlchemyError as e:
+                logger.warning("Shared send budget unavailable, using local limits for %ss: %s", BUDGET_RETRY, e)
+                self._skip_until = now + BUDGET_RETRY
+                return
+            metrics.SEND_BUDGET_FULL.labels(LANE_NAMES[priority]).inc()
+            time.sleep(slot + 1 - now)
+
+    def _claim(self, slot, ceiling):
+        # One statement: count the send unless the second's count has reached the lane's ceiling
+        dialect = postgresql if self.engine.dialect.name == "postgresql" else sqlite
+        statement = (
+            dialect.insert(SendBudget).values(slot=slot, used=1)
+            .on_conflict_do_update(index_elements=["slot"], set_={"used": SendBudget.used + 1},
+                                   where=SendBudget.used < ceiling)
+            .returning(SendBudget.used)
+        )
+        with Session(self.engine) as session, session.begin():
+            granted = session.execute(statement).first() is not None
+            if slot - self._purged > 60:
+                self._purged = slot
+                session.execute(delete(SendBudget).where(SendBudget.slot < slot - 60))
+        return granted
+
+
+class SendScheduler:
+    """Per-chat and global token buckets with priority lanes for the global one"""
+
+    def __init__(self, global_rate=GLOBAL_RATE, budget=None):
+        self._global = TokenBucket(global_rate, max(1.0, global_rate))
+        self._budget = budget
+        self._chats = {}
+        self._waiting = []
+        self._tickets = itertools.count()
+        self._lock = threading.Lock()
+        self._turn = threading.Condition(self._lock)
+        self._outbox = []
+        self._outbox_changed = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._senders = []
+
+    def send(self, chat_id, func, *args, on_error=None, **kwargs):
+        """
+        call() in the current lane; in a background lane the send is queued and None returned.
+        
+        If a queued send fails, on_error(exception) is called from the sender thread instead
+        of logging the error; a send that isn't queued raises as usual.
+        """
+        priority = _lane.get()
+        if priority not in BACKGROUND_LANES:
+            return self.call(chat_id, func, *args, **kwargs)
+        metrics.SEND_WAITING.labels(LANE_NAMES[priority]).inc()
+        with self._outbox_changed:
+            if not self._senders:
+                # Started on first use so importing the bot module starts no threads
+                self._senders = [threading.Thread(target=self._send_queued, name=f"send-scheduler-{i}", daemon=True)
+                                 for i in range(SENDER_THREADS)]
+                for thread in self._senders:
+                    thread.start()
+            heapq.heappush(self._outbox, (priority, next(self._tickets), chat_id, func, args, kwargs, on_error))
+            self._outbox_changed.notify()
+
+    def flush(self, timeout):
+        """Wait for queued sends to go out; returns False if some were left at the timeout"""
+        with self._outbox_changed:
+            return self._outbox_changed.wait_for(lambda: not self._outbox and not self._in_flight, timeout)
+
+    def call(self, chat_id, func, *args, **kwargs):
+        """Run a message-sending API call once the rate limits allow it, retrying after a 429"""
+        priority = _lane.get()
+        name = LANE_NAMES[priority]
+        for attempt in range(MAX_RETRIES + 1):
+            self._acquire(chat_id, priority)
+            try:
+                return func(*args, **kwargs)
+            except ApiTelegramException as e:
+                retry_after = _retry_after(e)
+                if retry_after is None or attempt == MAX_RETRIES or retry_after > MAX_RETRY_AFTER:
+                    raise
+                logger.warning("Telegram asked to retry a message to %s after %ss", chat_id, retry_after)
+                metrics.SEND_RETRIES.labels(name).inc()
+                with self._lock:
+                    # Without a chat (edits) the throttle is taken as bot-wide and holds back every send
+                    bucket = self._global if chat_id is None else self._chat_bucket(chat_id)
+                    bucket.pause(retry_after, time.monotonic())
+
+    def acquire(self, chat_id):
+        """Wait for the rate limits as call() would, for a message Telegram sends for us"""
+        self._acquire(chat_id, _lane.get())
+
+    def _acquire(self, chat_id, priority):
+        name = LANE_NAMES[priority]
+        started = time.monotonic()
+        metrics.SEND_WAITING.labels(name).inc()
+        try:
+            if chat_id is not None:
+                due = self._wait_for_chat(chat_id)
+            self._wait_for_turn(priority)
+            if self._budget is not None:
+                self._budget.take(priority)
+            if chat_id is not None:
+                self._sending(chat_id, due)
+        finally:
+            metrics.SEND_WAITING.labels(name).dec()
+        metrics.SEND_WAIT.labels(name).observe(time.monotonic() - started)
+
+    def _chat_bucket(self, chat_id):
+        key = str(chat_id)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                now = time.monotonic()
+                for idle_key in [k for k, b in self._chats.items() if b.idle(now)]:
+                    del self._chats[idle_key]
+            bucket = self._chats[key] = TokenBucket(*_chat_limits(chat_id))
+        return bucket
+
+    def _wait_for_chat(self, chat_id):
+        """Wait for the chat's next slot; returns the time the slot was due"""
+        # Reserving hands out the chat's slots in call order, so its messages keep their order
+        with self._lock:
+            now = time.monotonic()
+            delay = self._chat_bucket(chat_id).reserve(now)
+        if delay:
+            time.sleep(delay)
+        return now + delay
+
+    def _sending(self, chat_id, due):
+        # A message held up by the global limit pushes the chat's later slots back by as much,
+        # or the next one would follow it too closely
+        with self._lock:
+            late = time.monotonic() - due
+            if late > 0:
+                bucket = self._chat_bucket(chat_id)
+                bucket.tokens -= late * bucket.rate
+
+    def _wait_for_turn(self, priority):
+        """Take a global token; waiting callers get them lowest lane first, then in arrival order"""
+        ticket = (priority, next(self._tickets))
+        with self._turn:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if self._waiting[0] == ticket:
+                        delay = self._global.try_take(time.monotonic())
+                        if not delay:
+                            return
+                        self._turn.wait(delay)
+                    else:
+                        self._turn.wait()
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._turn.notify_all()
+
+    def _send_queued(self):
+        while True:
+            with self._outbox_changed:
+                while not self._outbox:
+                    self._outbox_changed.wait()
+                priority, _, chat_id, func, args, kwargs, on_error = heapq.heappop(self._outbox)
+                self._in_flight += 1
+            metrics.SEND_WAITING.labels(LANE_NAMES[priority]).dec()
+            try:
+                with lane(priority):
+                    self.call(chat_id, func, *args, **kwargs)
+            except Exception as e:
+                if on_error is None:
+                    logger.error("Error sending a queued %s message to %s: %s", LANE_NAMES[priority], chat_id, e)
+                else:
+                    try:
+                        on_error(e)
+                    except Exception:
+                        logger.exception("Error in the failure callback of a queued message to %s", chat_id)
+            finally:
+                with self._outbox_changed:
+                    self._in_flight -= 1
+                    self._outbox_changed.notify_all()
@@ -0,0 +1,13 @@
+"""
+Local simulators of the Telegram Bot API and the NowPayments API.
+
+Point the app at them with TELEGRAM_API_URL and NOWPAYMENTS_API_URL to run
+the whole order pipeline offline, with configurable latency, error rate and
+rate limiting. Run them standalone with ``python -m simulators``.
+"""
+
+from simulators.base import SimulatorServer, Faults
+from simulators.telegram import TelegramSimulator
+from simulators.nowpayments import NowPaymentsSimulator
+
+__all__ = ["SimulatorServer", "Faults", "TelegramSimulator", "NowPaymentsSimulator"]
@@ -0,0 +1,61 @@
+"""
+Run the Telegram and NowPayments simulators until interrupted.
+
+    python -m simulators --telegram-port 8081 --nowpayments-port 8082 \\
+        --latency-ms 80 --jitter-ms 40 --error-rate 0.01 --chat-rate-limit 1 \\
+        --ipn-url http://127.0.0.1:5000/webhook/nowpayments/ipn --ipn-secret secret
+
+then start the app and the bot with the printed TELEGRAM_API_URL and
+NOWPAYMENTS_API_URL.
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+from simulators import Faults, NowPaymentsSimulator, TelegramSimulator
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--telegram-port", type=int, default=8081)
+    parser.add_argument("--nowpayments-port", type=int, default=8082)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="base response delay for both simulators")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="random extra delay up to this value")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="global requests/second before 429 (0 = off)")
+    parser.add_argument("--chat-rate-limit", type=float, default=0.0, help="Telegram messages/second per chat before 429")
+    parser.add_argument("--ipn-url", help="where the NowPayments simulator delivers IPN callbacks")
+    parser.add_argument("--ipn-secret", help="IPN secret used to sign callbacks")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiplier for payment status progression delays")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+
+    def faults():
+        return Faults(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit)
+
+    telegram = TelegramSimulator(faults(), args.host, args.telegram_port, chat_rate_limit=args.chat_rate_limit).start()
+    nowpayments = NowPaymentsSimulator(
+        faults(), args.host, args.nowpayments_port,
+        ipn_url=args.ipn_url, ipn_secret=args.ipn_secret, time_scale=args.time_scale
+    ).start()
+
+    print(f"TELEGRAM_API_URL={telegram.api_url()}")
+    print(f"NOWPAYMENTS_API_URL={nowpayments.api_url()}")
+    sys.stdout.flush()
+
+    try:
+        while True:
+            time.sleep(30)
+            logging.info("telegram %s | nowpayments %s", telegram.stats(), nowpayments.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        telegram.stop()
+        nowpayments.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
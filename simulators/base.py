@@ -0,0 +1,179 @@
+"""
+Shared HTTP plumbing and fault injection for the simulators.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+class TokenBucket:
+    """Requests allowed per second with a burst of the same size; rate 0 disables the limit"""
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.tokens = self.rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Take a token; returns 0 on success or the seconds until one is available"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class Faults:
+    """
+    Latency and failure behaviour of a simulator.
+
+    latency_ms/jitter_ms delay every response (uniform jitter on top of the
+    base latency), error_rate is the fraction of requests answered with a 500,
+    and rate_limit caps requests per second before 429 responses start.
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_limit=0.0, seed=None):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.bucket = TokenBucket(rate_limit)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        if self.latency or self.jitter:
+            with self._lock:
+                extra = self._random.uniform(0, self.jitter) if self.jitter else 0.0
+            time.sleep(self.latency + extra)
+
+    def should_fail(self):
+        if self.error_rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+class JsonRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY the
+    # keep-alive connection stalls on delayed ACKs and adds ~40 ms per call
+    disable_nagle_algorithm = True
+    simulator = None
+
+    def _params(self):
+        parts = urlsplit(self.path)
+        params = dict(parse_qsl(parts.query))
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            body = self.rfile.read(length)
+            content_type = self.headers.get("Content-Type", "")
+            if "json" in content_type:
+                params.update(json.loads(body or b"{}"))
+            else:
+                params.update(parse_qsl(body.decode("utf-8")))
+        return parts.path, params
+
+    def _reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        simulator = self.simulator
+        simulator.count()
+        path, params = self._params()
+        simulator.faults.delay()
+        reply = simulator.inject_fault(path, params)
+        if reply is None:
+            reply = self.respond(path, params)
+        self._reply(*reply)
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def respond(self, path, params):
+        """Return (status, payload) or (status, payload, headers)"""
+        raise NotImplementedError
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SimulatorServer:
+    """Threaded HTTP server running in a daemon thread"""
+
+    handler_class = JsonRequestHandler
+
+    def __init__(self, faults=None, host="127.0.0.1", port=0):
+        self.faults = faults or Faults()
+        self.requests = 0
+        self.errors_injected = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+        class Handler(self.handler_class):
+            pass
+        Handler.simulator = self
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=type(self).__name__, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+    def inject_fault(self, path, params):
+        """Return a 429 or 500 reply when the fault settings call for one, else None"""
+        retry_after = self.faults.bucket.take()
+        if retry_after:
+            with self._lock:
+                self.rate_limited += 1
+            return self.rate_limited_reply(retry_after, path, params)
+        if self.faults.should_fail():
+            with self._lock:
+                self.errors_injected += 1
+            return self.error_reply(path, params)
+        return None
+
+    def rate_limited_reply(self, retry_after, path, params):
+        return 429, {"message": "Too many requests"}, {"Retry-After": str(max(1, int(retry_after + 0.999)))}
+
+    def error_reply(self, path, params):
+        return 500, {"message": "Internal server error"}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors_injected": self.errors_injected,
+                "rate_limited": self.rate_limited,
+            }
@@ -0,0 +1,144 @@
+"""
+NowPayments API simulator.
+
+Payments are created in the "waiting" state. When an IPN URL and secret are
+configured (or the create_payment call passes ipn_callback_url), each payment
+then advances through confirming -> confirmed -> finished, and every status
+change is POSTed to the IPN URL signed exactly like NowPayments does
+(HMAC-SHA512 of the key-sorted JSON body in x-nowpayments-sig).
+"""
+
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from simulators.base import JsonRequestHandler, SimulatorServer
+
+logger = logging.getLogger(__name__)
+
+# Status progression after creation and the delay before each step, in seconds
+DEFAULT_PROGRESSION = (("confirming", 2.0), ("confirmed", 2.0), ("finished", 1.0))
+
+
+class _NowPaymentsHandler(JsonRequestHandler):
+    def respond(self, path, params):
+        simulator = self.simulator
+        if path.endswith("/status"):
+            return 200, {"message": "OK"}
+        if path.endswith("/payment") and self.command == "POST":
+            return 201, simulator.create_payment(params)
+        if "/payment/" in path:
+            payment = simulator.payments.get(path.rsplit("/", 1)[-1])
+            if payment is None:
+                return 404, {"message": "Payment not found"}
+            return 200, dict(payment)
+        if path.endswith("/currencies"):
+            return 200, {"currencies": ["trx", "usdttrc20", "btc"]}
+        if path.endswith("/currencies/list"):
+            return 200, {"currencies": [{"code": "trx"}, {"code": "usdttrc20"}, {"code": "btc"}]}
+        return 404, {"message": "Not found"}
+
+
+class NowPaymentsSimulator(SimulatorServer):
+    """NowPayments API simulator with optional IPN delivery"""
+
+    handler_class = _NowPaymentsHandler
+
+    def __init__(self, faults=None, host="127.0.0.1", port=0, ipn_url=None, ipn_secret=None,
+                 progression=DEFAULT_PROGRESSION, time_scale=1.0):
+        super().__init__(faults, host, port)
+        self.ipn_url = ipn_url
+        self.ipn_secret = ipn_secret
+        self.progression = progression
+        self.time_scale = time_scale
+        self.payments = {}
+        self.ipn_sent = 0
+        self.ipn_failed = 0
+        self._payment_ids = itertools.count(5000000000)
+
+    def api_url(self):
+        """Value for NOWPAYMENTS_API_URL"""
+        return self.base_url + "/v1"
+
+    def create_payment(self, params):
+        payment = {
+            "payment_id": str(next(self._payment_ids)),
+            "payment_status": "waiting",
+            "pay_address": "TSimulatedAddress000000000000000000",
+            "price_amount": params.get("price_amount"),
+            "price_currency": params.get("price_currency", "usd"),
+            "pay_amount": 42.5,
+            "actually_paid": 0,
+            "pay_currency": params.get("pay_currency", "trx"),
+            "order_id": params.get("order_id"),
+            "order_description": params.get("order_description"),
+            "created_at": _timestamp(),
+            "updated_at": _timestamp(),
+        }
+        with self._lock:
+            self.payments[payment["payment_id"]] = payment
+
+        ipn_url = params.get("ipn_callback_url") or self.ipn_url
+        if ipn_url and self.ipn_secret and self.progression:
+            threading.Thread(
+                target=self._advance,
+                args=(payment["payment_id"], ipn_url),
+                name="ipn-sender",
+                daemon=True,
+            ).start()
+        return dict(payment)
+
+    def _advance(self, payment_id, ipn_url):
+        session = requests.Session()
+        for status, delay in self.progression:
+            time.sleep(delay * self.time_scale)
+            with self._lock:
+                payment = self.payments[payment_id]
+                payment["payment_status"] = status
+                payment["updated_at"] = _timestamp()
+                if status == "finished":
+                    payment["actually_paid"] = payment["pay_amount"]
+                body = dict(payment)
+            self.send_ipn(body, ipn_url, session)
+
+    def sign(self, payload):
+        """Body and x-nowpayments-sig header for an IPN payload"""
+        body = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        signature = hmac.new(self.ipn_secret.encode("utf-8"), body, hashlib.sha512).hexdigest()
+        return body, signature
+
+    def send_ipn(self, payload, ipn_url=None, session=None):
+        """POST a signed IPN; returns the HTTP status or None if the request failed"""
+        body, signature = self.sign(payload)
+        try:
+            response = (session or requests).post(
+                ipn_url or self.ipn_url,
+                data=body,
+                headers={"Content-Type": "application/json", "x-nowpayments-sig": signature},
+                timeout=10,
+            )
+        except requests.RequestException as e:
+            logger.warning("IPN delivery for %s failed: %s", payload.get("payment_id"), e)
+            with self._lock:
+                self.ipn_failed += 1
+            return None
+        with self._lock:
+            self.ipn_sent += 1
+        return response.status_code
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update(payments=len(self.payments), ipn_sent=self.ipn_sent, ipn_failed=self.ipn_failed)
+        return stats
+
+
+def _timestamp():
+    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
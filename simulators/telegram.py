@@ -0,0 +1,178 @@
+"""
+Telegram Bot API simulator.
+
+Every method succeeds unless a fault is injected; sendMessage and
+editMessageText echo a well-formed Message back. Besides the global rate
+limit from Faults, a per-chat limit (Telegram allows about one message per
+second per chat) answers 429 with retry_after the way the real API does.
+
+Updates queued with push_update() are served by getUpdates with long
+polling and offset confirmation; a getUpdates made while another one is
+waiting gets 409 Conflict, like a second bot instance polling the same token.
+"""
+
+import itertools
+import json
+import threading
+import time
+
+from simulators.base import JsonRequestHandler, SimulatorServer, TokenBucket
+
+BOT_USER = {"id": 999000, "is_bot": True, "first_name": "Simulated Bot", "username": "simulated_bot"}
+
+# Methods that count against the per-chat message limit
+MESSAGE_METHODS = {"sendMessage", "editMessageText", "sendPhoto", "sendDocument", "forwardMessage", "copyMessage"}
+
+
+class _TelegramHandler(JsonRequestHandler):
+    def respond(self, path, params):
+        method = path.rsplit("/", 1)[-1]
+        simulator = self.simulator
+        simulator.record(method, params)
+
+        if method in MESSAGE_METHODS:
+            return 200, {"ok": True, "result": simulator.message(params)}
+        if method == "getMe":
+            return 200, {"ok": True, "result": BOT_USER}
+        if method == "getChatMember":
+            user = {"id": int(params.get("user_id", 0)), "is_bot": False, "first_name": "Member"}
+            return 200, {"ok": True, "result": {"status": simulator.member_status, "user": user}}
+        if method == "getWebhookInfo":
+            return 200, {"ok": True, "result": {"url": "", "has_custom_certificate": False, "pending_update_count": 0}}
+        if method == "getUpdates":
+            updates = simulator.get_updates(params)
+            if updates is None:
+                return 409, {"ok": False, "error_code": 409,
+                             "description": "Conflict: terminated by other getUpdates request; "
+                                            "make sure that only one bot instance is running"}
+            return 200, {"ok": True, "result": updates}
+        return 200, {"ok": True, "result": True}
+
+
+class TelegramSimulator(SimulatorServer):
+    """
+    Bot API simulator.
+
+    The reply markup of the last message sent to each chat is kept so a driver
+    can "press" the buttons the bot actually offered.
+    """
+
+    handler_class = _TelegramHandler
+
+    def __init__(self, faults=None, host="127.0.0.1", port=0, chat_rate_limit=0.0, member_status="member"):
+        super().__init__(faults, host, port)
+        self.chat_rate_limit = chat_rate_limit
+        self.member_status = member_status
+        self.calls = {}
+        self.last_markup = {}
+        self._chat_buckets = {}
+        self._message_ids = itertools.count(1000)
+        self._chat_lock = threading.Lock()
+        self.conflicts = 0
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._polling = False
+        self._updates_changed = threading.Condition()
+
+    def api_url(self):
+        """Value for TELEGRAM_API_URL / telebot.apihelper.API_URL"""
+        return self.base_url + "/bot{0}/{1}"
+
+    def inject_fault(self, path, params):
+        reply = super().inject_fault(path, params)
+        if reply is not None or not self.chat_rate_limit:
+            return reply
+        if path.rsplit("/", 1)[-1] not in MESSAGE_METHODS or "chat_id" not in params:
+            return None
+
+        chat_id = str(params["chat_id"])
+        with self._chat_lock:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate_limit)
+        retry_after = bucket.take()
+        if retry_after:
+            with self._lock:
+                self.rate_limited += 1
+            return self.rate_limited_reply(retry_after, path, params)
+        return None
+
+    def rate_limited_reply(self, retry_after, path, params):
+        seconds = max(1, int(retry_after + 0.999))
+        return 429, {
+            "ok": False,
+            "error_code": 429,
+            "description": f"Too Many Requests: retry after {seconds}",
+            "parameters": {"retry_after": seconds},
+        }
+
+    def error_reply(self, path, params):
+        return 500, {"ok": False, "error_code": 500, "description": "Internal Server Error"}
+
+    def record(self, method, params):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            markup = params.get("reply_markup")
+            if markup and "chat_id" in params:
+                self.last_markup[str(params["chat_id"])] = markup
+
+    def push_update(self, update):
+        """Queue an update for getUpdates; returns its update_id (assigned if missing)"""
+        update = dict(update)
+        with self._updates_changed:
+            update.setdefault("update_id", next(self._update_ids))
+            self._updates.append(update)
+            self._updates_changed.notify_all()
+        return update["update_id"]
+
+    def pending_updates(self):
+        with self._updates_changed:
+            return len(self._updates)
+
+    def get_updates(self, params):
+        """Updates from offset on, waiting up to timeout for one; None while another getUpdates is waiting"""
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        deadline = time.monotonic() + min(float(params.get("timeout") or 0), 50)
+        with self._updates_changed:
+            if self._polling:
+                self.conflicts += 1
+                return None
+            self._polling = True
+            try:
+                # Asking from an offset confirms everything before it
+                self._updates = [u for u in self._updates if u["update_id"] >= offset]
+                while not self._updates and time.monotonic() < deadline:
+                    self._updates_changed.wait(deadline - time.monotonic())
+                return self._updates[:limit]
+            finally:
+                self._polling = False
+
+    def message(self, params):
+        chat_id = params.get("chat_id", 0)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        message_id = params.get("message_id")
+        return {
+            "message_id": int(message_id) if message_id else next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+
+    def callback_data(self, chat_id, prefix):
+        """Callback data of the first button starting with prefix in the chat's last markup"""
+        markup = self.last_markup.get(str(chat_id))
+        if not markup:
+            return None
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        for row in markup.get("inline_keyboard", []):
+            for button in row:
+                data = button.get("callback_data", "")
+                if data.startswith(prefix):
+                    return data
+        return None
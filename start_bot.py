@@ -8,25 +8,39 @@ import logging
 import sys
 import os
 import time
+import signal
 
-# Configure basic logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+import logging_config
+import bot_cluster
+
+# Configure the queued logging pipeline before anything else logs
+logging_config.setup_logging(bot_cluster.log_name('bot'))
 
 logger = logging.getLogger("start_bot")
 
+# Time allowed for in-flight updates to finish after a stop request
+DRAIN_TIMEOUT = float(os.environ.get("BOT_DRAIN_TIMEOUT", 25))
+
+def _request_stop(signum, frame):
+    """SIGTERM (supervisor stop, docker stop) ends polling the same way Ctrl+C does"""
+    raise KeyboardInterrupt
+
 def main():
     """Main function to start the bot"""
     logger.info("Starting Telegram bot in polling mode")
     
     try:
         # Import the bot module and start polling
-        from run_telegram_bot import start_polling, bot, config_manager
+        from run_telegram_bot import init_bot_process, start_polling, bot, config_manager
+        init_bot_process()
+        
+        # Refuse to start against a database that migrate.py hasn't brought up to date
+        import database
+        try:
+            database.check_schema()
+        except RuntimeError as e:
+            logger.error(str(e))
+            return 1
         
         # Check if bot token exists
         bot_token = config_manager.get_config_value("bot_token") or os.environ.get("TELEGRAM_BOT_TOKEN")
@@ -45,9 +59,42 @@ def main():
             logger.error(f"Failed to connect to Telegram API: {e}")
             return 1
             
+        # Expose /metrics for this process (METRICS_PORT=0 disables it)
+        try:
+            import metrics
+            metrics.start_http_server()
+        except OSError as e:
+            logger.warning(f"Metrics server not started: {e}")
+        
+        # Profiling sessions requested from the admin panel
+        import profiler
+        profiler.watch_config_requests('bot')
+        
+        # Heartbeat for bot_supervisor.py
+        import bot_supervisor
+        bot_supervisor.start_heartbeat(bot.health)
+        
+        # With BOT_CLUSTER=1 several replicas share the work; one of them polls (see bot_cluster.py)
+        cluster = bot_cluster.BotCluster(bot) if bot_cluster.enabled() else None
+        
         # Start the bot
+        signal.signal(signal.SIGTERM, _request_stop)
         logger.info("Starting bot polling...")
-        start_polling()
+        try:
+            if cluster:
+                cluster.run()
+            else:
+                start_polling()
+        except KeyboardInterrupt:
+            logger.info("Bot stop requested")
+        
+        # Let handlers that are already running finish before exiting
+        if cluster:
+            cluster.stop(DRAIN_TIMEOUT)
+        bot.stop_polling()
+        if not bot.drain(DRAIN_TIMEOUT):
+            logger.warning("Stopping with %s updates still in progress", bot.health()["pending"])
+        logger.info("Bot stopped")
         
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
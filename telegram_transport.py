@@ -0,0 +1,126 @@
+"""
+HTTP transport for Bot API calls, installed as telebot's CUSTOM_REQUEST_SENDER.
+
+telebot's default is a session per thread with 15 s connect / 30 s read
+timeouts and no retries. With the worker, ack, sender and cluster threads
+that is a dozen separate keep-alive connections, and a send stuck on a dead
+connection holds its thread for half a minute. Instead:
+
+- one keep-alive pool for getUpdates and one for everything else, each
+  TELEGRAM_POOL_SIZE connections, shared by all threads;
+- timeouts by kind of call: getUpdates keeps the long-poll read timeout
+  telebot computes, uploads get TELEGRAM_UPLOAD_TIMEOUT, other calls
+  TELEGRAM_CONNECT_TIMEOUT / TELEGRAM_READ_TIMEOUT;
+- retries with jittered exponential backoff on connection errors, timeouts
+  and 5xx, for calls that are safe to repeat. Other calls are only retried
+  when the connection was never made, so a message is never sent twice;
+- per-method HTTP latency and retry metrics.
+
+429 is left to the send scheduler (send_scheduler.py), and the polling loops
+already retry getUpdates, so neither is retried here.
+"""
+
+import os
+import time
+import random
+import logging
+
+import requests
+import telebot
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+CONNECT_TIMEOUT = _env_float("TELEGRAM_CONNECT_TIMEOUT", 5)
+READ_TIMEOUT = _env_float("TELEGRAM_READ_TIMEOUT", 15)
+UPLOAD_TIMEOUT = _env_float("TELEGRAM_UPLOAD_TIMEOUT", 60)
+# Connections kept alive per pool; extra ones are opened when every thread sends at once, then closed
+POOL_SIZE = int(_env_float("TELEGRAM_POOL_SIZE", 16))
+MAX_RETRIES = int(_env_float("TELEGRAM_RETRIES", 2))
+RETRY_BASE, RETRY_CAP = 0.25, 2.0
+
+# Calls that can be repeated without a visible effect
+IDEMPOTENT_METHODS = frozenset((
+    "getMe", "getChat", "getChatMember", "getChatAdministrators", "getChatMemberCount", "getFile",
+    "getWebhookInfo", "setWebhook", "deleteWebhook", "getMyCommands", "setMyCommands",
+))
+RETRY_STATUSES = frozenset((500, 502, 503, 504))
+
+
+def _session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _not_sent(error):
+    """True if the request failed before a connection was made, so Telegram never saw it"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+def _backoff(attempt):
+    # Full jitter, so threads that failed together don't retry together
+    return random.uniform(0, min(RETRY_CAP, RETRY_BASE * 2 ** attempt))
+
+
+class TelegramTransport:
+    """Pooled sessions and the retry policy; request() has the CUSTOM_REQUEST_SENDER signature"""
+
+    def __init__(self):
+        self._polling = _session()
+        self._calls = _session()
+
+    def timeouts(self, api_method, timeout, files):
+        """(connect, read) timeouts for a call; `timeout` is what telebot worked out"""
+        if api_method == "getUpdates":
+            return CONNECT_TIMEOUT, timeout[1]
+        if files:
+            return CONNECT_TIMEOUT, UPLOAD_TIMEOUT
+        return CONNECT_TIMEOUT, READ_TIMEOUT
+
+    def request(self, method, url, params=None, files=None, timeout=None, proxies=None):
+        api_method = url.rsplit("/", 1)[-1]
+        session = self._polling if api_method == "getUpdates" else self._calls
+        timeout = self.timeouts(api_method, timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), files)
+        # A file stream can't be rewound for a second attempt
+        retries = 0 if files or api_method == "getUpdates" else MAX_RETRIES
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, params=params, files=files, timeout=timeout, proxies=proxies)
+            except requests.exceptions.RequestException as e:
+                metrics.TELEGRAM_HTTP_LATENCY.labels(api_method, "error").observe(time.perf_counter() - start)
+                if attempt >= retries or not (api_method in IDEMPOTENT_METHODS or _not_sent(e)):
+                    raise
+                reason = "timeout" if isinstance(e, requests.exceptions.Timeout) else "connection"
+            else:
+                metrics.TELEGRAM_HTTP_LATENCY.labels(api_method, str(response.status_code)).observe(time.perf_counter() - start)
+                if response.status_code not in RETRY_STATUSES or attempt >= retries or api_method not in IDEMPOTENT_METHODS:
+                    return response
+                reason = str(response.status_code)
+
+            metrics.TELEGRAM_HTTP_RETRIES.labels(api_method, reason).inc()
+            delay = _backoff(attempt)
+            logger.warning("Telegram %s failed (%s), retrying in %.2fs", api_method, reason, delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+def install():
+    """Route telebot's Bot API requests through a TelegramTransport"""
+    transport = TelegramTransport()
+    telebot.apihelper.CUSTOM_REQUEST_SENDER = transport.request
+    return transport
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine
+
+import bot_cluster
+from database import db
+
+
+def message_update(update_id, chat_id):
+    return {"update_id": update_id, "message": {"message_id": update_id, "chat": {"id": chat_id, "type": "private"},
+                                                "from": {"id": chat_id}, "text": "hi"}}
+
+
+class UpdateQueueOrderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmp, 'queue.db')}")
+        db.metadata.create_all(self.engine, tables=[db.metadata.tables["update_queue"]])
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.tmp)
+
+    def test_same_chat_updates_are_claimed_one_at_a_time(self):
+        bot_cluster.enqueue(self.engine, [message_update(1, 100), message_update(2, 100), message_update(3, 200)])
+
+        first = bot_cluster.claim(self.engine, "replica-a:1:0")
+        self.assertEqual([row.update_id for row in first], [1, 3])
+        # The chat's second update waits while the first is being handled by another consumer
+        self.assertEqual(bot_cluster.claim(self.engine, "replica-b:1:0"), [])
+
+        bot_cluster.complete(self.engine, 1)
+        second = bot_cluster.claim(self.engine, "replica-b:1:0")
+        self.assertEqual([row.update_id for row in second], [2])
+
+    def test_updates_without_a_chat_are_not_held_back(self):
+        bot_cluster.enqueue(self.engine, [{"update_id": 1, "poll": {"id": "a"}}, {"update_id": 2, "poll": {"id": "b"}}])
+        self.assertEqual([row.update_id for row in bot_cluster.claim(self.engine, "replica-a:1:0")], [1, 2])
+
+    def test_chat_id_of_callback_query(self):
+        update = {"update_id": 1, "callback_query": {"id": "q", "from": {"id": 7},
+                                                     "message": {"message_id": 3, "chat": {"id": -100}}}}
+        self.assertEqual(bot_cluster.update_chat_id(update), -100)
+
+
+if __name__ == "__main__":
+    unittest.main()
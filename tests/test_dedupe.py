@@ -0,0 +1,31 @@
+import unittest
+import tracemalloc
+
+from dedupe import UpdateIdWindow
+
+
+class UpdateIdWindowTest(unittest.TestCase):
+
+    def test_duplicates_inside_window(self):
+        window = UpdateIdWindow(size=64)
+        self.assertFalse(window.check_and_add(100))
+        self.assertFalse(window.check_and_add(101))
+        self.assertTrue(window.check_and_add(100))
+        self.assertTrue(window.check_and_add(101))
+
+    def test_large_forward_jump_resets_without_allocating(self):
+        window = UpdateIdWindow()
+        window.check_and_add(1)
+        tracemalloc.start()
+        try:
+            self.assertFalse(window.check_and_add(10**12))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 1024 * 1024)
+        self.assertTrue(window.check_and_add(10**12))
+        self.assertFalse(window.check_and_add(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import json
+import hmac
+import hashlib
+import unittest
+
+from nowpayments import canonicalize_ipn_body, verify_ipn_signature
+
+SECRET = "ipn-secret"
+
+
+def sign(body):
+    return hmac.new(SECRET.encode("utf-8"), body, hashlib.sha512).hexdigest()
+
+
+class VerifyIpnSignatureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ipn_data = {
+            "payment_id": 5077125051,
+            "payment_status": "finished",
+            "pay_address": "TNDFkiSmBQorNFacb3735q8MnT29sn8BLn",
+            "price_amount": 5,
+            "price_currency": "usd",
+            "order_description": "اشتراک پریمیوم ۳ ماهه",
+        }
+        # How NowPayments signs it: sorted keys, no whitespace, UTF-8 text
+        self.canonical = json.dumps(self.ipn_data, sort_keys=True, separators=(",", ":"),
+                                    ensure_ascii=False).encode("utf-8")
+
+    def test_canonical_raw_body(self):
+        self.assertTrue(verify_ipn_signature(self.canonical, sign(self.canonical), SECRET))
+
+    def test_reformatted_body_with_non_ascii_field(self):
+        raw_body = json.dumps(self.ipn_data, indent=2).encode("utf-8")
+        self.assertEqual(canonicalize_ipn_body(self.ipn_data), self.canonical)
+        self.assertTrue(verify_ipn_signature(raw_body, sign(self.canonical), SECRET))
+
+    def test_wrong_signature(self):
+        self.assertFalse(verify_ipn_signature(self.canonical, sign(b"{}"), SECRET))
+        self.assertFalse(verify_ipn_signature(self.canonical, "", SECRET))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,285 @@
+"""
+Lightweight per-update tracing.
+
+A trace starts when a Telegram update or a payment webhook is received and
+collects timed spans for the stages it passes through (handlers, user lookup,
+SQL, Telegram and NowPayments calls). The current span lives in a context
+variable, and bind() carries it into the bot's worker threads, so a trace
+stays open until the last handler it spawned has finished. Traces slower than
+TRACE_SLOW_MS are appended as one JSON line each to TRACE_FILE.
+
+    TRACING_ENABLED   set to 0 to disable (default 1)
+    TRACE_SLOW_MS     dump threshold in milliseconds (default 2000)
+    TRACE_FILE        output file (default logs/slow_traces.jsonl)
+"""
+
+import os
+import json
+import time
+import random
+import logging
+import functools
+import threading
+import contextvars
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", 2000))
+TRACE_FILE = os.environ.get("TRACE_FILE", os.path.join("logs", "slow_traces.jsonl"))
+
+# Spans kept per trace; a runaway loop can't grow a trace without bound
+MAX_SPANS = 256
+
+_current_span = contextvars.ContextVar("premium_bot_current_span", default=None)
+_dump_lock = threading.Lock()
+
+def _new_span_id():
+    return "%016x" % random.getrandbits(64)
+
+def _new_trace_id():
+    return "%032x" % random.getrandbits(128)
+
+
+class Span:
+    """A timed stage of a trace"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "end", "attrs")
+
+    def __init__(self, trace, name, parent_id=None, attrs=None):
+        self.trace = trace
+        self.span_id = _new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = time.perf_counter()
+        self.end = None
+
+    def set(self, key, value):
+        self.attrs[key] = value
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    def to_dict(self, origin):
+        end = self.end if self.end is not None else time.perf_counter()
+        data = {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "offset_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round((end - self.start) * 1000, 3),
+        }
+        if self.end is None:
+            data["unfinished"] = True
+        if self.attrs:
+            data["attrs"] = self.attrs
+        return data
+
+
+class Trace:
+    """
+    All spans recorded for one incoming update or webhook.
+
+    The trace is reference counted: the receiving thread holds one reference
+    and every task bound to it holds another. It is finished, and dumped if
+    slow, when the last reference is released.
+    """
+
+    def __init__(self, name, trace_id=None, attrs=None):
+        self.trace_id = trace_id or _new_trace_id()
+        self.started_at = time.time()
+        self.spans = []
+        self.dropped_spans = 0
+        self._pending = 1
+        self._lock = threading.Lock()
+        self.root = self.add_span(name, None, attrs)
+
+    def add_span(self, name, parent_id, attrs=None):
+        span = Span(self, name, parent_id, attrs)
+        with self._lock:
+            if len(self.spans) < MAX_SPANS:
+                self.spans.append(span)
+            else:
+                self.dropped_spans += 1
+        return span
+
+    def acquire(self):
+        with self._lock:
+            self._pending += 1
+
+    def release(self):
+        with self._lock:
+            self._pending -= 1
+            done = self._pending == 0
+        if done:
+            self._finish()
+
+    @property
+    def duration_ms(self):
+        ends = [span.end for span in self.spans if span.end is not None]
+        end = max(ends) if ends else time.perf_counter()
+        return (end - self.root.start) * 1000
+
+    def to_dict(self):
+        origin = self.root.start
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "started_at": datetime.utcfromtimestamp(self.started_at).isoformat() + "Z",
+            "duration_ms": round(self.duration_ms, 3),
+            "attrs": self.root.attrs,
+            "dropped_spans": self.dropped_spans,
+            "spans": [span.to_dict(origin) for span in self.spans],
+        }
+
+    def _finish(self):
+        if self.duration_ms >= TRACE_SLOW_MS:
+            _dump(self)
+
+
+def _dump(trace):
+    try:
+        line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+        directory = os.path.dirname(TRACE_FILE)
+        with _dump_lock:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        logger.warning("Slow trace %s (%s) took %.0f ms", trace.trace_id, trace.root.name, trace.duration_ms)
+    except Exception:
+        logger.exception("Error writing slow trace")
+
+
+class _SpanScope:
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span):
+        self.span = span
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.span.set("error", exc_type.__name__)
+        self.span.finish()
+        _current_span.reset(self._token)
+        return False
+
+
+class _TraceScope(_SpanScope):
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        self.span.trace.release()
+        return False
+
+
+class _NoopScope:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopScope()
+
+def start_trace(name, trace_id=None, **attrs):
+    """Start a new trace in the current context; use as a context manager"""
+    if not TRACING_ENABLED:
+        return _NOOP
+    return _TraceScope(Trace(name, trace_id, attrs).root)
+
+def span(name, **attrs):
+    """Record a child span of the current one; does nothing outside a trace"""
+    parent = _current_span.get()
+    if parent is None:
+        return _NOOP
+    return _SpanScope(parent.trace.add_span(name, parent.span_id, attrs))
+
+def traced(name=None):
+    """Decorator recording each call of a function as a span"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def bind(func, name=None):
+    """
+    Wrap func so it runs inside the current trace when called from another thread.
+
+    The trace stays open until the wrapped function has run.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return func
+
+    trace = parent.trace
+    trace.acquire()
+    context = contextvars.copy_context()
+    span_name = name or getattr(func, "__name__", "task")
+
+    def run_in_span(*args, **kwargs):
+        with span(span_name):
+            return func(*args, **kwargs)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return context.run(run_in_span, *args, **kwargs)
+        finally:
+            trace.release()
+    return wrapper
+
+def current_span():
+    return _current_span.get()
+
+def current_trace_id():
+    current = _current_span.get()
+    return current.trace.trace_id if current is not None else None
+
+def record(key, amount):
+    """Accumulate a numeric attribute (e.g. SQL time) on the current span"""
+    current = _current_span.get()
+    if current is not None:
+        current.attrs[key] = round(current.attrs.get(key, 0) + amount, 3)
+
+def traceparent():
+    """W3C traceparent header value for outbound requests, or None outside a trace"""
+    current = _current_span.get()
+    if current is None:
+        return None
+    return f"00-{current.trace.trace_id}-{current.span_id}-01"
+
+def trace_id_from_headers(headers):
+    """Reuse the caller's trace id from a traceparent or X-Request-ID header"""
+    header = headers.get("traceparent")
+    if header:
+        parts = header.split("-")
+        if len(parts) >= 3 and len(parts[1]) == 32:
+            return parts[1]
+    request_id = headers.get("X-Request-ID")
+    if request_id and len(request_id) <= 64:
+        return request_id
+    return None
+
+
+class TraceIdFilter(logging.Filter):
+    """Add the current trace id to log records so logs can be joined with traces"""
+
+    def filter(self, record):
+        current = _current_span.get()
+        if current is not None:
+            record.trace_id = current.trace.trace_id
+        return True
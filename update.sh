@@ -56,13 +56,7 @@ else
 
     # میگریشن دیتابیس
     echo -e "\n${YELLOW}[4/4] به‌روزرسانی ساختار دیتابیس...${NC}"
-    python3 -c "
-    from app import app, db
-    import models
-    with app.app_context():
-        db.create_all()
-    print('ساختار دیتابیس به‌روزرسانی شد.')
-    "
+    python3 migrate.py
     
     # راه‌اندازی مجدد سرویس
     echo -e "\n${YELLOW}راه‌اندازی مجدد سرویس...${NC}"